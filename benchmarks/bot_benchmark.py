@@ -0,0 +1,348 @@
+"""
+End-to-end benchmark of the bot's event handlers and the dashboard, offline.
+
+    python benchmarks/bot_benchmark.py --rows 1000000 --duration 30 --rates message=300,edit=30,delete=30,voice=60,member_update=5
+
+A synthetic database is built at --db (see synthetic.py; rebuilt on every
+run unless --reuse is given). MyClient's handlers are then fed fake
+discord.py objects at the given rates (events per second) for --duration
+seconds, with each event handled in its own task like discord.py does. No
+Discord connection is made: the log channels are fakes whose send() returns
+at once, so building and batching embeds is measured, Discord's latency is
+not. Reported:
+
+    handlers   latency percentiles per event type and the rate achieved
+    database   rows committed per second, write batch latency
+    event loop lag while the events were handled
+    dashboard  latency of the main routes, requested in-process with
+               Flask's test client, every request missing the response cache
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))  # adds project root
+
+DEFAULT_RATES = "message=200,edit=20,delete=20,voice=40,member_update=5"
+ROUTES = [
+    "/", "/deleted-messages", "/edited-messages", "/voice-activity", "/member-activity",
+    "/search?q=hello", "/stats", "/voice-time", "/roles", "/api/v1/voice-activity",
+]
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+
+    def at(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return f"mean {statistics.mean(latencies) * 1000:7.2f}  p50 {at(0.5):7.2f}  p95 {at(0.95):7.2f}  p99 {at(0.99):7.2f}  max {latencies[-1] * 1000:7.2f}"
+
+
+class FakeGuild:
+    """
+    The parts of a guild, its members, channels and roles that the handlers use.
+    """
+
+    def __init__(self, guild_id, member_ids, text_channel_ids, voice_channel_ids, role_ids, log_channel_id):
+        self.id = guild_id
+        self.name = "Benchmark guild"
+        self.icon = None
+        self.created_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+        def channel(channel_id, name):
+            return SimpleNamespace(id=channel_id, name=name, mention=f"<#{channel_id}>", guild=self)
+
+        self.text_channels = [channel(channel_id, f"text-{i}") for i, channel_id in enumerate(text_channel_ids)]
+        self.voice_channels = [channel(channel_id, f"voice-{i}") for i, channel_id in enumerate(voice_channel_ids)]
+        self.roles = [
+            SimpleNamespace(id=role_id, guild=self, name=f"role-{i}", color=SimpleNamespace(value=0x99AAB5),
+                            permissions=SimpleNamespace(value=0), created_at=self.created_at, position=i)
+            for i, role_id in enumerate(role_ids)
+        ]
+        self.members = [
+            SimpleNamespace(id=member_id, name=f"user{i}", global_name=f"User {i}", display_name=f"User {i}",
+                            avatar=None, created_at=self.created_at, bot=False, guild=self, roles=[])
+            for i, member_id in enumerate(member_ids)
+        ]
+        self.log_channel = FakeLogChannel(log_channel_id)
+
+    def get_member(self, member_id):
+        return None
+
+
+class FakeLogChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.name = "bench-log"
+        self.messages = 0
+
+    async def send(self, embeds):
+        self.messages += 1
+
+
+class EventFactory:
+    """
+    Builds the arguments of each handler, keeping enough state (sent messages,
+    who is in voice, who has which role) for the events to make sense.
+    """
+
+    def __init__(self, guild, message_ids, seed):
+        self.guild = guild
+        self.rng = random.Random(seed)
+        self.message_ids = list(message_ids)
+        self.next_message_id = itertools.count(max(self.message_ids, default=0) + 1)
+        self.in_voice = {}
+        self.voice_states = {}
+
+    def _member(self):
+        # A few members produce most of the traffic, like on a real server
+        return self.guild.members[min(int(self.rng.paretovariate(1.2)) - 1, len(self.guild.members) - 1)]
+
+    def _message(self, message_id, content):
+        author = self._member()
+        channel = self.rng.choice(self.guild.text_channels)
+        return SimpleNamespace(
+            id=message_id, guild=self.guild, author=author, channel=channel, content=content, clean_content=content,
+            created_at=datetime.now(timezone.utc), jump_url=f"https://discord.com/channels/{self.guild.id}/{channel.id}/{message_id}"
+        )
+
+    def message(self):
+        message_id = next(self.next_message_id)
+        self.message_ids.append(message_id)
+        return (self._message(message_id, "benchmark message " + "lorem ipsum " * self.rng.randint(0, 20)),)
+
+    def edit(self):
+        message_id = self.rng.choice(self.message_ids[-5000:])
+        return self._message(message_id, "before"), self._message(message_id, "after the edit")
+
+    def delete(self):
+        # Recent messages may still be in the write queue, older ones are loaded from the database
+        message_id = self.rng.choice(self.message_ids[-5000:])
+        return (SimpleNamespace(guild_id=self.guild.id, message_id=message_id, channel_id=self.guild.text_channels[0].id, cached_message=None),)
+
+    def voice(self):
+        member = self._member()
+        channel = self.in_voice.get(member.id)
+        state = self.voice_states.get(member.id, {"mute": False, "deaf": False, "self_deaf": False, "self_mute": False, "self_video": False, "self_stream": False})
+        before = SimpleNamespace(channel=channel, **state)
+
+        roll = self.rng.random()
+        if channel is None:
+            channel = self.rng.choice(self.guild.voice_channels)
+        elif roll < 0.4:
+            channel = None
+        elif roll < 0.6:
+            channel = self.rng.choice(self.guild.voice_channels)
+        else:
+            state = {**state, "self_mute": not state["self_mute"]}
+        self.in_voice[member.id] = channel
+        self.voice_states[member.id] = state
+        return member, before, SimpleNamespace(channel=channel, **state)
+
+    def member_update(self):
+        member = self._member()
+        role = self.rng.choice(self.guild.roles)
+        after_roles = [r for r in member.roles if r.id != role.id] if role in member.roles else member.roles + [role]
+        before = SimpleNamespace(**vars(member))
+        member.roles = after_roles
+        return before, member
+
+
+async def drive(name, rate, deadline, make_event, handler, latencies, tasks):
+    """
+    Start one `handler` task every 1/`rate` seconds until `deadline`.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def timed(args):
+        start = time.perf_counter()
+        try:
+            await handler(*args)
+        except Exception as e:
+            print(f"{name} handler failed: {e!r}")
+        latencies.append(time.perf_counter() - start)
+
+    next_at = loop.time()
+    while loop.time() < deadline:
+        task = asyncio.create_task(timed(make_event()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        next_at += 1 / rate
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+
+def count_rows(engine, tables):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        return sum(connection.execute(text(f"SELECT count(*) FROM {table}")).scalar() for table in tables)
+
+
+async def run_bot(bot, guild, factory, rates, duration, log_to_discord):
+    from database.stats import TRACKED_TABLES
+
+    client = bot.MyClient(intents=bot.discord.Intents.all())
+    await client.setup_hook()
+
+    # The log channels are fakes; everything else is the bot's own code
+    if log_to_discord:
+        client.log_config.enabled = True
+        client.log_config.update({guild.id: {key: guild.log_channel.id for key in bot.CONFIG_KEYS}})
+        client.get_channel = lambda channel_id: guild.log_channel if channel_id == guild.log_channel.id else None
+
+    # Time every write batch the queue commits
+    batches = []
+    write_batch = client.writer._write_batch
+
+    def timed_write_batch(batch):
+        start = time.perf_counter()
+        write_batch(batch)
+        batches.append((len(batch), time.perf_counter() - start))
+
+    client.writer._write_batch = timed_write_batch
+
+    tables = list(TRACKED_TABLES) + ["voicesession"]
+    rows_before = count_rows(bot.engine, tables)
+    handlers = {
+        "message": client.on_message,
+        "edit": client.on_message_edit,
+        "delete": client.on_raw_message_delete,
+        "voice": client.on_voice_state_update,
+        "member_update": client.on_member_update,
+    }
+    latencies = {name: [] for name in rates}
+    tasks = set()
+
+    print(f"Sending events for {duration:.0f}s: " + ", ".join(f"{name} {rate:g}/s" for name, rate in rates.items()))
+    start = time.perf_counter()
+    deadline = asyncio.get_running_loop().time() + duration
+    await asyncio.gather(*(
+        drive(name, rate, deadline, getattr(factory, name), handlers[name], latencies[name], tasks)
+        for name, rate in rates.items()
+    ))
+    await asyncio.gather(*tasks)
+    handled_at = time.perf_counter()
+
+    loop_stats = client.loop_monitor.stats()
+    try:
+        await client.close()
+    except AttributeError:
+        pass  # Our part of close() (flushing) is done; discord.py's part needs a gateway connection
+    elapsed = time.perf_counter() - start
+    rows_written = count_rows(bot.engine, tables) - rows_before
+
+    print("\nHandlers (ms)")
+    for name, values in latencies.items():
+        if values:
+            print(f"  {name:14} {len(values) / (handled_at - start):8.1f}/s  {percentiles(values)}")
+
+    print("\nDatabase")
+    print(f"  {rows_written:,} rows committed in {elapsed:.1f}s ({elapsed - (handled_at - start):.1f}s of it flushing on close): {rows_written / elapsed:,.0f} rows/s")
+    if batches:
+        print(f"  {len(batches)} write batches of {statistics.mean(size for size, _ in batches):.0f} operations on average")
+        print(f"  batch latency (ms)  {percentiles([seconds for _, seconds in batches])}")
+    print(f"  pool busy {client.db.busy_seconds:.2f}s over {client.db.calls} calls")
+
+    print("\nEvent loop")
+    print(f"  blocked {loop_stats['blocked_seconds']:.3f}s in total, max lag {loop_stats['max_lag_seconds'] * 1000:.1f}ms over {loop_stats['samples']} samples")
+    if log_to_discord:
+        print(f"  {client.dispatcher.sent_embeds} log embeds sent in {client.dispatcher.sent_messages} messages, {client.dispatcher.dropped_embeds} dropped")
+
+
+def run_dashboard(requests_per_route):
+    sys.path.append(str(ROOT / "web-dashboard"))
+    from app import app
+
+    test_client = app.test_client()
+    print(f"\nDashboard ({requests_per_route} requests per route, ms)")
+    for route in ROUTES:
+        latencies, errors = [], 0
+        for i in range(requests_per_route):
+            start = time.perf_counter()
+            response = test_client.get(route + ("&" if "?" in route else "?") + f"nocache={i}")
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+        print(f"  {route:26} {percentiles(latencies)}" + (f"  {errors} errors" if errors else ""))
+
+
+def parse_rates(text):
+    rates = {}
+    for part in text.split(","):
+        name, _, rate = part.partition("=")
+        if name not in ("message", "edit", "delete", "voice", "member_update"):
+            raise argparse.ArgumentTypeError(f"Unknown event type {name!r}")
+        if float(rate) > 0:
+            rates[name] = float(rate)
+    return rates
+
+
+def main(args):
+    # The bot and the dashboard read their settings from the environment (.env
+    # doesn't override these): keep them away from a real bot's files and ports
+    os.environ["DATABASE_URL"] = args.db
+    os.environ["ARCHIVE_DIR"] = os.path.join(tempfile.gettempdir(), "discord-logger-e2e-archive")
+    os.environ["BOT_HEARTBEAT_FILE"] = os.path.join(tempfile.gettempdir(), "discord-logger-e2e-heartbeat")
+    os.environ["LIVE_NOTIFY_PORT"] = "0"
+    os.environ["BOT_METRICS_PORT"] = "0"
+    # Log channels are set up by run_bot() instead of being loaded from the database
+    os.environ["LOG_TO_DISCORD"] = "false"
+    sys.path.append(str(ROOT / "discord-bot"))
+    os.chdir(ROOT)
+
+    from sqlalchemy import inspect
+    from sqlmodel import Session, select
+    from database.db import engine
+    from database.schema import Channel, Guild, Member, Message, Role
+    import synthetic
+
+    path = args.db.split("///")[-1]
+    if not args.reuse and args.db.startswith("sqlite") and os.path.exists(path):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    if not inspect(engine).has_table("message") or count_rows(engine, ["message"]) == 0:
+        synthetic.fill_database(engine, args.rows, args.days, args.seed)
+
+    import main as bot
+
+    with Session(engine) as session:
+        guild_id = session.exec(select(Guild.id)).first()
+        guild = FakeGuild(
+            guild_id,
+            session.exec(select(Member.id).order_by(Member.id).limit(2000)).all(),
+            session.exec(select(Channel.id).where(Channel.guild_id == guild_id, Channel.ch_type == "text").limit(50)).all(),
+            session.exec(select(Channel.id).where(Channel.guild_id == guild_id, Channel.ch_type == "voice").limit(20)).all(),
+            session.exec(select(Role.id).where(Role.guild_id == guild_id).limit(50)).all(),
+            log_channel_id=1,
+        )
+        message_ids = reversed(session.exec(select(Message.id).order_by(Message.id.desc()).limit(5000)).all())
+    factory = EventFactory(guild, message_ids, args.seed)
+
+    asyncio.run(run_bot(bot, guild, factory, args.rates, args.duration, not args.no_log_channels))
+    if args.route_requests:
+        run_dashboard(args.route_requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="sqlite:////tmp/discord-logger-e2e.db", help="Database URL (rebuilt unless --reuse)")
+    parser.add_argument("--reuse", action="store_true", help="Use the database as it is if it already has data")
+    parser.add_argument("--rows", type=int, default=200_000, help="Messages in the synthetic database")
+    parser.add_argument("--days", type=int, default=90, help="Days of synthetic history")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--rates", type=parse_rates, default=parse_rates(DEFAULT_RATES), help=f"Events per second per type (default: {DEFAULT_RATES})")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to send events for")
+    parser.add_argument("--no-log-channels", action="store_true", help="Don't build log embeds (LOG_TO_DISCORD=false)")
+    parser.add_argument("--route-requests", type=int, default=20, help="Requests per dashboard route (0 to skip the dashboard)")
+    main(parser.parse_args())
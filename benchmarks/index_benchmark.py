@@ -0,0 +1,134 @@
+"""
+Times the dashboard's hot queries on a synthetic database, first without the
+secondary indexes and then after database/migrations.py has added them.
+
+    python benchmarks/index_benchmark.py --rows 2000000
+
+The database is written to --db (default: /tmp/discord-logger-bench.db) and
+rebuilt on every run.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import func, text
+from sqlmodel import SQLModel, Session, select
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # adds project root
+
+from database.db import create_db_engine
+from database.schema import *
+from database.migrations import create_missing_indexes
+from synthetic import populate
+
+
+def dashboard_queries(ids):
+    member_id = ids["member_ids"][10]
+    channel_id = ids["channel_ids"][3]
+    role_id = ids["role_ids"][7]
+    week_ago = datetime.utcnow() - timedelta(days=7)
+
+    return {
+        "deleted messages, newest page": lambda session: session.exec(
+            select(DeletedMessage, Message, Member, Channel)
+            .join(Message, DeletedMessage.message_id == Message.id)
+            .join(Member, Message.member_id == Member.id)
+            .join(Channel, Message.channel_id == Channel.id)
+            .order_by(DeletedMessage.deleted_at.desc()).limit(50)
+        ).all(),
+        "edited messages, newest page": lambda session: session.exec(
+            select(EditedMessage, Message, Member, Channel)
+            .join(Message, EditedMessage.message_id == Message.id)
+            .join(Member, Message.member_id == Member.id)
+            .join(Channel, Message.channel_id == Channel.id)
+            .order_by(EditedMessage.edited_at.desc()).limit(50)
+        ).all(),
+        "voice activity, newest page": lambda session: session.exec(
+            select(VoiceActivity, Member).join(Member, VoiceActivity.member_id == Member.id)
+            .order_by(VoiceActivity.timestamp.desc()).limit(50)
+        ).all(),
+        "voice timeline of one member": lambda session: session.exec(
+            select(VoiceActivity).where(VoiceActivity.member_id == member_id)
+            .order_by(VoiceActivity.timestamp.desc()).limit(50)
+        ).all(),
+        "role changes of one member": lambda session: session.exec(
+            select(MemberActivity).where(MemberActivity.member_id == member_id)
+            .order_by(MemberActivity.timestamp.desc()).limit(50)
+        ).all(),
+        "members given one role": lambda session: session.exec(
+            select(MemberActivity.member_id).where(MemberActivity.role_id == role_id)
+        ).all(),
+        "channel messages, last 7 days": lambda session: session.exec(
+            select(func.count()).select_from(Message)
+            .where(Message.channel_id == channel_id, Message.created_at >= week_ago)
+        ).one(),
+        "latest event per table": lambda session: [
+            session.exec(select(func.max(column))).one()
+            for column in (DeletedMessage.deleted_at, EditedMessage.edited_at, VoiceActivity.timestamp,
+                           GuildActivity.timestamp, MemberActivity.timestamp)
+        ],
+        "deletions of one message": lambda session: session.exec(
+            select(DeletedMessage).where(DeletedMessage.message_id == ids["deleted_message_id"])
+        ).all(),
+    }
+
+
+def time_queries(engine, queries, repeat):
+    results = {}
+    with Session(engine) as session:
+        for name, query in queries.items():
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query(session)
+                durations.append(time.perf_counter() - start)
+            results[name] = statistics.median(durations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="number of messages to generate")
+    parser.add_argument("--db", default="/tmp/discord-logger-bench.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for path in (args.db, f"{args.db}-wal", f"{args.db}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    engine = create_db_engine(f"sqlite:///{args.db}")
+
+    # Start from the pre-index schema: tables only
+    SQLModel.metadata.create_all(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.drop(bind=engine)
+
+    ids = populate(engine, args.rows)
+    with Session(engine) as session:
+        ids["deleted_message_id"] = session.exec(select(DeletedMessage.message_id).limit(1)).one()
+    queries = dashboard_queries(ids)
+
+    print("\nTiming queries without indexes...")
+    before = time_queries(engine, queries, args.repeat)
+
+    print("Adding indexes...")
+    create_missing_indexes(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    print("Timing queries with indexes...")
+    after = time_queries(engine, queries, args.repeat)
+
+    print(f"\n{'query':<32} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>9}")
+    for name in queries:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<32} {before[name] * 1000:>12.2f} {after[name] * 1000:>12.2f} {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measures requests/sec and latency of a running dashboard on its log pages.
+
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --concurrency 16 --duration 20
+
+Every client thread keeps one HTTP connection open and requests the pages
+round-robin, following a few "Older" links so deep pages are hit as well.
+--bust-cache adds a unique query argument to every request, which measures
+the queries and rendering rather than the response cache.
+"""
+import argparse
+import http.client
+import itertools
+import re
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+PAGES = ["/deleted-messages", "/edited-messages", "/voice-activity", "/member-activity", "/", "/api/v1/voice-activity"]
+OLDER_LINK = re.compile(rb'href="([^"]*before=[^"]*)"')
+
+
+def client(base, paths, deadline, bust_cache, results, counter):
+    url = urlsplit(base)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    latencies, errors = [], 0
+    follow, depth = None, 0
+
+    for path in itertools.cycle(paths):
+        if time.perf_counter() >= deadline:
+            break
+        path = follow or path
+        if bust_cache:
+            path += ("&" if "?" in path else "?") + f"nocache={next(counter)}"
+
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            follow, depth = None, 0
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors += 1
+
+        # Walk up to three pages deep before going back to the first pages
+        match = OLDER_LINK.search(body) if depth < 3 else None
+        if match:
+            follow, depth = match.group(1).decode().replace("&amp;", "&"), depth + 1
+        else:
+            follow, depth = None, 0
+
+    connection.close()
+    results.append((latencies, errors))
+
+
+def run(base, concurrency, duration, bust_cache):
+    results = []
+    counter = itertools.count()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(base, PAGES[i % len(PAGES):] + PAGES[:i % len(PAGES)], deadline, bust_cache, results, counter))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+    errors = sum(thread_errors for _, thread_errors in results)
+    if not latencies:
+        print("No request succeeded; is the dashboard running?")
+        return
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"{len(latencies)} requests in {elapsed:.1f}s with {concurrency} clients, {errors} errors")
+    print(f"{len(latencies) / elapsed:.1f} requests/sec")
+    print(f"latency ms: mean {statistics.mean(latencies) * 1000:.1f}  p50 {percentile(0.5):.1f}  p95 {percentile(0.95):.1f}  p99 {percentile(0.99):.1f}  max {latencies[-1] * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base URL of the dashboard")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--bust-cache", action="store_true", help="Make every request miss the response cache")
+    args = parser.parse_args()
+    run(args.url.rstrip("/"), args.concurrency, args.duration, args.bust_cache)
@@ -0,0 +1,189 @@
+"""
+Fills a database with synthetic but realistically shaped log data.
+
+Row counts are derived from a single `rows` figure (the size of the Message
+table); the other tables are scaled down from it the way they are on a real
+server. Run as a script, it fills an empty database (by default the bot's
+own, database/database.db) and brings it up to date with the migrations, so
+counters, rollups and voice sessions exist as they would in production:
+
+    python benchmarks/synthetic.py --rows 5000000 --days 365
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, select
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # adds project root
+
+from database.db import DATABASE_URL, create_db_engine
+from database.migrations import migrate
+from database.schema import *
+
+VOICE_ACTIONS = ["voice_join", "voice_leave", "voice_move", "voice_self_mute", "voice_self_unmute", "video_start", "video_stop"]
+GUILD_ID = 500_000_000_000_000_000
+WORDS = "the a lol ok yes no maybe discord server voice play game tonight gg brb afk hello thanks why what".split()
+
+
+def table_sizes(rows):
+    return {
+        "member": max(100, rows // 400),
+        "channel": 100,
+        "role": 50,
+        "memberrole": max(100, rows // 400) * 3,
+        "message": rows,
+        "deletedmessage": rows // 10,
+        "editedmessage": rows // 10,
+        "voiceactivity": rows // 2,
+        "guildactivity": rows // 50,
+        "memberactivity": rows // 20,
+    }
+
+
+def _timestamps(count, days, rng):
+    # Sorted, so ids and timestamps grow together like they do in production
+    start = datetime.utcnow() - timedelta(days=days)
+    span = days * 86400
+    return sorted(start + timedelta(seconds=rng.random() * span) for _ in range(count))
+
+
+def _insert(engine, table, rows_iter, chunk_size):
+    with engine.begin() as connection:
+        chunk = []
+        for row in rows_iter:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                connection.execute(insert(table), chunk)
+                chunk = []
+        if chunk:
+            connection.execute(insert(table), chunk)
+
+
+def populate(engine, rows=1_000_000, days=365, seed=1, chunk_size=20_000, guild_id=GUILD_ID):
+    """
+    Insert synthetic members, channels, roles, messages and activity rows,
+    all in one guild. Expects the tables to exist and be empty.
+    """
+    rng = random.Random(seed)
+    sizes = table_sizes(rows)
+    member_ids = [100_000_000_000_000_000 + i for i in range(sizes["member"])]
+    channel_ids = [200_000_000_000_000_000 + i for i in range(sizes["channel"])]
+    role_ids = [300_000_000_000_000_000 + i for i in range(sizes["role"])]
+    message_ids = [400_000_000_000_000_000 + i for i in range(sizes["message"])]
+    # A few members and channels produce most of the traffic
+    member_weights = list(accumulate(1 / (i + 1) for i in range(len(member_ids))))
+    channel_weights = list(accumulate(1 / (i + 1) for i in range(len(channel_ids))))
+
+    def timed(label, table, rows_iter):
+        start = time.perf_counter()
+        _insert(engine, table, rows_iter, chunk_size)
+        print(f"  {label}: {sizes[table.name]:,} rows in {time.perf_counter() - start:.1f}s")
+
+    print(f"Generating synthetic data ({rows:,} messages over {days} days)...")
+    created = datetime.utcnow() - timedelta(days=days * 2)
+    with engine.begin() as connection:
+        connection.execute(insert(Guild.__table__), [{"id": guild_id, "name": "Synthetic guild", "created_at": created}])
+    timed("members", Member.__table__, (
+        {"id": member_id, "name": f"user{i}", "global_name": f"User {i}", "avatar_url": "None",
+         "created_at": created}
+        for i, member_id in enumerate(member_ids)
+    ))
+    timed("channels", Channel.__table__, (
+        {"id": channel_id, "guild_id": guild_id, "name": f"channel-{i}", "ch_type": "voice" if i % 5 == 0 else "text"}
+        for i, channel_id in enumerate(channel_ids)
+    ))
+    timed("roles", Role.__table__, (
+        {"id": role_id, "guild_id": guild_id, "name": f"role-{i}", "color": "#99aab5", "permissions": 0, "created_at": created}
+        for i, role_id in enumerate(role_ids)
+    ))
+    timed("role memberships", MemberRole.__table__, (
+        {"member_id": member_id, "role_id": role_id, "guild_id": guild_id}
+        for member_id in member_ids
+        for role_id in rng.sample(role_ids, 3)
+    ))
+
+    message_times = _timestamps(sizes["message"], days, rng)
+    message_members = rng.choices(member_ids, cum_weights=member_weights, k=sizes["message"])
+    message_channels = rng.choices(channel_ids, cum_weights=channel_weights, k=sizes["message"])
+    timed("messages", Message.__table__, (
+        {"id": message_id, "guild_id": guild_id, "member_id": message_members[i], "channel_id": message_channels[i],
+         "content": " ".join(rng.choices(WORDS, k=rng.randint(1, 12))), "created_at": message_times[i], "is_edited": False}
+        for i, message_id in enumerate(message_ids)
+    ))
+
+    def message_events(count):
+        picks = sorted(rng.sample(range(len(message_ids)), count))
+        return [(message_ids[i], message_times[i] + timedelta(minutes=rng.randint(1, 600))) for i in picks]
+
+    timed("deleted messages", DeletedMessage.__table__, (
+        {"guild_id": guild_id, "message_id": message_id, "deleted_at": at}
+        for message_id, at in message_events(sizes["deletedmessage"])
+    ))
+    timed("edited messages", EditedMessage.__table__, (
+        {"guild_id": guild_id, "message_id": message_id, "content_before": "before", "content_after": "after", "edited_at": at}
+        for message_id, at in message_events(sizes["editedmessage"])
+    ))
+
+    voice_channels = channel_ids[::5]
+
+    def voice_rows():
+        for at in _timestamps(sizes["voiceactivity"], days, rng):
+            action = rng.choice(VOICE_ACTIONS)
+            yield {
+                "guild_id": guild_id,
+                "member_id": rng.choices(member_ids, cum_weights=member_weights)[0],
+                "action": action,
+                "from_channel_id": rng.choice(voice_channels) if action in ("voice_leave", "voice_move") else None,
+                "to_channel_id": rng.choice(voice_channels) if action in ("voice_join", "voice_move") else None,
+                "timestamp": at,
+                "details": None,
+            }
+
+    timed("voice activity", VoiceActivity.__table__, voice_rows())
+    timed("guild activity", GuildActivity.__table__, (
+        {"guild_id": guild_id, "action": rng.choice(["Join", "leave/kick"]), "member_id": rng.choice(member_ids), "timestamp": at}
+        for at in _timestamps(sizes["guildactivity"], days, rng)
+    ))
+    timed("member activity", MemberActivity.__table__, (
+        {"guild_id": guild_id, "action": rng.choice(["Role Added", "Role Removed"]), "member_id": rng.choice(member_ids),
+         "role_id": rng.choice(role_ids), "timestamp": at}
+        for at in _timestamps(sizes["memberactivity"], days, rng)
+    ))
+    return {"member_ids": member_ids, "channel_ids": channel_ids, "role_ids": role_ids}
+
+
+def fill_database(engine, rows=1_000_000, days=365, seed=1):
+    """
+    Create the tables, populate them and run the migrations on an empty database.
+
+    Returns:
+        dict: The generated member, channel and role IDs (see populate())
+    """
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        if session.exec(select(Message.id).limit(1)).first() is not None:
+            raise ValueError(f"{engine.url} already has messages; synthetic data only goes into an empty database")
+    ids = populate(engine, rows, days, seed)
+    start = time.perf_counter()
+    migrate(engine)
+    print(f"Migrated (indexes, counters, rollups, voice sessions) in {time.perf_counter() - start:.1f}s")
+    return ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DATABASE_URL, help="URL of the database to fill (default: DATABASE_URL)")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of messages; other tables are scaled from it")
+    parser.add_argument("--days", type=int, default=365, help="Days of history to spread the rows over")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+    try:
+        fill_database(create_db_engine(args.db), args.rows, args.days, args.seed)
+    except ValueError as e:
+        sys.exit(str(e))
@@ -0,0 +1,109 @@
+from sqlalchemy import insert, or_, select, tuple_, update
+
+
+def chunked(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def upsert(session, model, rows, chunk_size=500):
+    """
+    Insert `rows` (a list of dicts) into `model`'s table, updating any existing
+    row with the same primary key whose values changed.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL. Other
+    backends fall back to loading the existing IDs of each chunk in one query
+    and splitting it into a bulk insert and a bulk update. The caller owns
+    the transaction.
+    """
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        _upsert_generic(session, model, rows, chunk_size)
+        return
+
+    key_columns = [column.name for column in table.primary_key.columns]
+    update_columns = [name for name in rows[0] if name not in key_columns]
+
+    statement = dialect_insert(table)
+    if update_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: statement.excluded[name] for name in update_columns},
+            # Skip the write entirely when nothing changed
+            where=or_(*[table.c[name].is_distinct_from(statement.excluded[name]) for name in update_columns])
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+
+    for chunk in chunked(rows, chunk_size):
+        session.execute(statement, chunk)
+
+
+def _upsert_generic(session, model, rows, chunk_size):
+    table = model.__table__
+    keys = list(table.primary_key.columns)
+
+    def row_key(row):
+        return tuple(row[key.name] for key in keys)
+
+    for chunk in chunked(rows, chunk_size):
+        existing = set(
+            tuple(row) for row in session.execute(select(*keys).where(tuple_(*keys).in_([row_key(row) for row in chunk])))
+        )
+
+        new_rows = [row for row in chunk if row_key(row) not in existing]
+        changed_rows = [row for row in chunk if row_key(row) in existing]
+        if new_rows:
+            session.execute(insert(table), new_rows)
+        # Key-only tables (e.g. MemberRole) have nothing to update
+        if changed_rows and len(changed_rows[0]) > len(keys):
+            session.execute(update(model), changed_rows)
+
+
+def increment(session, model, rows, chunk_size=500):
+    """
+    Add `rows` (a list of dicts) to `model`'s table: a row whose primary key
+    already exists gets the row's other values added to its own, any other
+    row is inserted as is. Used for counters.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL; other
+    backends run an UPDATE per row and insert the rows it didn't find. The
+    caller owns the transaction.
+    """
+    if not rows:
+        return
+
+    table = model.__table__
+    key_columns = [column.name for column in table.primary_key.columns]
+    value_columns = [name for name in rows[0] if name not in key_columns]
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        for row in rows:
+            result = session.execute(
+                update(table)
+                .where(*[table.c[name] == row[name] for name in key_columns])
+                .values({name: table.c[name] + row[name] for name in value_columns})
+            )
+            if result.rowcount == 0:
+                session.execute(insert(table), row)
+        return
+
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={name: table.c[name] + statement.excluded[name] for name in value_columns}
+    )
+    for chunk in chunked(rows, chunk_size):
+        session.execute(statement, chunk)
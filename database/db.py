@@ -1,4 +1,69 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlmodel import create_engine
 
-DATABASE_URL = "sqlite:///database/database.db"
-engine = create_engine(DATABASE_URL)
\ No newline at end of file
+from database.versions import track_table_versions
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL") or "sqlite:///database/database.db"
+
+# Applied to every new SQLite connection. WAL lets the dashboard read while the
+# bot writes; busy_timeout makes a writer wait for the lock instead of failing
+# with "database is locked". Each value can be overridden from .env.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE") or "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS") or "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS") or 5000),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE") or -65536),  # negative means KiB, so 64 MiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE") or 268435456),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE") or "MEMORY",
+}
+
+
+def create_db_engine(url=DATABASE_URL, pragmas=None):
+    """
+    Create an engine for `url` with the project's connection settings.
+
+    SQLite connections get the pragmas above (or `pragmas`, if given); other
+    backends only get the pool settings.
+
+    Args:
+        url (str): SQLAlchemy database URL
+        pragmas (dict): SQLite pragmas to use instead of SQLITE_PRAGMAS
+
+    Returns:
+        Engine: The configured engine
+    """
+    engine = create_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE") or 5),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW") or 10),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE") or 3600),
+        pool_pre_ping=not url.startswith("sqlite"),
+    )
+
+    if engine.dialect.name == "sqlite":
+        pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    # A forked child (e.g. a dashboard worker) must not reuse the parent's
+    # pooled connections; it opens its own on first use
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+    return engine
+
+
+engine = create_db_engine()
+
+# Every Session of the process keeps the per-table change counters the dashboard caches on
+track_table_versions()
@@ -0,0 +1,117 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session
+
+from database.metrics import Histogram
+
+
+class DatabaseExecutor:
+    """
+    Runs blocking SQLModel/SQLAlchemy work on a bounded thread pool so the
+    asyncio event loop never waits on SQLite I/O or lock contention.
+
+    `max_workers` caps how many database calls run at the same time; extra
+    calls wait in the pool's queue instead of piling up on the engine.
+    """
+
+    def __init__(self, engine, max_workers=2):
+        self.engine = engine
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+        self.calls = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, func, *args):
+        """
+        Run `func(*args)` on the database pool and await its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._timed, func, args)
+
+    async def run_in_session(self, func):
+        """
+        Run `func(session)` inside a fresh session and commit it afterwards.
+        """
+        def work():
+            with Session(self.engine) as session:
+                result = func(session)
+                session.commit()
+                return result
+
+        return await self.run(work)
+
+    def _timed(self, func, args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.calls += 1
+            self.busy_seconds += time.perf_counter() - start
+
+    def shutdown(self):
+        """
+        Wait for running calls to finish and stop the pool.
+        """
+        self._pool.shutdown(wait=True)
+
+
+class LoopLagMonitor:
+    """
+    Measures how long the event loop is blocked by sleeping for `interval`
+    seconds in a loop and recording how late each wake-up is.
+    """
+
+    def __init__(self, interval=0.25, report_interval=0):
+        self.interval = interval
+        self.report_interval = report_interval
+
+        self.samples = 0
+        self.blocked_seconds = 0.0
+        self.max_lag = 0.0
+        self.lag_seconds = Histogram(
+            "discord_logger_event_loop_lag_seconds", "How late the event loop woke up a sleeping task",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+        )
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_report = loop.time()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - before - self.interval)
+
+            self.samples += 1
+            self.blocked_seconds += lag
+            self.max_lag = max(self.max_lag, lag)
+            self.lag_seconds.observe(lag)
+
+            if self.report_interval and loop.time() - last_report >= self.report_interval:
+                print(self.summary())
+                last_report = loop.time()
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "blocked_seconds": self.blocked_seconds,
+            "max_lag_seconds": self.max_lag,
+        }
+
+    def summary(self):
+        return (
+            f"Event loop blocked for {self.blocked_seconds:.3f}s total "
+            f"(max lag {self.max_lag * 1000:.1f}ms over {self.samples} samples)"
+        )
@@ -0,0 +1,369 @@
+"""
+Prometheus-style metrics for the bot and the dashboard, without a client library.
+
+Counter, Gauge and Histogram keep one value (or set of buckets) per
+combination of label values. A Registry renders the metrics registered with
+it, plus whatever its collectors build at scrape time from counters the
+components already keep, in Prometheus' text exposition format:
+
+    registry = Registry()
+    handled = registry.register(Counter("events_total", "Events handled", ["event"]))
+    handled.inc(event="message")
+    registry.render()
+
+MetricsServer serves a registry on http://127.0.0.1:<port>/metrics from a
+background thread (the bot; the dashboard has a /metrics route instead).
+
+SampledProfiler runs cProfile on a random fraction of calls and writes the
+accumulated stats per name to PROFILE_DIR, for `python -m pstats` or snakeviz.
+"""
+import cProfile
+import math
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from a fast SQLite insert to a Discord request that is being retried
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {', '.join(self.labelnames) or 'none'}, got {', '.join(labels) or 'none'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        (name suffix, label names, label values, value) for every value.
+        """
+        with self._lock:
+            return [("", self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    A total that only goes up.
+    """
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down.
+    """
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """
+    Counts observations (durations, sizes) into cumulative buckets.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe how long the `with` block takes, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return sum(counts[0]) if counts else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(buckets), total)) for key, (buckets, total) in self._values.items())
+        samples = []
+        bucket_names = self.labelnames + ("le",)
+        for key, (buckets, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, buckets):
+                cumulative += count
+                samples.append(("_bucket", bucket_names, key + (_format_value(float(bound)),), cumulative))
+            samples.append(("_sum", self.labelnames, key, total))
+            samples.append(("_count", self.labelnames, key, cumulative))
+        return samples
+
+
+class Registry:
+    """
+    The metrics a process exposes.
+
+    Collectors are callables run on every scrape that return fresh metrics,
+    for values the components already track themselves (queue depths, totals).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        """
+        Expose `metric` and return it.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Every metric in the text exposition format.
+        """
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves a registry on http://127.0.0.1:`port`/metrics from a daemon thread.
+    """
+
+    def __init__(self, registry, port):
+        self.registry = registry
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """
+        Start listening. Returns False (after saying why) if the port can't be bound.
+        """
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint disabled, can't listen on port {self.port}: {e}")
+            return False
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Metrics on http://127.0.0.1:{self.port}/metrics")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class SampledProfiler:
+    """
+    Profiles a random `sample_rate` fraction of calls with cProfile, keeping
+    one profile per name (an event type, a route). The stats are written to
+    `<directory>/<name>.<pid>.prof` at most every `dump_interval` seconds and
+    by dump().
+
+    cProfile only sees the thread that enables it, and one profiler at a time
+    per thread; a sampled call that would overlap another one is skipped.
+    """
+
+    def __init__(self, sample_rate=0.0, directory="profiles", dump_interval=60.0):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.dump_interval = dump_interval
+
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._active = threading.local()
+        self._last_dump = time.monotonic()
+        # Calls profiled so far
+        self.samples = 0
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def should_sample(self):
+        return self.enabled and random.random() < self.sample_rate
+
+    def _profile(self, name):
+        with self._lock:
+            if name not in self._profiles:
+                self._profiles[name] = cProfile.Profile()
+            return self._profiles[name]
+
+    def start(self, name):
+        """
+        Start profiling the current thread under `name`. Returns the profile to
+        pass to stop(), or None if another profile is already running here.
+        """
+        if getattr(self._active, "profile", None) is not None:
+            return None
+        profile = self._profile(name)
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # Another profiler (e.g. python -m cProfile) is already running
+        self._active.profile = profile
+        return profile
+
+    def stop(self, profile):
+        if profile is not None:
+            profile.disable()
+            self._active.profile = None
+
+    @contextmanager
+    def running(self, name):
+        """
+        Profile the `with` block under `name` (on the current thread only).
+        """
+        profile = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(profile)
+
+    async def run(self, name, coroutine):
+        """
+        Await `coroutine`, profiling only the steps it runs itself, not the
+        other tasks that run on the loop while it waits.
+        """
+        self.samples += 1
+        try:
+            return await _ProfiledCoroutine(self, name, coroutine)
+        finally:
+            self.maybe_dump()
+
+    def maybe_dump(self):
+        if time.monotonic() - self._last_dump >= self.dump_interval:
+            self.dump()
+
+    def dump(self):
+        """
+        Write the stats collected so far, one file per name.
+        """
+        self._last_dump = time.monotonic()
+        with self._lock:
+            profiles = dict(self._profiles)
+        if not profiles:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name, profile in profiles.items():
+            # e.g. "dashboard-/roles/<int:role_id>" -> "dashboard-roles-int-role_id"
+            filename = re.sub(r"[^A-Za-z0-9_]+", "-", name).strip("-")
+            try:
+                profile.dump_stats(os.path.join(self.directory, f"{filename}.{os.getpid()}.prof"))
+            except Exception as e:
+                print(f"Failed to write the profile of {name}: {e}")
+
+
+class _ProfiledCoroutine:
+    # Drives a coroutine the way an asyncio Task does, with the profiler on
+    # only while the coroutine itself is running
+
+    def __init__(self, profiler, name, coroutine):
+        self.profiler = profiler
+        self.name = name
+        self.coroutine = coroutine
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            with self.profiler.running(self.name):
+                try:
+                    future = self.coroutine.throw(error) if error is not None else self.coroutine.send(value)
+                except StopIteration as stop:
+                    return stop.value
+            try:
+                value, error = (yield future), None
+            except BaseException as e:
+                value, error = None, e
@@ -0,0 +1,308 @@
+"""
+Brings an existing database up to date with database/schema.py.
+
+SQLModel.metadata.create_all() only creates missing tables; it never touches
+tables that already exist. Everything added to the schema after a database
+was first created goes through here instead. Every step is idempotent, so
+this runs on every bot start and can also be run by hand:
+
+    python -m database.migrations
+"""
+import json
+import os
+import time
+
+from sqlalchemy import inspect, literal, text, update
+from sqlmodel import Session, SQLModel, select
+
+from database.bulk import upsert
+from database.retention import archive_engine, list_archives
+from database.schema import *
+from database.search import create_search_indexes
+from database.rollups import rebuild_rollups
+from database.stats import TRACKED_TABLES, rebuild_event_counts
+from database.voice import SESSION_ACTIONS, rebuild_voice_sessions, rollup_rows
+
+
+# Indexes the schema no longer declares (replaced by the ones listed next to them)
+OBSOLETE_INDEXES = {
+    "memberrole": ["ix_memberrole_role_id_member_id"],  # ix_memberrole_guild_id_role_id_member_id
+}
+
+
+def add_missing_columns(engine):
+    """
+    Add every column declared in the schema that an existing table doesn't have
+    yet. New columns are nullable (or have a default), so this is a quick
+    ALTER TABLE that doesn't rewrite the table.
+    """
+    inspector = inspect(engine)
+    added = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or column.primary_key:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            added.append(f"{table.name}.{column.name}")
+            print(f"Added column {table.name}.{column.name}")
+    return added
+
+
+def recreate_event_counts(engine):
+    """
+    Drop an EventCount table from before counts were kept per guild. Its
+    primary key changed, so it's recreated empty and backfilled from the
+    event tables by backfill_event_counts().
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("eventcount"):
+        return
+    if "guild_id" in {column["name"] for column in inspector.get_columns("eventcount")}:
+        return
+    EventCount.__table__.drop(engine)
+    EventCount.__table__.create(engine)
+    print("Recreated the eventcount table with per-guild counts")
+
+
+def legacy_guild_id(engine):
+    """
+    The guild a database written before multi-guild support belongs to:
+    LEGACY_GUILD_ID if it's set, otherwise the ID of the only @everyone role
+    stored (the @everyone role's ID is its guild's ID). None if it can't be told.
+    """
+    if os.getenv("LEGACY_GUILD_ID"):
+        return int(os.getenv("LEGACY_GUILD_ID"))
+    with Session(engine) as session:
+        everyone = session.exec(select(Role.id).where(Role.name == "@everyone").limit(2)).all()
+    return everyone[0] if len(everyone) == 1 else None
+
+
+def backfill_guild_ids(engine, guild_id=None):
+    """
+    Set guild_id on rows stored before multi-guild support, which all belong
+    to the one guild the bot was logging then.
+
+    Args:
+        engine: Engine of the database to update
+        guild_id (int): Guild of the old rows (found with legacy_guild_id() if None)
+
+    Returns:
+        int: The guild ID used, or None if there was nothing to do or it couldn't be told
+    """
+    tables = [table for table in SQLModel.metadata.sorted_tables if "guild_id" in table.columns and table.name != "guildconfig"]
+    with Session(engine) as session:
+        pending = [
+            table for table in tables
+            if session.execute(select(literal(1)).select_from(table).where(table.c.guild_id.is_(None)).limit(1)).first() is not None
+        ]
+    if not pending:
+        return None
+
+    guild_id = guild_id or legacy_guild_id(engine)
+    if guild_id is None:
+        print("Rows without a guild found, but their guild can't be told; set LEGACY_GUILD_ID to assign them")
+        return None
+
+    for table in pending:
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            result = connection.execute(update(table).where(table.c.guild_id.is_(None)).values(guild_id=guild_id))
+        print(f"Assigned {result.rowcount} {table.name} rows to guild {guild_id} in {time.perf_counter() - start:.2f}s")
+    return guild_id
+
+
+def drop_obsolete_indexes(engine):
+    """
+    Drop the indexes listed in OBSOLETE_INDEXES that still exist.
+    """
+    inspector = inspect(engine)
+    for table_name, index_names in OBSOLETE_INDEXES.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index_name in index_names:
+            if index_name in existing:
+                with engine.begin() as connection:
+                    connection.execute(text(f"DROP INDEX {index_name}"))
+                print(f"Dropped index {index_name}")
+
+
+def upgrade_tables(engine, guild_id=None):
+    """
+    Bring the tables and indexes of an existing database (live or archive) up
+    to date with the schema.
+
+    Returns:
+        int: Guild the rows without one were assigned to, if any
+    """
+    SQLModel.metadata.create_all(engine)
+    recreate_event_counts(engine)
+    add_missing_columns(engine)
+    # Before the indexes, so the backfill doesn't have to maintain them
+    guild_id = backfill_guild_ids(engine, guild_id)
+    drop_obsolete_indexes(engine)
+    create_missing_indexes(engine)
+    return guild_id
+
+
+def create_missing_indexes(engine):
+    """
+    Create every index declared in the schema that the database doesn't have yet.
+    """
+    inspector = inspect(engine)
+    created = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            start = time.perf_counter()
+            index.create(bind=engine)
+            created.append(index.name)
+            print(f"Created index {index.name} in {time.perf_counter() - start:.2f}s")
+    return created
+
+
+def backfill_event_counts(engine):
+    """
+    Fill the EventCount table from the event tables if it has never been filled.
+    """
+    with Session(engine) as session:
+        if session.exec(select(EventCount).limit(1)).first() is not None:
+            return
+        if not any(session.exec(select(literal(1)).select_from(column.class_).limit(1)).first() for column in TRACKED_TABLES.values()):
+            return
+        start = time.perf_counter()
+        rebuild_event_counts(session)
+        session.commit()
+        print(f"Backfilled event counts in {time.perf_counter() - start:.2f}s")
+
+
+def backfill_rollups(engine):
+    """
+    Fill the hourly and daily activity counters from the event tables if they have never been filled.
+    """
+    with Session(engine) as session:
+        if session.exec(select(HourlyEventCount).limit(1)).first() is not None:
+            return
+        if not any(session.exec(select(literal(1)).select_from(column.class_).limit(1)).first() for column in TRACKED_TABLES.values()):
+            return
+        start = time.perf_counter()
+        rebuild_rollups(session)
+        session.commit()
+        print(f"Backfilled activity rollups in {time.perf_counter() - start:.2f}s")
+
+
+def backfill_voice_hours(engine):
+    """
+    Fill VoiceHour from the ended voice sessions if it has never been filled.
+    """
+    with Session(engine) as session:
+        if session.exec(select(VoiceHour).limit(1)).first() is not None:
+            return
+        if session.exec(select(VoiceSession.id).where(VoiceSession.ended_at != None).limit(1)).first() is None:
+            return
+        start = time.perf_counter()
+        voice_sessions = session.exec(select(VoiceSession).where(VoiceSession.ended_at != None)).all()
+        upsert(session, VoiceHour, rollup_rows(voice_sessions)[VoiceHour])
+        session.commit()
+        print(f"Backfilled voice occupancy from {len(voice_sessions)} sessions in {time.perf_counter() - start:.2f}s")
+
+
+def migrate_member_roles(engine):
+    """
+    Move role memberships from the legacy Member.roles_json column into the
+    MemberRole table, then empty the column so it is only done once.
+
+    Waits (leaving the column as it is) while any of the roles still has no
+    guild, i.e. until backfill_guild_ids() could tell the legacy guild.
+    """
+    with Session(engine) as session:
+        if session.exec(select(Member.id).where(Member.roles_json.is_not(None)).limit(1)).first() is None:
+            return
+        start = time.perf_counter()
+        role_guilds = dict(session.exec(select(Role.id, Role.guild_id)).all())
+        rows = []
+        for member_id, roles_json in session.exec(select(Member.id, Member.roles_json).where(Member.roles_json.is_not(None))):
+            try:
+                role_ids = set(json.loads(roles_json))
+            except (json.JSONDecodeError, TypeError):
+                continue
+            rows.extend({"member_id": member_id, "role_id": role_id, "guild_id": role_guilds[role_id]} for role_id in role_ids if role_id in role_guilds)
+        # Rows without a guild would be invisible to the guild's views and never cleaned up
+        if any(row["guild_id"] is None for row in rows):
+            print("Role memberships not moved to the memberrole table yet, their guild can't be told; set LEGACY_GUILD_ID to move them")
+            return
+        upsert(session, MemberRole, rows)
+        session.execute(update(Member).where(Member.roles_json.is_not(None)).values(roles_json=None))
+        session.commit()
+        print(f"Moved {len(rows)} role memberships to the memberrole table in {time.perf_counter() - start:.2f}s")
+
+
+def _voice_events(engine):
+    columns = (VoiceActivity.guild_id, VoiceActivity.member_id, VoiceActivity.action,
+               VoiceActivity.from_channel_id, VoiceActivity.to_channel_id, VoiceActivity.timestamp)
+    statement = (
+        select(*columns)
+        .where(VoiceActivity.action.in_(SESSION_ACTIONS))
+        .order_by(VoiceActivity.timestamp, VoiceActivity.id)
+        .execution_options(yield_per=5000)
+    )
+    with Session(engine) as session:
+        yield from session.exec(statement)
+
+
+def migrate_voice_sessions(engine):
+    """
+    Build the VoiceSession table and its daily rollups from the stored voice
+    events (archived months first) if it has never been filled.
+    """
+    with Session(engine) as session:
+        if session.exec(select(VoiceSession.id).limit(1)).first() is not None:
+            return
+        if session.exec(select(VoiceActivity.id).where(VoiceActivity.action.in_(SESSION_ACTIONS)).limit(1)).first() is None:
+            return
+        start = time.perf_counter()
+
+        def events():
+            for month in reversed(list_archives()):
+                yield from _voice_events(archive_engine(month))
+            yield from _voice_events(engine)
+
+        count = rebuild_voice_sessions(session, events())
+        session.commit()
+        print(f"Rebuilt {count} voice sessions from the voice activity log in {time.perf_counter() - start:.2f}s")
+
+
+def migrate(engine):
+    """
+    Create missing tables, then apply every migration step in order.
+    The monthly archives get the same table and index changes.
+    """
+    guild_id = upgrade_tables(engine)
+    backfill_event_counts(engine)
+    backfill_rollups(engine)
+    create_search_indexes(engine)
+    migrate_member_roles(engine)
+
+    # Archives of a single-guild database belong to the same guild
+    guild_id = guild_id or legacy_guild_id(engine)
+    for month in list_archives():
+        upgrade_tables(archive_engine(month), guild_id)
+
+    # Reads the archives too, so only once they have guild IDs
+    migrate_voice_sessions(engine)
+    backfill_voice_hours(engine)
+
+
+if __name__ == "__main__":
+    from database.db import engine
+    migrate(engine)
+    print("Database is up to date.")
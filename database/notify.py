@@ -0,0 +1,90 @@
+"""
+Change notifications from the bot to the dashboard.
+
+After every committed batch the bot's writer sends the names of the tables
+it wrote to as one UDP datagram to 127.0.0.1:LIVE_NOTIFY_PORT. The
+dashboard's live feed listens on that port and reads the new rows right
+away instead of waiting for its next poll. Datagrams are fire-and-forget:
+if the dashboard isn't running nothing happens, and if one is lost the
+dashboard still finds the rows on its next poll of the high-water marks.
+Set LIVE_NOTIFY_PORT=0 to turn notifications off.
+"""
+import os
+import select
+import socket
+import time
+
+LIVE_NOTIFY_HOST = "127.0.0.1"
+LIVE_NOTIFY_PORT = int(os.getenv("LIVE_NOTIFY_PORT") or 8765)
+
+
+class ChangeNotifier:
+    """
+    Sends table change notifications (bot side).
+    """
+
+    def __init__(self, port=LIVE_NOTIFY_PORT):
+        self.address = (LIVE_NOTIFY_HOST, port)
+        self.enabled = port > 0
+        self._socket = None
+        if self.enabled:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+    def notify(self, table_names):
+        if not self.enabled or not table_names:
+            return
+        try:
+            self._socket.sendto(",".join(sorted(table_names)).encode(), self.address)
+        except OSError:
+            pass  # Nobody listening or the buffer is full; the dashboard will poll
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+
+
+class ChangeListener:
+    """
+    Receives table change notifications (dashboard side).
+
+    Only one process can listen on the port; if it's taken (e.g. by another
+    dashboard worker) the listener is disabled and wait() just sleeps, so
+    the caller falls back to polling.
+    """
+
+    def __init__(self, port=LIVE_NOTIFY_PORT):
+        self.enabled = False
+        self._socket = None
+        if port > 0:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind((LIVE_NOTIFY_HOST, port))
+                self._socket = sock
+                self.enabled = True
+            except OSError as e:
+                sock.close()
+                print(f"Not listening for change notifications on port {port} ({e}), polling only")
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds for notifications.
+
+        Returns:
+            set: Names of the tables reported as changed (empty on timeout)
+        """
+        if not self.enabled:
+            time.sleep(timeout)
+            return set()
+
+        changed = set()
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        while readable:
+            data = self._socket.recv(4096)
+            changed.update(name for name in data.decode(errors="ignore").split(",") if name)
+            readable, _, _ = select.select([self._socket], [], [], 0)
+        return changed
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
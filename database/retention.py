@@ -0,0 +1,204 @@
+"""
+Retention for the event tables.
+
+Rows older than a table's retention window are moved out of the live
+database into monthly archive databases (ARCHIVE_DIR/YYYY-MM.db, one per
+month of the row's timestamp). Each archive has the full schema and gets a
+copy of the members, channels and roles its rows refer to. The dashboard
+can query an archive exactly like the live database.
+
+Rows are moved in chunks (archive_chunk): each chunk is committed to its
+archive first and then deleted from the live database in a short
+transaction, so the bot's writer is never locked out for long. The bot runs
+every chunk as its own database call and waits between them on the event
+loop, so the job never holds a database thread for a whole run. Archive writes are upserts, so a move
+interrupted between the two steps is safe to redo.
+
+Retention windows are set per table in days (0 or unset keeps rows forever):
+
+    RETENTION_DAYS_MESSAGE=365
+    RETENTION_DAYS_VOICEACTIVITY=180
+    ...
+
+The bot runs the job every RETENTION_INTERVAL_HOURS; it can also be run by hand:
+
+    python -m database.retention
+"""
+import glob
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, select
+from sqlmodel import Session, SQLModel
+
+from database.bulk import upsert
+from database.db import create_db_engine
+from database.schema import *
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or "database/archive"
+
+# Tables that can be archived, and the column that dates each of their rows
+ARCHIVABLE_TABLES = {
+    "message": (Message, Message.created_at),
+    "deletedmessage": (DeletedMessage, DeletedMessage.deleted_at),
+    "editedmessage": (EditedMessage, EditedMessage.edited_at),
+    "voiceactivity": (VoiceActivity, VoiceActivity.timestamp),
+    "guildactivity": (GuildActivity, GuildActivity.timestamp),
+    "memberactivity": (MemberActivity, MemberActivity.timestamp),
+}
+
+# Seconds between two chunks, so the bot's writer gets the lock in between
+CHUNK_PAUSE = 0.05
+
+_archive_engines = {}
+
+
+def retention_days():
+    """
+    Retention window in days per table name, for tables that have one.
+    """
+    windows = {}
+    for table_name in ARCHIVABLE_TABLES:
+        days = int(os.getenv(f"RETENTION_DAYS_{table_name.upper()}") or 0)
+        if days > 0:
+            windows[table_name] = days
+    return windows
+
+
+def archive_engine(month):
+    """
+    Engine for the archive database of `month` ("YYYY-MM"), creating it if needed.
+    """
+    if month not in _archive_engines:
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        engine = create_db_engine(f"sqlite:///{os.path.join(ARCHIVE_DIR, month)}.db")
+        SQLModel.metadata.create_all(engine)
+        _archive_engines[month] = engine
+    return _archive_engines[month]
+
+
+def list_archives():
+    """
+    Months that have an archive database, newest first.
+    """
+    paths = glob.glob(os.path.join(ARCHIVE_DIR, "[0-9][0-9][0-9][0-9]-[0-9][0-9].db"))
+    return sorted((os.path.basename(path)[:-3] for path in paths), reverse=True)
+
+
+def _referenced_rows(session, model, ids):
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return []
+    return [row.model_dump() for row in session.execute(select(model).where(model.id.in_(ids))).scalars()]
+
+
+def _copy_to_archive(month, model, rows, members, channels, roles, messages):
+    with Session(archive_engine(month)) as session:
+        upsert(session, Member, members)
+        upsert(session, Channel, channels)
+        upsert(session, Role, roles)
+        if model is not Message:
+            upsert(session, Message, messages)
+        upsert(session, model, rows)
+        session.commit()
+
+
+def archive_chunk(engine, table_name, cutoff, chunk_size=5000):
+    """
+    Move the oldest `chunk_size` rows of `table_name` older than `cutoff`
+    into the monthly archives.
+
+    Returns:
+        int: Number of rows moved (0 once there are none left)
+    """
+    model, column = ARCHIVABLE_TABLES[table_name]
+    condition = column < cutoff
+    if model is Message:
+        # Keep messages that live deleted/edited log entries still point at
+        condition = condition & ~exists().where(DeletedMessage.message_id == Message.id) & ~exists().where(EditedMessage.message_id == Message.id)
+
+    with Session(engine) as session:
+        rows = session.execute(select(model).where(condition).order_by(column).limit(chunk_size)).scalars().all()
+        if not rows:
+            return 0
+        rows = [row.model_dump() for row in rows]
+
+        message_ids = [row["message_id"] for row in rows] if "message_id" in rows[0] else []
+        messages = _referenced_rows(session, Message, message_ids)
+        member_ids = [row.get("member_id") for row in rows + messages]
+        channel_ids = [row.get("channel_id") for row in rows + messages]
+        channel_ids += [row.get(key) for row in rows for key in ("from_channel_id", "to_channel_id")]
+        members = _referenced_rows(session, Member, member_ids)
+        channels = _referenced_rows(session, Channel, channel_ids)
+        roles = _referenced_rows(session, Role, [row.get("role_id") for row in rows])
+
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row[column.key].strftime("%Y-%m")].append(row)
+    for month, month_rows in by_month.items():
+        _copy_to_archive(month, model, month_rows, members, channels, roles, messages)
+
+    # Only now remove them from the live database, in a short transaction of its own
+    with Session(engine) as session:
+        session.execute(delete(model).where(model.id.in_([row["id"] for row in rows])))
+        session.commit()
+    return len(rows)
+
+
+def archive_table(engine, table_name, cutoff, chunk_size=5000, pause=CHUNK_PAUSE, stop=None):
+    """
+    Move rows of `table_name` older than `cutoff` into the monthly archives,
+    one chunk at a time. Stops after the current chunk once `stop` (a
+    threading.Event) is set.
+
+    Returns:
+        int: Number of rows moved
+    """
+    moved = 0
+    while stop is None or not stop.is_set():
+        count = archive_chunk(engine, table_name, cutoff, chunk_size)
+        if not count:
+            break
+        moved += count
+        time.sleep(pause)
+    return moved
+
+
+def retention_cutoffs(now=None):
+    """
+    (table name, cutoff) of every table that has a retention window, in the
+    order they should be archived: log tables first, so the messages they
+    pointed at become archivable in the same run.
+    """
+    now = now or datetime.utcnow()
+    return [
+        (table_name, now - timedelta(days=days))
+        for table_name, days in sorted(retention_days().items(), key=lambda item: item[0] == "message")
+    ]
+
+
+def run_retention(engine, now=None, stop=None):
+    """
+    Archive every table that has a retention window.
+
+    Returns:
+        dict: Number of rows moved per table
+    """
+    results = {}
+    for table_name, cutoff in retention_cutoffs(now):
+        start = time.perf_counter()
+        results[table_name] = archive_table(engine, table_name, cutoff, stop=stop)
+        if results[table_name]:
+            print(f"Archived {results[table_name]} rows from {table_name} in {time.perf_counter() - start:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    from database.db import engine
+
+    windows = retention_days()
+    if not windows:
+        print("No retention windows configured (set RETENTION_DAYS_<TABLE> in .env).")
+    run_retention(engine)
@@ -0,0 +1,135 @@
+"""
+Hourly and daily activity counters for the dashboard's charts.
+
+Like EventCount (see database/stats.py), these are kept up to date by the
+bot's writer in the same transaction as the rows they count, so a chart reads
+a few hundred counter rows instead of scanning the event tables:
+
+    HourlyEventCount  rows per guild, hour, table and action
+    ChannelDayCount   rows per guild, day, table and channel
+    MemberDayCount    rows per guild, day, table and member
+
+rebuild_rollups() recomputes them from the event tables with a GROUP BY per
+table and dimension; migrations run it once when they are empty.
+"""
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal
+from sqlmodel import select
+
+from database.bulk import chunked, increment
+from database.schema import *
+from database.stats import TRACKED_TABLES, _as_naive_utc, _parse_day
+
+# Per table: the column holding its action, its channel columns (the first one
+# set is used) and its member column; None where the table has no such column
+ROLLUP_COLUMNS = {
+    "message": (None, [Message.channel_id], Message.member_id),
+    "deletedmessage": (None, [], None),
+    "editedmessage": (None, [], None),
+    "voiceactivity": (VoiceActivity.action, [VoiceActivity.to_channel_id, VoiceActivity.from_channel_id], VoiceActivity.member_id),
+    "guildactivity": (GuildActivity.action, [], GuildActivity.member_id),
+    "memberactivity": (MemberActivity.action, [], MemberActivity.member_id),
+}
+
+
+def start_of_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def record_rollups(session, rows_by_table):
+    """
+    Add freshly inserted rows to the hourly and daily counters.
+
+    Args:
+        session: Session of the transaction that inserted the rows
+        rows_by_table (dict): Table name -> list of inserted row dicts
+    """
+    hourly, channels, members = Counter(), Counter(), Counter()
+    for table_name, rows in rows_by_table.items():
+        if table_name not in ROLLUP_COLUMNS:
+            continue
+        timestamp_key = TRACKED_TABLES[table_name].key
+        action_column, channel_columns, member_column = ROLLUP_COLUMNS[table_name]
+        for values in rows:
+            timestamp = values.get(timestamp_key)
+            if timestamp is None:
+                continue
+            timestamp = _as_naive_utc(timestamp)
+            guild_id = values.get("guild_id") or 0
+            action = (values.get(action_column.key) or "") if action_column is not None else ""
+            hourly[(guild_id, start_of_hour(timestamp), table_name, action)] += 1
+
+            channel_id = next((values[column.key] for column in channel_columns if values.get(column.key) is not None), None)
+            if channel_id is not None:
+                channels[(guild_id, timestamp.date(), table_name, channel_id)] += 1
+            if member_column is not None and values.get(member_column.key) is not None:
+                members[(guild_id, timestamp.date(), table_name, values[member_column.key])] += 1
+
+    increment(session, HourlyEventCount, [
+        {"guild_id": guild_id, "hour": hour, "table_name": table_name, "action": action, "count": count}
+        for (guild_id, hour, table_name, action), count in hourly.items()
+    ])
+    increment(session, ChannelDayCount, [
+        {"guild_id": guild_id, "day": day, "table_name": table_name, "channel_id": channel_id, "count": count}
+        for (guild_id, day, table_name, channel_id), count in channels.items()
+    ])
+    increment(session, MemberDayCount, [
+        {"guild_id": guild_id, "day": day, "table_name": table_name, "member_id": member_id, "count": count}
+        for (guild_id, day, table_name, member_id), count in members.items()
+    ])
+
+
+def _hour(column, dialect):
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+    return func.date_trunc("hour", column)
+
+
+def _parse_hour(hour):
+    # SQLite's strftime() returns text, other backends return a timestamp
+    return datetime.fromisoformat(hour) if isinstance(hour, str) else hour
+
+
+def rebuild_rollups(session):
+    """
+    Recompute every hourly and daily counter from the event tables. The caller commits.
+    """
+    dialect = session.get_bind().dialect.name
+    for model in (HourlyEventCount, ChannelDayCount, MemberDayCount):
+        session.execute(delete(model))
+
+    for table_name, (action_column, channel_columns, member_column) in ROLLUP_COLUMNS.items():
+        column = TRACKED_TABLES[table_name]
+        guild_id = func.coalesce(column.class_.guild_id, 0)
+        action = func.coalesce(action_column, "") if action_column is not None else literal("")
+
+        hour = _hour(column, dialect)
+        rows = [
+            {"guild_id": guild, "hour": _parse_hour(hour_value), "table_name": table_name, "action": action_value, "count": count}
+            for guild, hour_value, action_value, count in session.exec(
+                select(guild_id, hour, action, func.count()).where(column != None).group_by(guild_id, hour, action)
+            )
+        ]
+        for chunk in chunked(rows, 5000):
+            session.execute(insert(HourlyEventCount), chunk)
+
+        day = func.date(column)
+        channel_id = func.coalesce(*channel_columns) if len(channel_columns) > 1 else next(iter(channel_columns), None)
+        for model, key, object_id in (
+            (ChannelDayCount, "channel_id", channel_id),
+            (MemberDayCount, "member_id", member_column),
+        ):
+            if object_id is None:
+                continue
+            rows = [
+                {"guild_id": guild, "day": _parse_day(day_value), "table_name": table_name, key: object_value, "count": count}
+                for guild, day_value, object_value, count in session.exec(
+                    select(guild_id, day, object_id, func.count())
+                    .where(column != None, object_id != None)
+                    .group_by(guild_id, day, object_id)
+                )
+            ]
+            for chunk in chunked(rows, 5000):
+                session.execute(insert(model), chunk)
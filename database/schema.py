@@ -1,13 +1,46 @@
 from typing import Optional
 from sqlmodel import SQLModel, Field
-from datetime import datetime
+from sqlalchemy import Index
+from datetime import date, datetime
+
+# Composite indexes are declared in __table_args__ and named ix_<table>_<columns>,
+# single-column ones use Field(index=True). database/migrations.py adds any of
+# them (and any new column) that are missing from an existing database.
+#
+# Every row belongs to a guild (guild_id), except members: a Member row is a
+# Discord user, shared by every guild they are in. Which guilds that is can be
+# read from MemberRole, since every member has the guild's @everyone role,
+# whose ID is the guild's ID.
+
+class Guild(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: Optional[str] = Field(max_length=256)
+    icon_url: Optional[str] = Field(max_length=256)
+    created_at: Optional[datetime]
+
+class GuildConfig(SQLModel, table=True):
+    # Log channels of a guild (replaces discord-bot/log_channels.json)
+    guild_id: int = Field(primary_key=True)
+    log_category_id: Optional[int] = Field()
+    deleted_messages_channel_id: Optional[int] = Field()
+    edited_messages_channel_id: Optional[int] = Field()
+    voice_activity_channel_id: Optional[int] = Field()
+    guild_activity_channel_id: Optional[int] = Field()
+    members_activity_channel_id: Optional[int] = Field()
 
 class Message(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_message_channel_id_created_at", "channel_id", "created_at"),
+        Index("ix_message_member_id_created_at", "member_id", "created_at"),
+        Index("ix_message_guild_id_created_at", "guild_id", "created_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field()
     member_id: Optional[int] = Field(foreign_key="member.id")
     channel_id: Optional[int] = Field(foreign_key="channel.id")
     content: Optional[str] = Field(max_length=2000)
-    created_at: Optional[datetime]
+    created_at: Optional[datetime] = Field(index=True)
     is_edited: Optional[bool] = Field(default=False)
 
 class Member(SQLModel, table=True):
@@ -16,51 +49,181 @@ class Member(SQLModel, table=True):
     global_name: Optional[str] = Field(max_length=256)
     avatar_url: Optional[str] = Field(max_length=256)
     created_at: Optional[datetime]
-    roles_json: Optional[str] = Field()
+    roles_json: Optional[str] = Field()  # Legacy, replaced by MemberRole; emptied by the migration
 
 class Channel(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field(index=True)
     name: Optional[str] = Field(max_length=256)
     ch_type: Optional[str] = Field(max_length=256)
 
 class Role(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field(index=True)
     name: Optional[str] = Field(max_length=256)
     color: Optional[str] = Field(max_length=256)
     permissions: Optional[int] = Field()
     created_at: Optional[datetime]
 
+class MemberRole(SQLModel, table=True):
+    # Which roles each member currently has; the primary key serves "roles of a member",
+    # the index "members with a role" and "memberships in a guild"
+    __table_args__ = (
+        Index("ix_memberrole_guild_id_role_id_member_id", "guild_id", "role_id", "member_id"),
+    )
+
+    member_id: int = Field(foreign_key="member.id", primary_key=True)
+    role_id: int = Field(foreign_key="role.id", primary_key=True)
+    guild_id: Optional[int] = Field()
+
 class DeletedMessage(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_deletedmessage_guild_id_deleted_at", "guild_id", "deleted_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    message_id: Optional[int] = Field(default=None)
-    deleted_at: Optional[datetime]
+    guild_id: Optional[int] = Field()
+    message_id: Optional[int] = Field(default=None, index=True)
+    deleted_at: Optional[datetime] = Field(index=True)
 
 class EditedMessage(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_editedmessage_guild_id_edited_at", "guild_id", "edited_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    message_id: Optional[int] = Field(default=None)
+    guild_id: Optional[int] = Field()
+    message_id: Optional[int] = Field(default=None, index=True)
     content_before: Optional[str] = Field(max_length=2000)
     content_after: Optional[str] = Field(max_length=2000)
-    edited_at: Optional[datetime]
+    edited_at: Optional[datetime] = Field(index=True)
 
 
 class VoiceActivity(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_voiceactivity_member_id_timestamp", "member_id", "timestamp"),
+        Index("ix_voiceactivity_guild_id_timestamp", "guild_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field()
     member_id: Optional[int] = Field()
     action: Optional[str] = Field(max_length=256)
     from_channel_id: Optional[int] = Field()
     to_channel_id: Optional[int] = Field()
-    timestamp: Optional[datetime]
+    timestamp: Optional[datetime] = Field(index=True)
     details: Optional[str] = Field()  # JSON field for additional details
 
 class GuildActivity(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_guildactivity_member_id_timestamp", "member_id", "timestamp"),
+        Index("ix_guildactivity_guild_id_timestamp", "guild_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field()
     action: Optional[str] = Field(max_length=256)
     member_id: Optional[int] = Field()
-    timestamp: Optional[datetime]
+    timestamp: Optional[datetime] = Field(index=True)
 
 class MemberActivity(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_memberactivity_member_id_timestamp", "member_id", "timestamp"),
+        Index("ix_memberactivity_guild_id_timestamp", "guild_id", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field()
     action: Optional[str] = Field(max_length=256)
     member_id: Optional[int] = Field()
-    role_id: Optional[int] = Field()
-    timestamp: Optional[datetime]
\ No newline at end of file
+    role_id: Optional[int] = Field(index=True)
+    timestamp: Optional[datetime] = Field(index=True)
+
+class VoiceSession(SQLModel, table=True):
+    # One stay of a member in one voice channel, paired up from the voice_join,
+    # voice_leave and voice_move events by database/voice.py. ended_at is NULL
+    # while the member is still in the channel.
+    __table_args__ = (
+        Index("ix_voicesession_guild_id_started_at", "guild_id", "started_at"),
+        Index("ix_voicesession_member_id_started_at", "member_id", "started_at"),
+        # Open sessions (ended_at IS NULL) of a guild or member, and the newest end
+        Index("ix_voicesession_ended_at_guild_id_member_id", "ended_at", "guild_id", "member_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    guild_id: Optional[int] = Field()
+    member_id: Optional[int] = Field()
+    channel_id: Optional[int] = Field()
+    started_at: Optional[datetime] = Field()
+    ended_at: Optional[datetime] = Field(default=None)
+    duration_seconds: Optional[int] = Field()
+    estimated: bool = Field(default=False)  # Start or end guessed because the bot was offline
+
+class VoiceMemberDay(SQLModel, table=True):
+    # Seconds each member spent in voice per (UTC) day, added to as sessions end
+    __table_args__ = (
+        Index("ix_voicememberday_member_id_day", "member_id", "day"),
+    )
+
+    guild_id: int = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    member_id: int = Field(primary_key=True)
+    seconds: int = Field(default=0)
+    sessions: int = Field(default=0)  # Sessions that started that day
+
+class VoiceChannelDay(SQLModel, table=True):
+    # Seconds spent in each voice channel per (UTC) day, added to as sessions end
+    __table_args__ = (
+        Index("ix_voicechannelday_channel_id_day", "channel_id", "day"),
+    )
+
+    guild_id: int = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    channel_id: int = Field(primary_key=True)
+    seconds: int = Field(default=0)
+    sessions: int = Field(default=0)  # Sessions that started that day
+
+class VoiceHour(SQLModel, table=True):
+    # Seconds spent in voice per hour by all members together (average occupancy)
+    guild_id: int = Field(primary_key=True)
+    hour: datetime = Field(primary_key=True, index=True)
+    seconds: int = Field(default=0)
+
+class EventCount(SQLModel, table=True):
+    # Per-guild, per-table, per-day row counts kept up to date by the bot's writer (see database/stats.py)
+    guild_id: int = Field(default=0, primary_key=True)
+    table_name: str = Field(primary_key=True, max_length=64)
+    day: date = Field(primary_key=True)
+    count: int = Field(default=0)
+    last_event_at: Optional[datetime]
+
+# Finer-grained counters, kept up to date the same way (see database/rollups.py)
+class HourlyEventCount(SQLModel, table=True):
+    # Rows per guild, hour, table and action ('' for tables without one)
+    guild_id: int = Field(default=0, primary_key=True)
+    hour: datetime = Field(primary_key=True, index=True)
+    table_name: str = Field(primary_key=True, max_length=64)
+    action: str = Field(default="", primary_key=True, max_length=64)
+    count: int = Field(default=0)
+
+class ChannelDayCount(SQLModel, table=True):
+    # Rows per guild, day, table and channel
+    guild_id: int = Field(default=0, primary_key=True)
+    day: date = Field(primary_key=True, index=True)
+    table_name: str = Field(primary_key=True, max_length=64)
+    channel_id: int = Field(primary_key=True)
+    count: int = Field(default=0)
+
+class MemberDayCount(SQLModel, table=True):
+    # Rows per guild, day, table and member
+    guild_id: int = Field(default=0, primary_key=True)
+    day: date = Field(primary_key=True, index=True)
+    table_name: str = Field(primary_key=True, max_length=64)
+    member_id: int = Field(primary_key=True)
+    count: int = Field(default=0)
+
+class TableVersion(SQLModel, table=True):
+    # Bumped by every transaction that changes the table (see database/versions.py)
+    table_name: str = Field(primary_key=True, max_length=64)
+    version: int = Field(default=0)
+    updated_at: Optional[datetime]
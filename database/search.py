@@ -0,0 +1,212 @@
+"""
+Full-text search over logged message content.
+
+On SQLite, message text is indexed in FTS5 external-content tables
+(message_fts for Message.content, editedmessage_fts for the before/after
+text of EditedMessage). Triggers keep them in sync, so every insert the bot's
+writer makes, every edit it applies and every row retention removes updates
+the index in the same transaction. On PostgreSQL the same role is played by
+GIN indexes on to_tsvector() expressions.
+
+create_search_indexes() is called by the migrations and builds the index for
+rows that already exist. The index can be rebuilt from scratch at any time:
+
+    python -m database.search rebuild
+"""
+import sys
+import time
+
+from sqlalchemy import inspect, text
+
+# Search scopes: which table is searched and how its rows relate to Message
+SCOPES = {
+    "messages": {
+        "table": "message",
+        "fts_table": "message_fts",
+        "columns": ["content"],
+        "message_id": "message.id",
+        "timestamp": "message.created_at",
+    },
+    "edits": {
+        "table": "editedmessage",
+        "fts_table": "editedmessage_fts",
+        "columns": ["content_before", "content_after"],
+        "message_id": "editedmessage.message_id",
+        "timestamp": "editedmessage.edited_at",
+    },
+}
+
+# Backends with a full-text index; on others the dashboard hides search
+SUPPORTED_DIALECTS = ("sqlite", "postgresql")
+
+# Wrapped around matched terms in snippets; the dashboard turns them into <mark>
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+def _sqlite_statements(scope):
+    table, fts_table, columns = scope["table"], scope["fts_table"], scope["columns"]
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts_table} USING fts5({column_list}, content='{table}', content_rowid='id')",
+        f"""CREATE TRIGGER {fts_table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END""",
+        f"""CREATE TRIGGER {fts_table}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END""",
+        f"""CREATE TRIGGER {fts_table}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END""",
+    ]
+
+
+def _postgres_document(scope):
+    parts = " || ' ' || ".join(f"coalesce({scope['table']}.{c}, '')" for c in scope["columns"])
+    return f"to_tsvector('simple', {parts})"
+
+
+def create_search_indexes(engine):
+    """
+    Create the full-text indexes (and, on SQLite, the triggers keeping them in
+    sync) if they don't exist yet, indexing the rows already stored.
+    """
+    dialect = engine.dialect.name
+    inspector = inspect(engine)
+    for scope in SCOPES.values():
+        if dialect == "sqlite":
+            if inspector.has_table(scope["fts_table"]):
+                continue
+            start = time.perf_counter()
+            with engine.begin() as connection:
+                for statement in _sqlite_statements(scope):
+                    connection.execute(text(statement))
+                connection.execute(text(f"INSERT INTO {scope['fts_table']}({scope['fts_table']}) VALUES ('rebuild')"))
+            print(f"Created search index {scope['fts_table']} in {time.perf_counter() - start:.2f}s")
+        elif dialect == "postgresql":
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{scope['table']}_fts ON {scope['table']} USING GIN ({_postgres_document(scope)})"
+                ))
+
+
+def rebuild_search_indexes(engine):
+    """
+    Re-index every stored message from scratch.
+    """
+    for scope in SCOPES.values():
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            if engine.dialect.name == "sqlite":
+                connection.execute(text(f"INSERT INTO {scope['fts_table']}({scope['fts_table']}) VALUES ('rebuild')"))
+            elif engine.dialect.name == "postgresql":
+                connection.execute(text(f"REINDEX INDEX ix_{scope['table']}_fts"))
+        print(f"Rebuilt search index for {scope['table']} in {time.perf_counter() - start:.2f}s")
+
+
+def search_supported(engine):
+    """
+    Whether full-text search works on `engine`'s backend (SQLite or PostgreSQL).
+    """
+    return engine.dialect.name in SUPPORTED_DIALECTS
+
+
+def _fts5_query(query):
+    # Quote every term so user input can't be parsed as FTS5 syntax; terms are ANDed
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def search(session, query, scope="messages", member_id=None, channel_id=None, since=None, until=None, limit=50, offset=0, guild_id=None):
+    """
+    Search logged message text, best matches first.
+
+    Args:
+        session: Open database session
+        query (str): Words to look for (all of them must match)
+        scope (str): "messages" for current message content, "edits" for edit history
+        member_id (int): Only messages from this member
+        channel_id (int): Only messages in this channel
+        since (datetime): Only messages sent (or edits made) at or after this time
+        until (datetime): Only messages sent (or edits made) before this time
+        limit (int): Maximum number of results
+        offset (int): Number of results to skip
+        guild_id (int): Only messages in this guild
+
+    Returns:
+        list: Rows with message_id, member_id, channel_id, timestamp, rank and snippet
+
+    Raises:
+        ValueError: The database is neither SQLite nor PostgreSQL (see search_supported())
+    """
+    spec = SCOPES[scope]
+    dialect = session.get_bind().dialect.name
+    if dialect not in SUPPORTED_DIALECTS:
+        raise ValueError(f"Full-text search needs SQLite or PostgreSQL, the database is {dialect}")
+    params = {"limit": limit, "offset": offset}
+
+    filters = []
+    if guild_id is not None:
+        filters.append("message.guild_id = :guild_id")
+        params["guild_id"] = guild_id
+    if member_id is not None:
+        filters.append("message.member_id = :member_id")
+        params["member_id"] = member_id
+    if channel_id is not None:
+        filters.append("message.channel_id = :channel_id")
+        params["channel_id"] = channel_id
+    if since is not None:
+        filters.append(f"{spec['timestamp']} >= :since")
+        params["since"] = since
+    if until is not None:
+        filters.append(f"{spec['timestamp']} < :until")
+        params["until"] = until
+
+    join_message = "" if spec["table"] == "message" else f"JOIN message ON message.id = {spec['message_id']}"
+    highlight = f"'{HIGHLIGHT_START}', '{HIGHLIGHT_END}'"
+
+    if dialect == "sqlite":
+        fts = spec["fts_table"]
+        params["query"] = _fts5_query(query)
+        if not params["query"]:
+            return []
+        snippet = f"snippet({fts}, -1, {highlight}, '…', 16)"
+        statement = f"""
+            SELECT {spec['message_id']} AS message_id, message.member_id, message.channel_id,
+                   {spec['timestamp']} AS timestamp, bm25({fts}) AS rank, {snippet} AS snippet
+            FROM {fts}
+            JOIN {spec['table']} ON {spec['table']}.id = {fts}.rowid
+            {join_message}
+            WHERE {fts} MATCH :query {''.join(' AND ' + f for f in filters)}
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        params["query"] = query
+        document = _postgres_document(spec)
+        text_value = " || ' ' || ".join(f"coalesce({spec['table']}.{c}, '')" for c in spec["columns"])
+        statement = f"""
+            SELECT {spec['message_id']} AS message_id, message.member_id, message.channel_id,
+                   {spec['timestamp']} AS timestamp, ts_rank({document}, q) AS rank,
+                   ts_headline('simple', {text_value}, q, 'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}') AS snippet
+            FROM {spec['table']}
+            {join_message}
+            CROSS JOIN websearch_to_tsquery('simple', :query) AS q
+            WHERE {document} @@ q {''.join(' AND ' + f for f in filters)}
+            ORDER BY rank DESC
+            LIMIT :limit OFFSET :offset
+        """
+
+    return session.execute(text(statement), params).all()
+
+
+if __name__ == "__main__":
+    from database.db import engine
+
+    if sys.argv[1:] == ["rebuild"]:
+        create_search_indexes(engine)
+        rebuild_search_indexes(engine)
+    else:
+        print("Usage: python -m database.search rebuild")
@@ -0,0 +1,100 @@
+"""
+Row counts for the dashboard's summary statistics.
+
+The bot's writer adds every batch it inserts to the EventCount table (one
+row per guild, table and day), so the dashboard can read totals, per-table and
+per-day breakdowns from a few hundred rows instead of counting the event
+tables. rebuild_event_counts() recomputes the table from scratch with one
+GROUP BY per table; migrations run it once when the table is empty.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import case, delete, func, insert, update
+from sqlmodel import select
+
+from database.schema import *
+
+# Tables that are counted, and the column that dates each of their rows
+TRACKED_TABLES = {
+    "message": Message.created_at,
+    "deletedmessage": DeletedMessage.deleted_at,
+    "editedmessage": EditedMessage.edited_at,
+    "voiceactivity": VoiceActivity.timestamp,
+    "guildactivity": GuildActivity.timestamp,
+    "memberactivity": MemberActivity.timestamp,
+}
+
+# Tables that make up the dashboard's "log entries" (stored messages aren't log entries)
+LOG_TABLES = ["deletedmessage", "editedmessage", "voiceactivity", "guildactivity", "memberactivity"]
+
+
+def _as_naive_utc(timestamp):
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def record_event_counts(session, rows_by_table):
+    """
+    Add freshly inserted rows to the per-day counters.
+
+    Args:
+        session: Session of the transaction that inserted the rows
+        rows_by_table (dict): Table name -> list of inserted row dicts
+    """
+    tallies = defaultdict(lambda: [0, None])
+    for table_name, rows in rows_by_table.items():
+        column = TRACKED_TABLES.get(table_name)
+        if column is None:
+            continue
+        for values in rows:
+            timestamp = values.get(column.key)
+            if timestamp is None:
+                continue
+            timestamp = _as_naive_utc(timestamp)
+            tally = tallies[(values.get("guild_id") or 0, table_name, timestamp.date())]
+            tally[0] += 1
+            if tally[1] is None or timestamp > tally[1]:
+                tally[1] = timestamp
+
+    for (guild_id, table_name, day), (count, latest) in tallies.items():
+        result = session.execute(
+            update(EventCount)
+            .where(EventCount.guild_id == guild_id, EventCount.table_name == table_name, EventCount.day == day)
+            .values(
+                count=EventCount.count + count,
+                last_event_at=case(
+                    (EventCount.last_event_at == None, latest),
+                    (EventCount.last_event_at < latest, latest),
+                    else_=EventCount.last_event_at
+                )
+            )
+        )
+        if result.rowcount == 0:
+            session.execute(insert(EventCount).values(guild_id=guild_id, table_name=table_name, day=day, count=count, last_event_at=latest))
+
+
+def rebuild_event_counts(session):
+    """
+    Recompute every counter from the event tables. The caller commits.
+    """
+    session.execute(delete(EventCount))
+    for table_name, column in TRACKED_TABLES.items():
+        guild_id = column.class_.guild_id
+        statement = (
+            select(func.coalesce(guild_id, 0), func.date(column), func.count(), func.max(column))
+            .where(column != None)
+            .group_by(func.coalesce(guild_id, 0), func.date(column))
+        )
+        rows = [
+            {"guild_id": guild, "table_name": table_name, "day": _parse_day(day), "count": count, "last_event_at": latest}
+            for guild, day, count, latest in session.exec(statement).all()
+        ]
+        if rows:
+            session.execute(insert(EventCount), rows)
+
+
+def _parse_day(day):
+    # SQLite's date() returns text, other backends return a date
+    return datetime.strptime(day, "%Y-%m-%d").date() if isinstance(day, str) else day
@@ -0,0 +1,112 @@
+"""
+Per-table change counters, for the dashboard's response cache.
+
+Every transaction that inserts, updates or deletes rows of a table adds one
+to that table's TableVersion row, in the same transaction. The dashboard
+reads the counters of the tables a page shows in one small query and keys
+its cached copy on them, so any change invalidates it: new rows, rows moved
+out by retention, and in-place updates such as an edited message or a
+renamed member.
+
+track_table_versions() hooks into every Session of the process; database/db.py
+installs it, so the bot's writer, the guild sync and retention all keep the
+counters. Statements run on a bare Connection (some migration steps) aren't
+counted; the dashboard's cache keys change with every deploy anyway.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from database.schema import TableVersion
+
+_installed = False
+
+
+def _changed_tables(session):
+    return session.info.setdefault("changed_tables", set())
+
+
+def _record_statement(state):
+    # INSERT/UPDATE/DELETE statements run through Session.execute()
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            _changed_tables(state.session).add(table.name)
+
+
+def _record_flush(session, flush_context):
+    # Objects added, changed or deleted through the ORM
+    changed = _changed_tables(session)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(instance, "__table__", None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            changed.add(table.name)
+
+
+def _bump_before_commit(session):
+    session.flush()
+    table_names = session.info.pop("changed_tables", None)
+    if table_names:
+        bump_versions(session, table_names)
+
+
+def _forget(session, *args):
+    session.info.pop("changed_tables", None)
+
+
+def bump_versions(session, table_names, now=None):
+    """
+    Add one to the version of each of `table_names`. The caller owns the transaction.
+    """
+    now = now or datetime.utcnow()
+    rows = [{"table_name": name, "version": 1, "updated_at": now} for name in sorted(table_names)]
+    table = TableVersion.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.table_name],
+            set_={"version": table.c.version + 1, "updated_at": statement.excluded.updated_at}
+        )
+        session.execute(statement, rows)
+        return
+
+    for row in rows:
+        result = session.execute(
+            update(table).where(table.c.table_name == row["table_name"]).values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            session.execute(insert(table), row)
+
+
+def read_versions(connection, table_names):
+    """
+    Current version and last change of each of `table_names`.
+
+    Returns:
+        dict: Table name -> (version, updated_at); tables never changed are missing
+    """
+    table = TableVersion.__table__
+    rows = connection.execute(
+        select(table.c.table_name, table.c.version, table.c.updated_at).where(table.c.table_name.in_(list(table_names)))
+    )
+    return {name: (version, updated_at) for name, version, updated_at in rows}
+
+
+def track_table_versions():
+    """
+    Bump the versions of the tables every Session of this process changes.
+    """
+    global _installed
+    if _installed:
+        return
+    event.listen(Session, "do_orm_execute", _record_statement)
+    event.listen(Session, "after_flush", _record_flush)
+    event.listen(Session, "before_commit", _bump_before_commit)
+    event.listen(Session, "after_rollback", _forget)
+    _installed = True
@@ -0,0 +1,251 @@
+"""
+Voice sessions and the per-day voice time built from them.
+
+The bot pairs the voice_join, voice_leave and voice_move events of a member
+into VoiceSession rows as they arrive: a join opens a session, a leave
+closes it, a move closes it and opens one in the new channel. Every session
+that ends is added to VoiceMemberDay and VoiceChannelDay (seconds per UTC
+day, split at midnight) and VoiceHour (seconds per hour, all members
+together), so "time in voice this week" is a sum over a few rollup rows
+instead of a replay of the event log. The bot queues each session update as
+the callback of its VoiceActivity row (WriteBehindQueue.add), so the event,
+its session and the rollups are committed together or not at all.
+
+A session left open by a bot that stopped is settled when the bot starts
+again (reconcile_sessions): it continues if the member is still in the same
+channel, otherwise it is closed at the last moment the bot is known to have
+been running. Members found in voice at startup whose join was missed get a
+session starting then. Either case is flagged `estimated`.
+
+rebuild_voice_sessions() replays the stored events once, for databases
+that have voice activity from before sessions were kept.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import delete, func, insert
+from sqlmodel import select
+
+from database.bulk import chunked, increment
+from database.rollups import start_of_hour
+from database.schema import *
+
+# Voice actions that open or close a session
+SESSION_ACTIONS = ("voice_join", "voice_leave", "voice_move")
+
+
+def _split(started_at, ended_at, truncate, step):
+    parts = []
+    while started_at < ended_at:
+        bucket = truncate(started_at)
+        end = min(bucket + step, ended_at)
+        parts.append((bucket, (end - started_at).total_seconds()))
+        started_at = end
+    return parts
+
+
+def split_by_day(started_at, ended_at):
+    """
+    Split the time between `started_at` and `ended_at` at every midnight.
+
+    Returns:
+        list: (day, seconds) pairs, one per day the time touches
+    """
+    midnight = lambda timestamp: datetime.combine(timestamp.date(), time())
+    return [(bucket.date(), seconds) for bucket, seconds in _split(started_at, ended_at, midnight, timedelta(days=1))]
+
+
+def split_by_hour(started_at, ended_at):
+    """
+    Split the time between `started_at` and `ended_at` at every full hour.
+
+    Returns:
+        list: (start of the hour, seconds) pairs, one per hour the time touches
+    """
+    return _split(started_at, ended_at, start_of_hour, timedelta(hours=1))
+
+
+def rollup_rows(sessions):
+    """
+    The VoiceMemberDay, VoiceChannelDay and VoiceHour rows of ended sessions.
+
+    Args:
+        sessions (iterable): Objects or dicts with guild_id, member_id,
+            channel_id, started_at and ended_at
+
+    Returns:
+        dict: Model -> list of row dicts (seconds rounded, sessions counted
+            on the day they started)
+    """
+    members = defaultdict(lambda: [0.0, 0])
+    channels = defaultdict(lambda: [0.0, 0])
+    hours = defaultdict(float)
+    for voice_session in sessions:
+        if isinstance(voice_session, dict):
+            voice_session = VoiceSession(**voice_session)
+        guild_id = voice_session.guild_id or 0
+        started_at = voice_session.started_at
+        members[(guild_id, started_at.date(), voice_session.member_id)][1] += 1
+        channels[(guild_id, started_at.date(), voice_session.channel_id)][1] += 1
+        for day, seconds in split_by_day(started_at, voice_session.ended_at):
+            members[(guild_id, day, voice_session.member_id)][0] += seconds
+            channels[(guild_id, day, voice_session.channel_id)][0] += seconds
+        for hour, seconds in split_by_hour(started_at, voice_session.ended_at):
+            hours[(guild_id, hour)] += seconds
+
+    return {
+        VoiceMemberDay: [
+            {"guild_id": guild_id, "day": day, "member_id": member_id, "seconds": round(seconds), "sessions": count}
+            for (guild_id, day, member_id), (seconds, count) in members.items()
+        ],
+        VoiceChannelDay: [
+            {"guild_id": guild_id, "day": day, "channel_id": channel_id, "seconds": round(seconds), "sessions": count}
+            for (guild_id, day, channel_id), (seconds, count) in channels.items()
+        ],
+        VoiceHour: [
+            {"guild_id": guild_id, "hour": hour, "seconds": round(seconds)}
+            for (guild_id, hour), seconds in hours.items()
+        ],
+    }
+
+
+def add_to_rollups(session, sessions):
+    """
+    Add ended sessions to VoiceMemberDay, VoiceChannelDay and VoiceHour.
+
+    Args:
+        session: Session of the transaction that closed them
+        sessions (iterable): The ended VoiceSession rows (or dicts)
+    """
+    for model, rows in rollup_rows(sessions).items():
+        increment(session, model, rows)
+
+
+def _close(session, open_sessions, at, estimated=False):
+    for voice_session in open_sessions:
+        voice_session.ended_at = max(at, voice_session.started_at)
+        voice_session.duration_seconds = round((voice_session.ended_at - voice_session.started_at).total_seconds())
+        voice_session.estimated = voice_session.estimated or estimated
+        session.add(voice_session)
+    add_to_rollups(session, open_sessions)
+
+
+def _open_sessions(session, guild_id, member_id=None):
+    statement = select(VoiceSession).where(VoiceSession.ended_at == None, VoiceSession.guild_id == guild_id)
+    if member_id is not None:
+        statement = statement.where(VoiceSession.member_id == member_id)
+    return session.exec(statement).all()
+
+
+def apply_voice_event(session, guild_id, member_id, action, from_channel_id, to_channel_id, at):
+    """
+    Open and/or close the member's session for one voice event. Other actions
+    (mutes, streams...) are ignored.
+
+    A join while a session is still open means its leave was missed; the old
+    session is then closed at the time of the join and flagged as estimated.
+
+    Args:
+        session: Session of the transaction that stores the event (pass the
+            update as the row's callback to WriteBehindQueue.add, never as a
+            separate callback, or the two can be committed apart)
+        at (datetime): Time of the event (naive UTC, like every stored timestamp)
+    """
+    if action not in SESSION_ACTIONS:
+        return
+    open_sessions = _open_sessions(session, guild_id, member_id)
+    if action == "voice_join":
+        _close(session, open_sessions, at, estimated=True)
+    else:
+        # The open session should be in from_channel_id; if not, an event was missed
+        _close(session, [s for s in open_sessions if s.channel_id == from_channel_id], at)
+        _close(session, [s for s in open_sessions if s.channel_id != from_channel_id], at, estimated=True)
+    if action in ("voice_join", "voice_move"):
+        session.add(VoiceSession(guild_id=guild_id, member_id=member_id, channel_id=to_channel_id, started_at=at))
+
+
+def reconcile_sessions(session, guild_id, voice_states, now, last_seen=None):
+    """
+    Settle a guild's sessions after the bot (re)connected.
+
+    Args:
+        session: Session to work in; the caller commits
+        guild_id (int): The guild
+        voice_states (dict): Member ID -> ID of the voice channel they are in now
+        now (datetime): Current time (naive UTC)
+        last_seen (datetime): Last time the previous run of the bot is known to
+            have been running; open sessions of members who left in between are
+            closed then (or now, if unknown)
+
+    Returns:
+        tuple: (sessions closed, sessions opened)
+    """
+    closed, continued = [], set()
+    for voice_session in _open_sessions(session, guild_id):
+        if voice_states.get(voice_session.member_id) == voice_session.channel_id and voice_session.member_id not in continued:
+            continued.add(voice_session.member_id)
+        else:
+            closed.append(voice_session)
+    end = min(last_seen or now, now)
+    _close(session, closed, end, estimated=True)
+
+    opened = [
+        VoiceSession(guild_id=guild_id, member_id=member_id, channel_id=channel_id, started_at=now, estimated=True)
+        for member_id, channel_id in voice_states.items()
+        if member_id not in continued
+    ]
+    session.add_all(opened)
+    return len(closed), len(opened)
+
+
+def last_recorded_event(session):
+    """
+    Time of the newest event the bot has stored (from the EventCount table),
+    or None if there is none.
+    """
+    return session.exec(select(func.max(EventCount.last_event_at))).one()
+
+
+def rebuild_voice_sessions(session, events):
+    """
+    Rebuild every session and rollup from stored voice events. The caller commits.
+
+    Args:
+        session: Session to write the sessions and rollups in
+        events (iterable): (guild_id, member_id, action, from_channel_id,
+            to_channel_id, timestamp) tuples in timestamp order
+
+    Returns:
+        int: Number of sessions written
+    """
+    session.execute(delete(VoiceSession))
+    session.execute(delete(VoiceMemberDay))
+    session.execute(delete(VoiceChannelDay))
+    session.execute(delete(VoiceHour))
+
+    open_sessions = {}
+    ended = []
+    for guild_id, member_id, action, from_channel_id, to_channel_id, timestamp in events:
+        if action not in SESSION_ACTIONS or timestamp is None:
+            continue
+        key = (guild_id, member_id)
+        current = open_sessions.pop(key, None)
+        if current is not None:
+            current["ended_at"] = timestamp
+            current["duration_seconds"] = round((timestamp - current["started_at"]).total_seconds())
+            current["estimated"] = action == "voice_join" or current["channel_id"] != from_channel_id
+            ended.append(current)
+        if action in ("voice_join", "voice_move"):
+            open_sessions[key] = {
+                "guild_id": guild_id, "member_id": member_id, "channel_id": to_channel_id,
+                "started_at": timestamp, "ended_at": None, "duration_seconds": None, "estimated": False
+            }
+
+    rows = ended + list(open_sessions.values())
+    for chunk in chunked(rows, 5000):
+        session.execute(insert(VoiceSession), chunk)
+
+    for model, rollups in rollup_rows(ended).items():
+        for chunk in chunked(rollups, 5000):
+            session.execute(insert(model), chunk)
+    return len(rows)
@@ -0,0 +1,230 @@
+import asyncio
+from collections import defaultdict
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session
+
+from database.metrics import Counter, Histogram
+from database.rollups import record_rollups
+from database.stats import record_event_counts
+
+
+class WriteBehindQueue:
+    """
+    Buffers rows produced by the bot's event handlers and writes them to the
+    database in batches from a background task.
+
+    Rows are grouped per table and inserted with one executemany per table,
+    all inside a single transaction, together with the matching EventCount
+    and activity rollup updates and the queued callbacks. A batch is flushed
+    once `max_batch_size` rows are pending or every `flush_interval` seconds,
+    whichever comes first.
+
+    A batch that fails is retried (up to `retries` times, with a doubling
+    delay waited on the event loop, not on a database thread, when the
+    database is locked). If it still fails, the operations
+    are written one per transaction in the order they were queued, so only
+    the ones that really fail are skipped. A row and the callback given with
+    it in add() stay in the same transaction even then.
+    The writes themselves run on the given DatabaseExecutor's thread pool.
+    After each commit, `on_commit` (if given) is called with the names of the
+    tables that got new rows.
+
+    Commit latency, rows written per table and failed writes are kept as
+    metrics for the bot's /metrics endpoint.
+    """
+
+    def __init__(self, db, max_batch_size=500, flush_interval=2.0, on_commit=None, retries=3, retry_delay=0.5):
+        self.db = db
+        self.on_commit = on_commit
+        self.engine = db.engine
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self._pending = []
+        self._in_flight = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+
+        self.commit_seconds = Histogram("discord_logger_db_commit_seconds", "Time to insert and commit one write batch")
+        self.rows_written = Counter("discord_logger_db_rows_written_total", "Rows inserted by the write queue", ["table"])
+        self.failed_writes = Counter("discord_logger_db_failed_writes_total", "Failed batches (kind=batch) and queued writes skipped on the one-by-one retry (kind=skipped)", ["kind"])
+
+    def add(self, row, callback=None):
+        """
+        Queue a SQLModel instance to be inserted on the next flush.
+
+        Args:
+            row (SQLModel): The row to insert
+            callback: Optional callable taking a Session, for updates that
+                belong to this row (e.g. the voice session of a voice event);
+                it always commits or fails together with the row
+        """
+        self._pending.append(("insert", row, callback))
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+
+    def add_callback(self, callback):
+        """
+        Queue a callable taking a Session, run after the inserts of the batch it
+        lands in (e.g. updating a row that might still be waiting to be inserted).
+        """
+        self._pending.append(("callback", callback, None))
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+
+    def find_pending(self, model, ids):
+        """
+        Rows of `model` with one of the given IDs that are queued or being
+        written but not committed yet, keyed by ID.
+        """
+        ids = set(ids)
+        return {
+            item.id: item
+            for kind, item, _ in self._in_flight + self._pending
+            if kind == "insert" and type(item) is model and item.id in ids
+        }
+
+    def pending_count(self):
+        """
+        Number of queued operations not handed to the database yet.
+        """
+        return len(self._pending)
+
+    def start(self):
+        """
+        Start the background flush task on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """
+        Write everything that is currently pending.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self._in_flight = batch
+            try:
+                await self._write(batch)
+            finally:
+                self._in_flight = []
+
+    async def close(self):
+        """
+        Stop the background task and flush whatever is left.
+        """
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _write(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.db.run(self._write_batch, batch)
+                return
+            except OperationalError as e:
+                # Usually "database is locked": another writer held the lock past busy_timeout.
+                # The wait happens here so it doesn't hold one of the database threads.
+                if attempt < self.retries:
+                    delay = self.retry_delay * 2 ** attempt
+                    print(f"Batch write failed ({e.orig}), retrying in {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                    continue
+                error = e
+            except Exception as e:
+                error = e
+            break
+
+        # One bad row (e.g. a duplicate message ID) or callback shouldn't drop the whole batch
+        print(f"Batch write failed ({getattr(error, 'orig', error)}), retrying one by one...")
+        self.failed_writes.inc(kind="batch")
+        await self.db.run(self._write_individually, batch)
+
+    def _write_batch(self, batch):
+        # Group inserts per table and per column set so each group is one executemany
+        groups = defaultdict(list)
+        callbacks = []
+        for kind, item, callback in batch:
+            if kind == "insert":
+                values = _values(item)
+                groups[(item.__table__, tuple(values))].append(values)
+                if callback is not None:
+                    callbacks.append(callback)
+            else:
+                callbacks.append(item)
+
+        with self.commit_seconds.time(), Session(self.engine) as session:
+            rows_by_table = defaultdict(list)
+            for (table, _), rows in groups.items():
+                session.execute(insert(table), rows)
+                rows_by_table[table.name].extend(rows)
+            record_event_counts(session, rows_by_table)
+            record_rollups(session, rows_by_table)
+            for callback in callbacks:
+                callback(session)
+            session.commit()
+        for table_name, rows in rows_by_table.items():
+            self.rows_written.inc(len(rows), table=table_name)
+        self._committed(rows_by_table)
+
+    def _write_individually(self, batch):
+        # Each queued operation in its own transaction, in queue order
+        committed = defaultdict(int)
+        for kind, item, callback in batch:
+            name = item.__table__.name if kind == "insert" else "callback"
+            with Session(self.engine) as session:
+                try:
+                    if kind == "insert":
+                        values = _values(item)
+                        session.execute(insert(item.__table__), values)
+                        record_event_counts(session, {name: [values]})
+                        record_rollups(session, {name: [values]})
+                        if callback is not None:
+                            callback(session)
+                    else:
+                        item(session)
+                    session.commit()
+                except Exception as e:
+                    session.rollback()
+                    print(f"Skipped queued write ({name}): {e}")
+                    self.failed_writes.inc(kind="skipped")
+                    continue
+            if kind == "insert":
+                committed[name] += 1
+                self.rows_written.inc(table=name)
+        self._committed(committed)
+
+    def _committed(self, table_names):
+        if self.on_commit is not None and table_names:
+            try:
+                self.on_commit(set(table_names))
+            except Exception as e:
+                print(f"Commit notification failed: {e}")
+
+
+def _values(row):
+    # Column values to insert; a missing ID is left to the database
+    values = row.model_dump()
+    if values.get("id") is None:
+        values.pop("id", None)
+    return values
@@ -0,0 +1,130 @@
+"""
+Metrics and sampled profiling of the bot's event handlers.
+
+Handlers decorated with @instrumented are counted and timed per event type
+(the handler's name without "on_"). A handler that raises is counted as an
+error and the exception goes on to discord.py's on_error as before. On every
+scrape BotMetrics also reads the write queue, the database pool, the log
+dispatcher, the event loop monitor and the gateway latency of every shard.
+
+    BOT_METRICS_PORT     http://127.0.0.1:<port>/metrics (default 9108, 0 disables it)
+    PROFILE_SAMPLE_RATE  fraction of handler calls run under cProfile (default 0)
+    PROFILE_DIR          where profiles are written, as bot-<event>.<pid>.prof (default "profiles")
+"""
+import functools
+import math
+import os
+import time
+
+from database.metrics import Counter, Gauge, Histogram, MetricsServer, Registry, SampledProfiler
+
+
+def instrumented(handler):
+    """
+    Count and time every call of an event handler method.
+    """
+    event = handler.__name__.removeprefix("on_")
+
+    @functools.wraps(handler)
+    async def wrapper(client, *args, **kwargs):
+        metrics = getattr(client, "metrics", None)
+        if metrics is None:
+            # Events that arrive before setup_hook() has run
+            return await handler(client, *args, **kwargs)
+        return await metrics.observe_handler(event, handler(client, *args, **kwargs))
+
+    return wrapper
+
+
+class BotMetrics:
+    """
+    The bot's metrics registry, its /metrics endpoint and the handler profiler.
+    Created in setup_hook(), once the components it reads exist.
+    """
+
+    def __init__(self, client, port=None, sample_rate=None, profile_dir=None):
+        self.client = client
+        self.registry = Registry()
+        self.events = self.registry.register(Counter("discord_logger_events_total", "Gateway events handled, per event type", ["event"]))
+        self.errors = self.registry.register(Counter("discord_logger_handler_errors_total", "Handlers that raised, per event type", ["event"]))
+        self.handler_seconds = self.registry.register(
+            Histogram("discord_logger_handler_seconds", "Time a handler took, awaits included, per event type", ["event"])
+        )
+
+        # Kept by the components themselves
+        for metric in (
+            client.writer.commit_seconds, client.writer.rows_written, client.writer.failed_writes,
+            client.dispatcher.send_seconds, client.loop_monitor.lag_seconds,
+        ):
+            self.registry.register(metric)
+        self.registry.add_collector(self.collect)
+
+        port = int(os.getenv("BOT_METRICS_PORT") or 9108) if port is None else port
+        self.server = MetricsServer(self.registry, port) if port else None
+        self.profiler = SampledProfiler(
+            float(os.getenv("PROFILE_SAMPLE_RATE") or 0) if sample_rate is None else sample_rate,
+            profile_dir or os.getenv("PROFILE_DIR") or "profiles"
+        )
+        if self.profiler.enabled:
+            print(f"Profiling {self.profiler.sample_rate:.1%} of event handler calls into {self.profiler.directory}/")
+
+    def start(self):
+        if self.server is not None:
+            self.server.start()
+
+    def close(self):
+        """
+        Stop the endpoint and write the profiles collected so far.
+        """
+        if self.server is not None:
+            self.server.stop()
+        self.profiler.dump()
+
+    async def observe_handler(self, event, coroutine):
+        self.events.inc(event=event)
+        start = time.perf_counter()
+        try:
+            if self.profiler.should_sample():
+                return await self.profiler.run(f"bot-{event}", coroutine)
+            return await coroutine
+        except Exception:
+            self.errors.inc(event=event)
+            raise
+        finally:
+            self.handler_seconds.observe(time.perf_counter() - start, event=event)
+
+    def collect(self):
+        # Runs on the endpoint's thread; only reads plain numbers the bot keeps
+        client = self.client
+        writer, dispatcher, db, loop_monitor = client.writer, client.dispatcher, client.db, client.loop_monitor
+
+        def counter(name, documentation, value):
+            metric = Counter(name, documentation)
+            metric.inc(value)
+            return metric
+
+        def gauge(name, documentation, value):
+            metric = Gauge(name, documentation)
+            metric.set(value)
+            return metric
+
+        latency = Gauge("discord_logger_gateway_latency_seconds", "Time between a heartbeat and its acknowledgement, per shard", ["shard"])
+        for shard_id, seconds in client.latencies:
+            if math.isfinite(seconds):
+                latency.set(seconds, shard=shard_id)
+
+        return [
+            latency,
+            gauge("discord_logger_guilds", "Guilds the bot is in", len(client.guilds)),
+            gauge("discord_logger_write_queue_pending", "Queued database writes not handed to the database yet", writer.pending_count()),
+            counter("discord_logger_db_calls_total", "Calls run on the database thread pool", db.calls),
+            counter("discord_logger_db_busy_seconds_total", "Time spent in calls on the database thread pool", db.busy_seconds),
+            gauge("discord_logger_log_queue_embeds", "Log embeds waiting to be sent, all log channels together", sum(dispatcher.queue_depths().values())),
+            counter("discord_logger_log_messages_sent_total", "Messages of log embeds sent", dispatcher.sent_messages),
+            counter("discord_logger_log_embeds_sent_total", "Log embeds sent", dispatcher.sent_embeds),
+            counter("discord_logger_log_messages_failed_total", "Messages of log embeds given up on", dispatcher.failed_messages),
+            counter("discord_logger_log_send_retries_total", "Sends retried after a rate limit or server error", dispatcher.retried_sends),
+            counter("discord_logger_log_embeds_dropped_total", "Log embeds dropped because their channel's backlog was full", dispatcher.dropped_embeds),
+            counter("discord_logger_event_loop_blocked_seconds_total", "Total time the event loop was late waking up tasks", loop_monitor.blocked_seconds),
+            counter("discord_logger_profiled_handler_calls_total", "Handler calls run under cProfile", self.profiler.samples),
+        ]
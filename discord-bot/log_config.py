@@ -0,0 +1,115 @@
+import json
+import os
+
+from sqlmodel import Session, select
+
+from database.bulk import upsert
+from database.schema import GuildConfig
+
+# Settings of a guild's log channels, as stored in GuildConfig
+CONFIG_KEYS = [
+    "log_category_id",
+    "deleted_messages_channel_id",
+    "edited_messages_channel_id",
+    "voice_activity_channel_id",
+    "guild_activity_channel_id",
+    "members_activity_channel_id",
+]
+
+
+# Run on the database pool: read and write the GuildConfig table
+def load_guild_configs(engine):
+    """
+    Read the log channel settings of every guild.
+
+    Returns:
+        dict: Guild ID -> dict of setting -> channel ID (unset settings left out)
+    """
+    with Session(engine) as session:
+        return {
+            config.guild_id: {key: getattr(config, key) for key in CONFIG_KEYS if getattr(config, key) is not None}
+            for config in session.exec(select(GuildConfig)).all()
+        }
+
+
+def save_guild_config(engine, guild_id, data):
+    with Session(engine) as session:
+        upsert(session, GuildConfig, [{"guild_id": guild_id, **{key: data.get(key) for key in CONFIG_KEYS}}])
+        session.commit()
+
+
+class LogChannelConfig:
+    """
+    In-memory copy of every guild's log channel settings.
+
+    The settings live in the GuildConfig table (one row per guild). The bot
+    reads them at startup and again every `reload_interval` seconds (see
+    MyClient.reload_log_config), so looking up a log channel from an event
+    handler is a dict lookup. Resolved channel objects are cached until the
+    settings change or the channel is deleted.
+    """
+
+    def __init__(self, client, legacy_path="discord-bot/log_channels.json", reload_interval=30.0):
+        self.client = client
+        self.legacy_path = legacy_path
+        self.reload_interval = reload_interval
+        self.enabled = os.getenv("LOG_TO_DISCORD", "false").lower() == "true"
+
+        self.data = {}
+        self._channels = {}
+
+    def update(self, data):
+        """
+        Make `data` (from load_guild_configs()) the current settings.
+        """
+        if data != self.data:
+            self.data = data
+            self._channels.clear()
+
+    def set_guild(self, guild_id, data):
+        """
+        Replace the settings of one guild (after they were saved).
+        """
+        self.data = {**self.data, guild_id: dict(data)}
+        self._channels = {key: channel for key, channel in self._channels.items() if key[0] != guild_id}
+
+    def read_legacy_file(self):
+        """
+        Settings from a log_channels.json written before they were stored per
+        guild, or None if there is no such file.
+        """
+        if not os.path.exists(self.legacy_path):
+            return None
+        try:
+            with open(self.legacy_path, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            print(f"Ignoring invalid {self.legacy_path}: {e}")
+            return None
+
+    def retire_legacy_file(self):
+        os.replace(self.legacy_path, self.legacy_path + ".imported")
+
+    def get_channel(self, guild_id, key):
+        """
+        Return the log channel of guild `guild_id` configured under `key`, or
+        None if logging to Discord is disabled or the channel can't be found.
+        """
+        if not self.enabled:
+            return None
+
+        channel = self._channels.get((guild_id, key))
+        if channel is None:
+            channel_id = self.data.get(guild_id, {}).get(key)
+            channel = self.client.get_channel(channel_id) if channel_id else None
+            if channel is None:
+                print(f"Log channel with ID {channel_id} not found for {key} in guild {guild_id}.")
+                return None
+            self._channels[(guild_id, key)] = channel
+        return channel
+
+    def forget_channel(self, channel_id):
+        """
+        Drop a cached channel object (e.g. after the channel was deleted).
+        """
+        self._channels = {key: channel for key, channel in self._channels.items() if channel.id != channel_id}
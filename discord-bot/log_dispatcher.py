@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+
+import discord
+
+from database.metrics import Histogram
+
+# Discord accepts up to 10 embeds and 6000 embed characters per message
+EMBEDS_PER_MESSAGE = 10
+CHARACTERS_PER_MESSAGE = 6000
+
+
+class LogDispatcher:
+    """
+    Sends log embeds to Discord log channels without blocking event handlers.
+
+    Each log channel gets its own queue and worker task. The worker waits
+    `flush_delay` seconds for a burst to pile up and packs up to 10 embeds
+    into each message. It sends at most `rate` messages per `per` seconds,
+    which keeps it under the channel's rate-limit bucket, and backs off
+    exponentially on 429s, server errors and network errors. Once a channel has
+    `max_backlog` embeds waiting, new ones are dropped and counted. A summary
+    embed then reports how many were lost.
+    """
+
+    def __init__(self, flush_delay=1.0, max_backlog=500, rate=5, per=5.0, max_retries=5):
+        self.flush_delay = flush_delay
+        self.max_backlog = max_backlog
+        self.rate = rate
+        self.per = per
+        self.max_retries = max_retries
+
+        self._queues = defaultdict(deque)
+        self._channels = {}
+        self._wakeups = defaultdict(asyncio.Event)
+        self._tasks = {}
+        self._dropped = defaultdict(int)
+        self._closing = False
+
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.failed_messages = 0
+        self.dropped_embeds = 0
+        self.retried_sends = 0
+        self.send_seconds = Histogram(
+            "discord_logger_embed_send_seconds", "Time to send one message of log embeds, retries included", ["outcome"]
+        )
+
+    def send(self, channel, embed):
+        """
+        Queue `embed` for `channel`. Never blocks.
+        """
+        queue = self._queues[channel.id]
+        if len(queue) >= self.max_backlog:
+            self._dropped[channel.id] += 1
+            self.dropped_embeds += 1
+            return
+
+        queue.append(embed)
+        self._channels[channel.id] = channel
+        task = self._tasks.get(channel.id)
+        if (task is None or task.done()) and not self._closing:
+            task = self._tasks[channel.id] = asyncio.create_task(self._worker(channel.id))
+            task.add_done_callback(lambda task, channel_id=channel.id: self._worker_done(channel_id, task))
+        self._wakeups[channel.id].set()
+
+    def queue_depths(self):
+        """
+        Number of embeds waiting per log channel ID.
+        """
+        # list() copies the items in one step, so the metrics thread can call this too
+        return {channel_id: len(queue) for channel_id, queue in list(self._queues.items())}
+
+    async def close(self, timeout=10.0):
+        """
+        Send whatever is queued (waiting at most `timeout` seconds) and stop the workers.
+        """
+        self._closing = True
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"Dropped {sum(self.queue_depths().values())} queued log embeds on shutdown")
+
+    async def _worker(self, channel_id):
+        queue = self._queues[channel_id]
+        wakeup = self._wakeups[channel_id]
+        sent_at = deque()
+
+        while True:
+            if not queue and not self._dropped[channel_id]:
+                if self._closing:
+                    break
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            # Give a burst a moment to pile up so it goes out as one message
+            if len(queue) < EMBEDS_PER_MESSAGE and not self._closing:
+                await asyncio.sleep(self.flush_delay)
+
+            await self._wait_for_rate_limit(sent_at)
+            batch = self._take_batch(channel_id)
+            if batch:
+                await self._deliver(self._channels[channel_id], batch)
+                sent_at.append(time.monotonic())
+
+    def _worker_done(self, channel_id, task):
+        # A worker that crashed is forgotten too, so the next send() starts a new one
+        if self._tasks.get(channel_id) is task:
+            del self._tasks[channel_id]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Log channel worker for {channel_id} crashed: {task.exception()!r}")
+
+    async def _wait_for_rate_limit(self, sent_at):
+        while len(sent_at) >= self.rate:
+            wait = sent_at[0] + self.per - time.monotonic()
+            if wait <= 0:
+                sent_at.popleft()
+            else:
+                await asyncio.sleep(wait)
+
+    def _take_batch(self, channel_id):
+        queue = self._queues[channel_id]
+        batch = []
+        characters = 0
+
+        # Report dropped embeds first so the gap is visible where it happened
+        if self._dropped[channel_id]:
+            summary = discord.Embed(
+                title="Log backlog overflow",
+                description=f"{self._dropped[channel_id]} log entries were dropped because more than {self.max_backlog} were waiting to be sent.",
+                color=discord.Color.dark_red()
+            )
+            self._dropped[channel_id] = 0
+            batch.append(summary)
+            characters += len(summary)
+
+        while queue and len(batch) < EMBEDS_PER_MESSAGE:
+            size = len(queue[0])
+            if batch and characters + size > CHARACTERS_PER_MESSAGE:
+                break
+            batch.append(queue.popleft())
+            characters += size
+        return batch
+
+    async def _deliver(self, channel, batch):
+        start = time.perf_counter()
+        backoff = 1.0
+        for attempt in range(self.max_retries):
+            try:
+                await channel.send(embeds=batch)
+                self.sent_messages += 1
+                self.sent_embeds += len(batch)
+                self.send_seconds.observe(time.perf_counter() - start, outcome="sent")
+                return
+            except discord.Forbidden:
+                print(f"Bot does not have permissions to send messages in log channel {channel.name}")
+                break
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"Failed to send {len(batch)} log embeds to {channel.name}: {e}")
+                    break
+                retry_after = getattr(e, "retry_after", None) or backoff
+                print(f"Log channel {channel.name} is rate limited or unavailable, retrying in {retry_after:.1f}s")
+                self.retried_sends += 1
+                await asyncio.sleep(retry_after)
+                backoff *= 2
+            except Exception as e:
+                # Network errors (OSError, aiohttp.ClientError, timeouts) are usually transient
+                print(f"Sending to log channel {channel.name} failed ({e!r}), retrying in {backoff:.1f}s")
+                self.retried_sends += 1
+                await asyncio.sleep(backoff)
+                backoff *= 2
+        self.failed_messages += 1
+        self.send_seconds.observe(time.perf_counter() - start, outcome="failed")
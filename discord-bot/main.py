@@ -6,18 +6,154 @@ import json
 from datetime import datetime, timezone
 
 from sqlmodel import SQLModel, Session, select
+from sqlalchemy import delete, tuple_
 
+import asyncio
+import signal
 import sys
+import threading
+import time
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[1]))  # adds project root
 
 from database.schema import *
 from database.db import engine
+from database.bulk import chunked, upsert
+from database.executor import DatabaseExecutor, LoopLagMonitor
+from database.migrations import migrate
+from database.notify import ChangeNotifier
+from database.retention import CHUNK_PAUSE, archive_chunk, retention_cutoffs, retention_days
+from database.voice import SESSION_ACTIONS, apply_voice_event, last_recorded_event, reconcile_sessions
+from database.writer import WriteBehindQueue
+from instrumentation import BotMetrics, instrumented
+from log_config import CONFIG_KEYS, LogChannelConfig, load_guild_configs, save_guild_config
+from log_dispatcher import LogDispatcher
 
 # ==== End of imports ====
 
 # ==== Start of bot's logic ====
-class MyClient(discord.Client):
+# Sharded, so one process can log any number of guilds (one shard per ~1000 guilds)
+class MyClient(discord.AutoShardedClient):
+    async def setup_hook(self):
+        # Blocking database work runs on this pool, never on the event loop
+        self.db = DatabaseExecutor(engine, max_workers=int(os.getenv("DB_MAX_WORKERS") or 2))
+        self.loop_monitor = LoopLagMonitor(report_interval=float(os.getenv("LOOP_LAG_REPORT_INTERVAL") or 0))
+        self.loop_monitor.start()
+
+        # All event rows go through this queue instead of committing one by one;
+        # the dashboard's live feed is told about every commit
+        self.notifier = ChangeNotifier()
+        self.writer = WriteBehindQueue(
+            self.db,
+            max_batch_size=int(os.getenv("DB_WRITE_BATCH_SIZE") or 500),
+            flush_interval=float(os.getenv("DB_FLUSH_INTERVAL") or 2.0),
+            on_commit=self.notifier.notify
+        )
+        self.writer.start()
+
+        # Every guild's log channels are read once here and reloaded in the background
+        self.log_config = LogChannelConfig(self)
+        self.log_config_task = None
+        if self.log_config.enabled:
+            self.log_config.update(await self.db.run(load_guild_configs, engine))
+            self.log_config_task = asyncio.create_task(self.reload_log_config())
+
+        # Log embeds are queued per log channel and sent in batches
+        self.dispatcher = LogDispatcher(
+            flush_delay=float(os.getenv("LOG_FLUSH_DELAY") or 1.0),
+            max_backlog=int(os.getenv("LOG_MAX_BACKLOG") or 500)
+        )
+
+        # Old rows are moved to the monthly archives in the background
+        self.retention_stop = threading.Event()
+        self.retention_task = None
+        if retention_days():
+            self.retention_task = asyncio.create_task(self.run_retention_periodically())
+
+        # Last time the bot is known to have been connected (the newest stored event,
+        # later the last disconnect); voice sessions of members who left while it
+        # was away are closed then (see sync_guild)
+        self.last_seen = await self.db.run_in_session(last_recorded_event)
+
+        # Touched while connected, so run.py's supervisor can tell the bot is ready
+        self.heartbeat_file = os.getenv("BOT_HEARTBEAT_FILE") or "discord-bot/heartbeat"
+        self.heartbeat_task = asyncio.create_task(self.write_heartbeat())
+
+        # Handler, database, log channel and gateway metrics on a local /metrics endpoint
+        self.metrics = BotMetrics(self)
+        self.metrics.start()
+
+        self.flushed_on_close = False
+        # SIGTERM (sent by the supervisor) shuts down like Ctrl+C, flushing queued rows first
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except (NotImplementedError, AttributeError):
+            pass  # Not supported on Windows
+
+    async def close(self):
+        # Flush pending log embeds and rows before the connection goes away (only once,
+        # even if a signal and discord.py's own shutdown both call close())
+        if hasattr(self, "writer") and not self.flushed_on_close:
+            self.flushed_on_close = True
+            self.heartbeat_task.cancel()
+            if self.log_config_task is not None:
+                self.log_config_task.cancel()
+            if os.path.exists(self.heartbeat_file):
+                os.remove(self.heartbeat_file)
+            if self.retention_task is not None:
+                # Let a running archive job finish its current chunk
+                self.retention_stop.set()
+                self.retention_task.cancel()
+            await self.dispatcher.close()
+            await self.writer.close()
+            # Waits for a retention chunk that may still be running, off the event loop
+            await asyncio.to_thread(self.db.shutdown)
+            self.notifier.close()
+            self.loop_monitor.stop()
+            print(self.loop_monitor.summary())
+            self.metrics.close()
+        await super().close()
+
+    async def run_retention_periodically(self):
+        interval = float(os.getenv("RETENTION_INTERVAL_HOURS") or 24) * 3600
+        while not self.retention_stop.is_set():
+            try:
+                await self.archive_expired_rows()
+            except Exception as e:
+                print(f"Retention run failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def archive_expired_rows(self):
+        # One database call per chunk, with the pause awaited here, so the job
+        # shares the database threads with the writer instead of holding one
+        for table_name, cutoff in retention_cutoffs():
+            start = time.perf_counter()
+            moved = 0
+            while not self.retention_stop.is_set():
+                count = await self.db.run(archive_chunk, engine, table_name, cutoff)
+                if not count:
+                    break
+                moved += count
+                await asyncio.sleep(CHUNK_PAUSE)
+            if moved:
+                print(f"Archived {moved} rows from {table_name} in {time.perf_counter() - start:.2f}s")
+
+    async def write_heartbeat(self):
+        while True:
+            if self.is_ready() and not self.is_closed():
+                Path(self.heartbeat_file).touch()
+            await asyncio.sleep(15)
+
+    async def reload_log_config(self):
+        # Picks up log channel settings changed outside the bot
+        while True:
+            await asyncio.sleep(self.log_config.reload_interval)
+            try:
+                self.log_config.update(await self.db.run(load_guild_configs, engine))
+            except Exception as e:
+                print(f"Reloading the log channel settings failed: {e}")
+
+    @instrumented
     async def on_ready(self):
         
         # Setting things up
@@ -27,86 +163,112 @@ class MyClient(discord.Client):
         await self.change_presence(status=discord.Status.dnd, activity=activity)
         print("Bot presence set to: Watching 'for deleted messages'")
     
-        # Make sure the bot is logging one server only
-        if client.guilds.__len__() > 1:
-            print(f"The bot have joined {client.guilds.__len__()} guilds. Multiple guilds logging is not supported")
-            await client.close()
-            
-        # ========================================================
-
-        # Save all members
-        print("Saving all members...")
-        all_members_gen = client.get_all_members()
-        with Session(engine) as session:
-            for member in all_members_gen:
-                member_instance = Member(
-                    id= member.id,
-                    name= member.name,
-                    global_name=member.global_name,
-                    avatar_url=str(member.avatar),
-                    roles_json=json.dumps([role.id for role in member.roles]),
-                    created_at=member.created_at
-                )
-                
-                existing = session.get(Member, member_instance.id)
-                if existing:
-                    continue
-                
-                session.add(member_instance)
-                session.commit()
-        print("Saved all members")
-        
-        # Save all channels
-        print("Saving all channels...")
-        all_channels_gen = client.get_all_channels()
-        with Session(engine) as session:
-            for channel in all_channels_gen:
-                channel_instance = Channel(
-                    id=channel.id,
-                    name=channel.name,
-                    ch_type=str(channel.type)
-                )
-                
-                existing = session.get(Channel, channel_instance.id)
-                if existing:
-                    continue
-    
-                session.add(channel_instance)
-                session.commit()
-        print("Saved all channels")                   
-            
-        # Save all roles in the Guild.
-        print("Save all roles in the Guild...")
-        all_roles = client.guilds[0].roles
-        
-        with Session(engine) as session:
-            for role in all_roles:
-                role_instance = Role(
-                    id=role.id,
-                    name=role.name,
-                    color=f"#{role.color.value:06x}",
-                    permissions=role.permissions.value,
-                    created_at=role.created_at,
-                )
-                
-                existing = session.get(Role, role_instance.id)
-                if existing:
-                    continue
-    
-                session.add(role_instance)
-                session.commit()
-        
-        
-        # ==== Set Log Channels ====        
-        log_to_discord = os.getenv("LOG_TO_DISCORD", "false").lower()
-        if log_to_discord != "true":
+        # Save every guild's members, channels and roles, then make sure each has its log channels
+        for guild in self.guilds:
+            await self.sync_guild(guild)
+
+        if not self.log_config.enabled:
             return
-        
-        json_path = "discord-bot/log_channels.json"
-        with open(json_path, "r") as f:
-            log_data = json.load(f)
-        
-        guild = client.guilds[0]
+        await self.import_legacy_log_config()
+        for guild in self.guilds:
+            await self.setup_log_channels(guild)
+        print(f"Log channels verified/created successfully in {len(self.guilds)} guilds.")
+
+    @instrumented
+    async def on_disconnect(self):
+        """
+        Voice events can be missed from now until the next on_ready.
+        """
+        self.last_seen = datetime.utcnow()
+
+    @instrumented
+    async def on_guild_join(self, guild: discord.Guild):
+        """
+        Starts logging a guild the bot was just added to.
+        """
+        await self.sync_guild(guild)
+        if self.log_config.enabled:
+            await self.setup_log_channels(guild)
+
+    @instrumented
+    async def on_guild_update(self, before: discord.Guild, after: discord.Guild):
+        """
+        Keeps the stored guild name and icon up to date.
+        """
+        def update_guild(session, row=guild_row(after)):
+            upsert(session, Guild, [row])
+
+        self.writer.add_callback(update_guild)
+
+    async def sync_guild(self, guild):
+        """
+        Save a guild with its members, channels and roles (new rows are inserted, changed ones updated),
+        and settle the voice sessions that were open when the bot last saw it.
+        """
+        start = time.perf_counter()
+        members = guild.members
+        member_rows = [member_row(member) for member in members]
+        member_role_rows = [{"member_id": member.id, "role_id": role.id, "guild_id": guild.id} for member in members for role in member.roles]
+        channel_rows = [
+            {
+                "id": channel.id,
+                "guild_id": guild.id,
+                "name": channel.name,
+                "ch_type": str(channel.type)
+            }
+            for channel in guild.channels
+        ]
+        role_rows = [role_row(role) for role in guild.roles]
+        print(f"Collected {len(member_rows)} members, {len(channel_rows)} channels and {len(role_rows)} roles of {guild.name} in {time.perf_counter() - start:.2f}s")
+
+        await self.db.run(sync_guild_snapshot, guild_row(guild), member_rows, channel_rows, role_rows, member_role_rows)
+
+        # Queued behind any voice event already waiting, so sessions stay in event order
+        voice_states = {
+            member.id: channel.id
+            for channel in guild.voice_channels + guild.stage_channels
+            for member in channel.members
+            if not member.bot
+        }
+
+        def settle_voice_sessions(session, guild_id=guild.id, now=datetime.utcnow(), last_seen=self.last_seen):
+            closed, opened = reconcile_sessions(session, guild_id, voice_states, now, last_seen)
+            if closed or opened:
+                print(f"Voice sessions of guild {guild_id}: closed {closed} left open, opened {opened} for members already in voice")
+
+        self.writer.add_callback(settle_voice_sessions)
+
+    async def import_legacy_log_config(self):
+        """
+        Move the settings of a log_channels.json from before settings were kept
+        per guild into the GuildConfig table, then rename the file.
+        """
+        data = self.log_config.read_legacy_file()
+        if data is None:
+            return
+
+        # The file belongs to the guild its channels are in
+        channels = [self.get_channel(channel_id) for key, channel_id in data.items() if key in CONFIG_KEYS and channel_id]
+        guild_ids = {channel.guild.id for channel in channels if channel is not None}
+        if not guild_ids and len(self.guilds) == 1:
+            guild_ids = {self.guilds[0].id}
+        if len(guild_ids) != 1:
+            print(f"Can't tell which guild {self.log_config.legacy_path} belongs to, ignoring it")
+            return
+
+        guild_id = guild_ids.pop()
+        if guild_id not in self.log_config.data:
+            data = {key: data[key] for key in CONFIG_KEYS if data.get(key)}
+            await self.db.run(save_guild_config, engine, guild_id, data)
+            self.log_config.set_guild(guild_id, data)
+            print(f"Imported {self.log_config.legacy_path} as the log channels of guild {guild_id}")
+        self.log_config.retire_legacy_file()
+
+    async def setup_log_channels(self, guild):
+        """
+        Create the log category and channels a guild is missing.
+        """
+        log_data = dict(self.log_config.data.get(guild.id, {}))
         updated = False
 
         # Step 1: Create or fetch the log category
@@ -145,13 +307,10 @@ class MyClient(discord.Client):
 
         # Step 3: Save changes
         if updated:
-            with open(json_path, "w") as f:
-                json.dump(log_data, f, indent=4)
-
-        print("Log channels verified/created successfully.")
-
-        
+            await self.db.run(save_guild_config, engine, guild.id, log_data)
+            self.log_config.set_guild(guild.id, log_data)
 
+    @instrumented
     async def on_message(self, message: discord.Message):
         
         if message.author == self.user:
@@ -161,72 +320,153 @@ class MyClient(discord.Client):
         
         message_instance = Message(
             id=message.id,
+            guild_id=message.guild.id,
             member_id=message.author.id,
             channel_id=message.channel.id,
             content=message.clean_content,
             created_at=message.created_at
         )
-        with Session(engine) as session:
-            session.add(message_instance)
-            session.commit()
+        self.writer.add(message_instance)
         
     # Logging deleted messages
-    async def on_message_delete(self, message: discord.Message):
+    @instrumented
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
         """
-        This event is called when a message is deleted.
+        This event is called when a message is deleted, whether or not it is in discord.py's cache.
+        Uncached messages are looked up in our own Message table.
         """
-        # Ignore messages from the bot itself to prevent infinite loops if the bot deletes its own messages
-        if message.author == self.user:
+        # Ignore DMs, as messages can only be deleted in guilds for this purpose
+        if payload.guild_id is None:
             return
 
-        # Ignore DMs, as messages can only be deleted in guilds for this purpose
-        if message.guild is None:
+        cached = payload.cached_message
+        # Ignore messages from the bot itself to prevent infinite loops if the bot deletes its own messages
+        if cached is not None and cached.author == self.user:
             return
+
+        stored = None
+        if cached is None:
+            stored = (await self.lookup_messages([payload.message_id])).get(payload.message_id)
+            # Never seen by the bot (sent before it started logging, or one of its own messages)
+            if stored is None:
+                return
         
         # Get the current time when the message was deleted
         deleted_at = datetime.utcnow()
                 
         deleted_message_instance = DeletedMessage(
-        message_id=message.id,
+        guild_id=payload.guild_id,
+        message_id=payload.message_id,
         deleted_at=deleted_at
         )
-        with Session(engine) as session:
-            session.add(deleted_message_instance)
-            session.commit()
+        self.writer.add(deleted_message_instance)
                 
-        log_to_discord = os.getenv("LOG_TO_DISCORD", "false").lower()
-        if log_to_discord != "true":
-            return
         # Find the log channel
-        log_channels_json = get_log_channel_json()
-        log_channel = self.get_channel(log_channels_json.get("deleted_messages_channel_id"))
+        log_channel = self.log_config.get_channel(payload.guild_id, "deleted_messages_channel_id")
         if not log_channel:
-            print(f"Log channel with ID {log_channel} not found.")
             return
 
+        if cached is not None:
+            author, author_id, content, sent_at = cached.author, cached.author.id, cached.content, cached.created_at
+        else:
+            guild = self.get_guild(payload.guild_id)
+            author = guild.get_member(stored.member_id) if guild else None
+            author_id, content, sent_at = stored.member_id, stored.content, stored.created_at
+
         # Create an embed for a cleaner look (for Discord channel logging)
         embed = discord.Embed(
             title="Message Deleted",
-            description=f"**Content:**\n```\n{message.content}\n```",
+            description=f"**Content:**\n```\n{content}\n```",
             color=discord.Color.red() # A common color for deletion events
         )
 
-        embed.set_author(name=f"{message.author.display_name} ({message.author})", icon_url=message.author.avatar)
-        embed.add_field(name="Channel", value=message.channel.mention, inline=True)
-        embed.add_field(name="Message ID", value=message.id, inline=True)
-        embed.add_field(name="Author ID", value=message.author.id, inline=True)
-        embed.add_field(name="Sent at", value=message.created_at.strftime('%Y-%m-%d %H:%M:%S UTC'), inline=False) # Changed to inline=False for better layout
+        if author is not None:
+            embed.set_author(name=f"{author.display_name} ({author})", icon_url=author.avatar)
+        else:
+            embed.set_author(name=f"Unknown member ({author_id})")
+        embed.add_field(name="Channel", value=f"<#{payload.channel_id}>", inline=True)
+        embed.add_field(name="Message ID", value=payload.message_id, inline=True)
+        embed.add_field(name="Author ID", value=author_id, inline=True)
+        if sent_at:
+            embed.add_field(name="Sent at", value=sent_at.strftime('%Y-%m-%d %H:%M:%S UTC'), inline=False) # Changed to inline=False for better layout
         embed.add_field(name="Deleted at", value=deleted_at.strftime('%Y-%m-%d %H:%M:%S UTC'), inline=False) # Add this new field
 
-        try:
-            await log_channel.send(embed=embed)
-            # print(f"Sent deleted message log to Discord channel {log_channel.name}")
-        except discord.Forbidden:
-            print(f"Bot does not have permissions to send messages in log channel {log_channel.name}")
-        except discord.HTTPException as e:
-            print(f"Failed to send deleted message log to Discord: {e}")
+        self.dispatcher.send(log_channel, embed)
+
+    # Logging purges
+    @instrumented
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        """
+        This event is called when messages are bulk deleted (e.g. a purge).
+        All deletions are recorded in one batch and summarized in a single embed.
+        """
+        if payload.guild_id is None:
+            return
+
+        cached = {message.id: message for message in payload.cached_messages}
+        stored = await self.lookup_messages([i for i in payload.message_ids if i not in cached])
+
+        deleted_at = datetime.utcnow()
+        guild = self.get_guild(payload.guild_id)
+        deleted = []  # (sent at, author name, content) of every recorded message
+        for message_id in payload.message_ids:
+            if message_id in cached:
+                message = cached[message_id]
+                if message.author == self.user:
+                    continue
+                deleted.append((message.created_at.replace(tzinfo=None), message.author.display_name, message.content))
+            elif message_id in stored:
+                message = stored[message_id]
+                author = guild.get_member(message.member_id) if guild else None
+                sent_at = message.created_at.replace(tzinfo=None) if message.created_at else datetime.min
+                deleted.append((sent_at, author.display_name if author else str(message.member_id), message.content))
+            else:
+                continue
+
+            self.writer.add(DeletedMessage(guild_id=payload.guild_id, message_id=message_id, deleted_at=deleted_at))
+
+        if not deleted:
+            return
+
+        log_channel = self.log_config.get_channel(payload.guild_id, "deleted_messages_channel_id")
+        if not log_channel:
+            return
+
+        # One line per message, oldest first, cut off before the embed description limit
+        lines = []
+        length = 0
+        for sent_at, author_name, content in sorted(deleted, key=lambda item: item[0]):
+            content = (content or "").replace("\n", " ")
+            line = f"**{author_name}**: {content[:100]}{'…' if len(content) > 100 else ''}"
+            if length + len(line) + 1 > 3900:
+                lines.append(f"*…and {len(deleted) - len(lines)} more*")
+                break
+            lines.append(line)
+            length += len(line) + 1
+
+        embed = discord.Embed(
+            title=f"{len(deleted)} Messages Deleted",
+            description="\n".join(lines),
+            color=discord.Color.red()
+        )
+        embed.add_field(name="Channel", value=f"<#{payload.channel_id}>", inline=True)
+        embed.add_field(name="Not Logged", value=len(payload.message_ids) - len(deleted), inline=True)
+        embed.add_field(name="Deleted at", value=deleted_at.strftime('%Y-%m-%d %H:%M:%S UTC'), inline=False)
+
+        self.dispatcher.send(log_channel, embed)
+
+    async def lookup_messages(self, message_ids):
+        """
+        Messages we stored for the given IDs, including ones still waiting in the write queue.
+        """
+        found = self.writer.find_pending(Message, message_ids)
+        missing = [message_id for message_id in message_ids if message_id not in found]
+        if missing:
+            found.update({message.id: message for message in await self.db.run(load_messages, missing)})
+        return found
     
     # Logging edited messages
+    @instrumented
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
         """
         This event is called when a message is edited.
@@ -247,6 +487,7 @@ class MyClient(discord.Client):
         edited_at = datetime.utcnow()
 
         edited_message_instance = EditedMessage(
+            guild_id=after.guild.id,
             message_id=after.id,
             content_before=before.clean_content,
             content_after=after.clean_content,
@@ -254,25 +495,19 @@ class MyClient(discord.Client):
         )
 
         # Update the message content and is_edited flag in Message table
-        with Session(engine) as session:
+        def update_message(session):
             statement = select(Message).where(Message.id == after.id)
             message_to_update = session.exec(statement).first()
             if message_to_update:
                 message_to_update.content = after.clean_content
                 message_to_update.is_edited = True
                 session.add(message_to_update)
-            
-            session.add(edited_message_instance)
-            session.commit()
+
+        self.writer.add(edited_message_instance, update_message)
         
-        log_to_discord = os.getenv("LOG_TO_DISCORD", "false").lower()
-        if log_to_discord != "true":
-            return
         # Get the log channel
-        log_channels_json = get_log_channel_json()
-        log_channel = self.get_channel(log_channels_json.get("edited_messages_channel_id"))
+        log_channel = self.log_config.get_channel(after.guild.id, "edited_messages_channel_id")
         if not log_channel:
-            print(f"Log channel with ID {log_channel} not found for edited messages.")
             return
 
         # Create an embed for Discord channel logging
@@ -296,15 +531,10 @@ class MyClient(discord.Client):
         # Add the "Jump to Message" link
         embed.add_field(name="Jump to Message", value=f"[Click Here]({after.jump_url})", inline=False)
 
-        try:
-            await log_channel.send(embed=embed)
-            print(f"Sent edited message log to Discord channel {log_channel.name}")
-        except discord.Forbidden:
-            print(f"Bot does not have permissions to send messages in log channel {log_channel.name}")
-        except discord.HTTPException as e:
-            print(f"Failed to send edited message log to Discord: {e}")
+        self.dispatcher.send(log_channel, embed)
 
     # Logging Voice channels
+    @instrumented
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         """
         This event is called when a member's voice state changes.
@@ -379,6 +609,7 @@ class MyClient(discord.Client):
         details_json = json.dumps(details) if details else None
         
         voice_activity_instance = VoiceActivity(
+            guild_id=member.guild.id,
             action=log_type,
             member_id=member.id,
             from_channel_id=from_channel_id,
@@ -387,19 +618,17 @@ class MyClient(discord.Client):
             details=details_json
         )
         
-        with Session(engine) as session:
-            session.add(voice_activity_instance)
-            session.commit()
+        # Joins, leaves and moves open and close the member's voice session, in the event's transaction
+        update_voice_session = None
+        if log_type in SESSION_ACTIONS:
+            def update_voice_session(session, guild_id=member.guild.id, member_id=member.id, action=log_type):
+                apply_voice_event(session, guild_id, member_id, action, from_channel_id, to_channel_id, current_time_utc)
+
+        self.writer.add(voice_activity_instance, update_voice_session)
 
         # Get the log channel
-        log_to_discord = os.getenv("LOG_TO_DISCORD", "false").lower()
-        if log_to_discord != "true":
-            return
-        # Get the log channel
-        log_channels_json = get_log_channel_json()
-        log_channel = self.get_channel(log_channels_json.get("voice_activity_channel_id"))
+        log_channel = self.log_config.get_channel(member.guild.id, "voice_activity_channel_id")
         if not log_channel:
-            print(f"Log channel with ID {log_channel} not found for voice state updates.")
             return
 
         embed = None
@@ -530,15 +759,9 @@ class MyClient(discord.Client):
             embed.set_author(name=f"{member.display_name} ({member})", icon_url=member.avatar)
             embed.add_field(name="User ID", value=member.id, inline=True)
             embed.set_footer(text=f"ID: {member.id} • {current_time_utc.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+            self.dispatcher.send(log_channel, embed)
 
-            try:
-                await log_channel.send(embed=embed)
-                print(f"Sent {log_type} log to Discord channel {log_channel.name}")
-            except discord.Forbidden:
-                print(f"Bot does not have permissions to send messages in log channel {log_channel.name}")
-            except discord.HTTPException as e:
-                print(f"Failed to send {log_type} log to Discord: {e}")
-
+    @instrumented
     async def on_member_join(self, member: discord.Member):
         """
         Logs when a new member joins the guild.
@@ -549,17 +772,17 @@ class MyClient(discord.Client):
         current_time_utc = datetime.utcnow()
         
         guild_activity_instance = GuildActivity(
+            guild_id=member.guild.id,
             action="Join",
             member_id=member.id,
             timestamp=current_time_utc
         )
         
-        with Session(engine) as session:
-            session.add(guild_activity_instance)
-            session.commit()
+        self.writer.add(guild_activity_instance)
             
         # TODO: Send an embed
 
+    @instrumented
     async def on_member_remove(self, member: discord.Member):
         """
         Logs when a member leaves or is kicked from the guild.
@@ -571,17 +794,23 @@ class MyClient(discord.Client):
         current_time_utc = datetime.utcnow()
         
         guild_activity_instance = GuildActivity(
+            guild_id=member.guild.id,
             action="leave/kick",
             member_id=member.id,
             timestamp=current_time_utc
         )
         
-        with Session(engine) as session:
-            session.add(guild_activity_instance)
-            session.commit()
+        self.writer.add(guild_activity_instance)
+
+        # They no longer have any role in this guild
+        def remove_roles(session, member_id=member.id, guild_id=member.guild.id):
+            session.execute(delete(MemberRole).where(MemberRole.guild_id == guild_id, MemberRole.member_id == member_id))
+
+        self.writer.add_callback(remove_roles)
     
         # TODO: Send an embed
 
+    @instrumented
     async def on_member_update(self, before: discord.Member, after: discord.Member):
         """
         Logs when a member's roles are changed or when they are timed out.
@@ -592,76 +821,124 @@ class MyClient(discord.Client):
 
         current_time_utc = datetime.utcnow()
 
-        action = ""
-        if before.roles != after.roles:
-            role_id = None
-            added_roles = [role for role in after.roles if role not in before.roles]
-            removed_roles = [role for role in before.roles if role not in after.roles]
-            if added_roles:
-                action = "Role Added"
-                role_id = added_roles[0].id
-
-                # Update the member roles in Member table                
-                with Session(engine) as session:
-                    statement = select(Member).where(Member.id == after.id)
-                    member_to_update = session.exec(statement).one()
-                    current_roles = json.loads(member_to_update.roles_json or "[]")
-                    if role_id not in current_roles:
-                        current_roles.append(role_id)
-                    member_to_update.roles_json = json.dumps(current_roles)
-                    session.add(member_to_update)
-                    session.commit()
-                                    
-            elif removed_roles:
-                action = "Role Removed"
-                role_id = removed_roles[0].id
-                
-                # Update the member roles in Member table                
-                with Session(engine) as session:
-                    statement = select(Member).where(Member.id == after.id)
-                    member_to_update = session.exec(statement).one()
-                    current_roles = json.loads(member_to_update.roles_json or "[]")
-                    if role_id in current_roles:
-                        current_roles.remove(role_id)
-                    member_to_update.roles_json = json.dumps(current_roles)
-                    session.add(member_to_update)
-                    session.commit()
-
-            member_activity_instance = MemberActivity(
-                member_id=after.id,
-                action=action,
-                role_id=role_id,
-                timestamp=current_time_utc,
-            )
-            with Session(engine) as session:
-                session.add(member_activity_instance)
-                session.commit()
+        before_roles = {role.id: role for role in before.roles}
+        after_roles = {role.id: role for role in after.roles}
+        added_roles = [after_roles[role_id] for role_id in after_roles.keys() - before_roles.keys()]
+        removed_roles = [before_roles[role_id] for role_id in before_roles.keys() - after_roles.keys()]
+
+        if added_roles or removed_roles:
+            # Update the member's roles in the MemberRole table (the member and any new
+            # role are upserted first, as they may have appeared after the startup snapshot)
+            def update_roles(session, member=member_row(after), roles=[role_row(role) for role in added_roles], removed_ids=[role.id for role in removed_roles]):
+                upsert(session, Member, [member])
+                upsert(session, Role, roles)
+                upsert(session, MemberRole, [{"member_id": member["id"], "role_id": role["id"], "guild_id": role["guild_id"]} for role in roles])
+                if removed_ids:
+                    session.execute(delete(MemberRole).where(MemberRole.member_id == member["id"], MemberRole.role_id.in_(removed_ids)))
+
+            self.writer.add_callback(update_roles)
+
+            # One log entry per role, so several roles changed at once are all recorded
+            for action, roles in (("Role Added", added_roles), ("Role Removed", removed_roles)):
+                for role in sorted(roles, key=lambda role: role.position, reverse=True):
+                    member_activity_instance = MemberActivity(
+                        guild_id=after.guild.id,
+                        member_id=after.id,
+                        action=action,
+                        role_id=role.id,
+                        timestamp=current_time_utc,
+                    )
+                    self.writer.add(member_activity_instance)
                 
         # TODO: Timeout logging into database
         
         # TODO: Send an embed (use action to know what happened)
 
+    @instrumented
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        """
+        Drops a deleted log channel from the log channel cache.
+        """
+        self.log_config.forget_channel(channel.id)
+
+
+# Runs on the database pool: loads stored messages by ID
+def load_messages(message_ids):
+    messages = []
+    with Session(engine) as session:
+        for start in range(0, len(message_ids), 500):
+            statement = select(Message).where(Message.id.in_(message_ids[start:start + 500]))
+            messages.extend(session.exec(statement).all())
+    return messages
+
+# Rows for the Guild, Member and Role tables
+def guild_row(guild):
+    return {
+        "id": guild.id,
+        "name": guild.name,
+        "icon_url": str(guild.icon) if guild.icon else None,
+        "created_at": guild.created_at
+    }
+
+def member_row(member):
+    return {
+        "id": member.id,
+        "name": member.name,
+        "global_name": member.global_name,
+        "avatar_url": str(member.avatar),
+        "created_at": member.created_at
+    }
+
+def role_row(role):
+    return {
+        "id": role.id,
+        "guild_id": role.guild.id,
+        "name": role.name,
+        "color": f"#{role.color.value:06x}",
+        "permissions": role.permissions.value,
+        "created_at": role.created_at
+    }
+
+# Runs on the database pool: upserts the snapshot of one guild in a single transaction
+def sync_guild_snapshot(guild, member_rows, channel_rows, role_rows, member_role_rows):
+    with Session(engine) as session:
+        upsert(session, Guild, [guild])
+        for model, rows, label in ((Member, member_rows, "members"), (Channel, channel_rows, "channels"), (Role, role_rows, "roles")):
+            start = time.perf_counter()
+            upsert(session, model, rows)
+            print(f"Synced {len(rows)} {label} in {time.perf_counter() - start:.2f}s")
+        
+        # Only the memberships that changed since the last snapshot are written
+        start = time.perf_counter()
+        current = {(row["member_id"], row["role_id"]) for row in member_role_rows}
+        stored = set(session.exec(select(MemberRole.member_id, MemberRole.role_id).where(MemberRole.guild_id == guild["id"])).all())
+        added = [{"member_id": member_id, "role_id": role_id, "guild_id": guild["id"]} for member_id, role_id in current - stored]
+        removed = list(stored - current)
+        upsert(session, MemberRole, added)
+        for chunk in chunked(removed, 500):
+            session.execute(delete(MemberRole).where(tuple_(MemberRole.member_id, MemberRole.role_id).in_(chunk)))
+        print(f"Synced role memberships (+{len(added)} -{len(removed)}) in {time.perf_counter() - start:.2f}s")
+        
+        start = time.perf_counter()
+        session.commit()
+        print(f"Committed guild snapshot in {time.perf_counter() - start:.2f}s")
 
-# Public function
-def get_log_channel_json():
-    json_path = "discord-bot/log_channels.json"
-    with open(json_path, "r") as f:
-        log_data = json.load(f)
-        return log_data
-    
 # ==== End of bot's logic ====
 
 # ==== Start of Intents, permissions, and tokens ====
+load_dotenv()
 intents = discord.Intents.all()
 
-client = MyClient(intents=intents)
-load_dotenv()
+# BOT_SHARD_COUNT overrides the shard count Discord recommends
+client = MyClient(intents=intents, shard_count=int(os.getenv("BOT_SHARD_COUNT") or 0) or None)
 # ==== End of Intents, permissions, and tokens ====
 
 # ==== Start of main logic ====
 
-SQLModel.metadata.create_all(engine)
+# Only when run as a script, so benchmarks/bot_benchmark.py can import MyClient
+if __name__ == "__main__":
+    migrate(engine)
 
-client.run(os.getenv("BOT_TOKEN"))
+    client.run(os.getenv("BOT_TOKEN"))
 
 # ==== End of main logic ====
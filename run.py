@@ -1,30 +1,56 @@
-import threading
+import argparse
+import hashlib
+import importlib.util
 import subprocess
 import os
+import site
+import sys
 from dotenv import load_dotenv
 import shutil
 import json
 from datetime import datetime
 
+from supervisor import Supervisor, heartbeat_is_fresh, http_ok, python_component
+
 RED = '\033[31m'
 GREEN = '\033[32m'
 BLUE = '\033[34m'
 RESET = '\033[0m'
 
 
-def run_discord_bot():
-    subprocess.run(["python3", "./discord-bot/main.py"])
-
-def run_flask_app():
-    subprocess.run(["python3", "./web-dashboard/app.py"])
-    
-def check_requirements_installed():
+VALIDATION_CACHE = './.run_cache.json'
+
+def environment_fingerprint():
+    """Fingerprint of the interpreter, requirements.txt and installed packages."""
+    parts = [sys.executable]
+    if os.path.exists('./requirements.txt'):
+        with open('./requirements.txt', 'rb') as f:
+            parts.append(hashlib.sha1(f.read()).hexdigest())
+    # Installing or removing a package changes its site-packages directory
+    for directory in site.getsitepackages() + [site.getusersitepackages()]:
+        if os.path.isdir(directory):
+            parts.append(f"{directory}:{os.stat(directory).st_mtime_ns}")
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def check_requirements_installed(revalidate=False):
+    # `pip check` takes seconds, so it only runs when the environment changed since it last passed
+    fingerprint = environment_fingerprint()
+    if not revalidate and os.path.exists(VALIDATION_CACHE):
+        with open(VALIDATION_CACHE) as f:
+            try:
+                if json.load(f).get('requirements') == fingerprint:
+                    print(f"{GREEN}Requirements unchanged since the last check.{RESET}")
+                    return
+            except json.JSONDecodeError:
+                pass
     try:
-        subprocess.run(["pip", "check"], check=True)
+        subprocess.run([sys.executable, "-m", "pip", "check"], check=True)
         print(f"{GREEN}All requirements from requirements.txt are installed.{RESET}")
     except subprocess.CalledProcessError:
         print(f"{RED}Some requirements are not installed. Please check.{RESET}")
         exit()
+    with open(VALIDATION_CACHE, 'w') as f:
+        json.dump({'requirements': fingerprint}, f)
         
 def check_env_variable(env_file, var):
     if os.path.exists(env_file):
@@ -117,7 +143,29 @@ def backup_invalid_file(filepath):
     shutil.copyfile(filepath, backup_file_path)
     print(f"{BLUE}Copied invalid file to {backup_file_path}.{RESET}")
 
+def check_dashboard_server(server):
+    """Make sure the server picked for the dashboard can run here."""
+    if server not in ("dev", "gunicorn", "waitress"):
+        print(f"{RED}Unknown DASHBOARD_SERVER {server!r}, expected waitress, gunicorn or dev.{RESET}")
+        exit()
+    if server == "gunicorn" and sys.platform == "win32":
+        print(f"{RED}gunicorn doesn't run on Windows, use --server waitress.{RESET}")
+        exit()
+    if server != "dev" and importlib.util.find_spec(server) is None:
+        print(f"{RED}{server} is not installed (pip install {server}).{RESET}")
+        exit()
+    print(f"{GREEN}The dashboard will be served with {server}.{RESET}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the Discord bot and the web dashboard.")
+    parser.add_argument("--server", choices=["dev", "gunicorn", "waitress"], help="Server for the dashboard (default: DASHBOARD_SERVER from .env, or waitress)")
+    parser.add_argument("--workers", type=int, help="Dashboard worker processes (gunicorn only)")
+    parser.add_argument("--threads", type=int, help="Threads per dashboard worker")
+    parser.add_argument("--revalidate", action="store_true", help="Run `pip check` even if nothing changed since it last passed")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
         
     print("""
 o.OOOo.                                    o        o                                     
@@ -134,7 +182,7 @@ o.OOOo.                                    o        o
     print("\nThanks for downloadin the app!")
     print("Checking if everything is ready...")
     
-    check_requirements_installed()
+    check_requirements_installed(args.revalidate)
     
     check_env_exists()
     
@@ -144,6 +192,15 @@ o.OOOo.                                    o        o
 
     load_dotenv()
     check_valid_port(os.getenv("DASHBOARD_PORT"))
+    
+    # The dashboard reads its server settings from the environment it inherits
+    if args.server:
+        os.environ["DASHBOARD_SERVER"] = args.server
+    if args.workers:
+        os.environ["DASHBOARD_WORKERS"] = str(args.workers)
+    if args.threads:
+        os.environ["DASHBOARD_THREADS"] = str(args.threads)
+    check_dashboard_server(os.getenv("DASHBOARD_SERVER") or "waitress")
     check_file_exists('./web-dashboard/app.py')
     check_file_exists('./discord-bot/main.py')
     
@@ -174,14 +231,14 @@ o.OOOo.                                    o        o
 
     
     print("\nEverything looks good! Starting the app now...")
-    print(f"You can access the web dashboard on http://127.0.0.1:{os.getenv("DASHBOARD_PORT")}\n\n")
+    print(f"You can access the web dashboard on http://127.0.0.1:{os.getenv('DASHBOARD_PORT')}\n\n")
     print("==== START OF APPLICATION LOGS ====")
-    discord_thread = threading.Thread(target=run_discord_bot)
-    flask_thread = threading.Thread(target=run_flask_app)
-
-    discord_thread.start()
-    flask_thread.start()
-
-    discord_thread.join()
-    flask_thread.join()
-    
\ No newline at end of file
+    
+    # Both components run as child processes, restarted if they crash and stopped on Ctrl+C/SIGTERM
+    heartbeat_file = os.getenv("BOT_HEARTBEAT_FILE") or "discord-bot/heartbeat"
+    dashboard_health_url = f"http://127.0.0.1:{os.getenv('DASHBOARD_PORT')}/healthz"
+    supervisor = Supervisor([
+        python_component("discord-bot", "./discord-bot/main.py", lambda: heartbeat_is_fresh(heartbeat_file, 60)),
+        python_component("web-dashboard", "./web-dashboard/app.py", lambda: http_ok(dashboard_health_url)),
+    ], health_port=int(os.getenv("SUPERVISOR_HEALTH_PORT") or 0))
+    supervisor.run()
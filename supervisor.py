@@ -0,0 +1,211 @@
+"""
+Process supervisor used by run.py.
+
+Each component (the bot, the dashboard) runs as a direct child process.
+If one exits unexpectedly it is restarted after a delay that doubles on
+every quick crash (up to RESTART_MAX_DELAY seconds) and resets once it has
+stayed up for a while. SIGTERM/SIGINT are forwarded to the children, which
+get SHUTDOWN_TIMEOUT seconds to flush and exit before they are killed.
+
+With SUPERVISOR_HEALTH_PORT set, the supervisor answers on 127.0.0.1:
+
+    /livez   200 while every component is running
+    /readyz  200 once every component reports ready (the bot's heartbeat
+             file is fresh, the dashboard answers /healthz)
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESTART_MIN_DELAY = 1.0
+RESTART_MAX_DELAY = 60.0
+# A component that stayed up this long is considered healthy again
+STABLE_AFTER = 60.0
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT") or 20)
+
+
+class Component:
+    """
+    One supervised child process.
+
+    Args:
+        name (str): Name used in logs and health responses
+        command (list): Command line to start it
+        ready_check: Callable returning True once the component is ready
+    """
+
+    def __init__(self, name, command, ready_check=None):
+        self.name = name
+        self.command = command
+        self.ready_check = ready_check
+
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.delay = RESTART_MIN_DELAY
+        self.restart_at = None
+
+    def start(self):
+        # Own process group, so signals reach its children too (gunicorn workers, the reloader)
+        self.process = subprocess.Popen(self.command, start_new_session=os.name == "posix")
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        print(f"[supervisor] started {self.name} (pid {self.process.pid})")
+
+    def send_signal(self, signum):
+        try:
+            if os.name == "posix":
+                os.killpg(self.process.pid, signum)
+            elif signum == signal.SIGTERM:
+                self.process.terminate()
+            else:
+                self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ready(self):
+        if not self.running:
+            return False
+        if self.ready_check is None:
+            return True
+        try:
+            return bool(self.ready_check())
+        except Exception:
+            return False
+
+    def status(self):
+        return {
+            "running": self.running,
+            "ready": self.ready(),
+            "pid": self.process.pid if self.running else None,
+            "restarts": self.restarts,
+            "uptime": round(time.monotonic() - self.started_at, 1) if self.running else 0,
+        }
+
+
+class Supervisor:
+    """
+    Starts the components, restarts them when they crash and stops them on SIGTERM/SIGINT.
+    """
+
+    def __init__(self, components, health_port=0):
+        self.components = components
+        self.health_port = health_port
+        self._stopping = threading.Event()
+
+    def run(self):
+        """
+        Supervise until a stop signal arrives, then shut the children down.
+        """
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        if self.health_port:
+            self._start_health_server()
+
+        for component in self.components:
+            component.start()
+
+        while not self._stopping.wait(0.5):
+            now = time.monotonic()
+            for component in self.components:
+                if component.running:
+                    if now - component.started_at >= STABLE_AFTER:
+                        component.delay = RESTART_MIN_DELAY
+                    continue
+
+                if component.restart_at is None:
+                    code = component.process.returncode
+                    component.restart_at = now + component.delay
+                    print(f"[supervisor] {component.name} exited with code {code}, restarting in {component.delay:.0f}s")
+                    component.delay = min(component.delay * 2, RESTART_MAX_DELAY)
+                elif now >= component.restart_at:
+                    component.restarts += 1
+                    component.start()
+
+        self.stop()
+
+    def stop(self):
+        """
+        Send SIGTERM to every running child and wait for them, killing any that hang.
+        """
+        running = [component for component in self.components if component.running]
+        for component in running:
+            print(f"[supervisor] stopping {component.name}")
+            component.send_signal(signal.SIGTERM)
+
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for component in running:
+            try:
+                component.process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[supervisor] {component.name} did not stop within {SHUTDOWN_TIMEOUT:.0f}s, killing it")
+                component.send_signal(getattr(signal, "SIGKILL", signal.SIGTERM))
+                component.process.wait()
+
+    def _handle_signal(self, signum, frame):
+        self._stopping.set()
+
+    def _start_health_server(self):
+        supervisor = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                statuses = {component.name: component.status() for component in supervisor.components}
+                if self.path == "/livez":
+                    ok = all(status["running"] for status in statuses.values())
+                elif self.path == "/readyz":
+                    ok = all(status["ready"] for status in statuses.values())
+                else:
+                    self.send_error(404)
+                    return
+                body = json.dumps(statuses).encode()
+                self.send_response(200 if ok else 503)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", self.health_port), HealthHandler)
+        threading.Thread(target=server.serve_forever, name="health", daemon=True).start()
+        print(f"[supervisor] health checks on http://127.0.0.1:{self.health_port}/livez and /readyz")
+
+
+def heartbeat_is_fresh(path, max_age):
+    """
+    True if the file at `path` was touched less than `max_age` seconds ago.
+    """
+    try:
+        return time.time() - os.stat(path).st_mtime < max_age
+    except FileNotFoundError:
+        return False
+
+
+def http_ok(url, timeout=2.0):
+    """
+    True if `url` answers with a 2xx status.
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return 200 <= response.status < 300
+    except OSError:
+        return False
+
+
+def python_component(name, script, ready_check=None):
+    """
+    Component running a Python script with the supervisor's interpreter.
+    """
+    return Component(name, [sys.executable, script], ready_check)
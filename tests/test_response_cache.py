@@ -0,0 +1,52 @@
+"""
+Cached dashboard pages are keyed on per-table change counters, so an
+in-place update (a renamed member) invalidates them as surely as a new row.
+"""
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "web-dashboard"))
+
+import app as dashboard
+from database.schema import Channel, Member, VoiceActivity
+
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Member(id=1, name="before", global_name="Before"))
+        session.add(Channel(id=100, guild_id=1, name="voice", ch_type="voice"))
+        session.add(VoiceActivity(guild_id=1, member_id=1, action="voice_join", to_channel_id=100, timestamp=datetime(2024, 1, 1)))
+        session.commit()
+
+    monkeypatch.setattr(dashboard, "engine", engine)
+    monkeypatch.setattr(dashboard.response_cache, "engine", engine)
+    monkeypatch.setattr(dashboard.response_cache, "backend", dashboard.create_cache())
+    client = dashboard.app.test_client()
+    client.engine = engine
+    return client
+
+
+def test_renaming_a_member_invalidates_cached_pages(client):
+    first = client.get("/voice-activity")
+    assert first.status_code == 200 and b"Before" in first.data
+    assert client.get("/voice-activity", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    with Session(client.engine) as session:
+        member = session.get(Member, 1)
+        member.global_name = "After"
+        session.add(member)
+        session.commit()
+
+    second = client.get("/voice-activity", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert b"After" in second.data
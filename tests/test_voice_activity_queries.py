@@ -0,0 +1,60 @@
+"""
+The voice activity log must resolve members and channel names in the page
+query itself: the number of queries per page can't grow with the page size.
+"""
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "web-dashboard"))
+
+import app as dashboard
+from database.schema import Channel, Member, VoiceActivity
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+
+    start = datetime(2024, 1, 1)
+    with Session(engine) as session:
+        session.add_all(Member(id=member_id, name=f"user{member_id}", global_name=f"User {member_id}") for member_id in range(1, 51))
+        session.add_all(Channel(id=channel_id, guild_id=1, name=f"voice-{channel_id}", ch_type="voice") for channel_id in range(100, 120))
+        session.add_all(
+            VoiceActivity(
+                guild_id=1, member_id=i % 50 + 1, action="voice_move",
+                from_channel_id=100 + i % 20, to_channel_id=100 + (i + 1) % 20,
+                timestamp=start + timedelta(minutes=i)
+            )
+            for i in range(300)
+        )
+        session.commit()
+
+    monkeypatch.setattr(dashboard, "engine", engine)
+    return engine
+
+
+def count_queries(engine, page_size):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with dashboard.app.test_request_context():
+            activities, _ = dashboard.get_voice_activity(page_size=page_size)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(activities) == page_size
+    assert all(activity["from_channel_name"] and activity["to_channel_name"] for activity in activities)
+    return len(statements)
+
+
+def test_voice_activity_query_count_does_not_grow_with_page_size(engine):
+    assert count_queries(engine, 10) == count_queries(engine, 200)
@@ -0,0 +1,100 @@
+"""
+The write-behind queue stores a row and the updates queued with it in one
+transaction: a voice event never ends up without its session, even when the
+batch has to be written one operation at a time.
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+from database.executor import DatabaseExecutor
+from database.schema import VoiceActivity, VoiceSession
+from database.voice import apply_voice_event
+from database.writer import WriteBehindQueue
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def write(engine, queue_events):
+    async def main():
+        db = DatabaseExecutor(engine)
+        writer = WriteBehindQueue(db, retry_delay=0)
+        queue_events(writer)
+        await writer.flush()
+        db.shutdown()
+        return writer
+
+    return asyncio.run(main())
+
+
+def voice_join(writer, member_id, at, fail=False):
+    def update_voice_session(session):
+        apply_voice_event(session, 1, member_id, "voice_join", None, 100, at)
+        if fail:
+            raise RuntimeError("session update failed")
+
+    writer.add(VoiceActivity(guild_id=1, member_id=member_id, action="voice_join", to_channel_id=100, timestamp=at), update_voice_session)
+
+
+def stored(engine):
+    with Session(engine) as session:
+        events = sorted(event.member_id for event in session.exec(select(VoiceActivity)))
+        sessions = sorted(voice_session.member_id for voice_session in session.exec(select(VoiceSession)))
+    return events, sessions
+
+
+def test_batch_stores_events_with_their_sessions(engine):
+    start = datetime(2024, 1, 1)
+    writer = write(engine, lambda writer: [voice_join(writer, member_id, start + timedelta(seconds=member_id)) for member_id in range(1, 6)])
+
+    assert stored(engine) == ([1, 2, 3, 4, 5], [1, 2, 3, 4, 5])
+    assert writer.failed_writes.value(kind="batch") == 0
+
+
+def test_failing_update_only_skips_its_own_event(engine):
+    start = datetime(2024, 1, 1)
+
+    def queue_events(writer):
+        for member_id in range(1, 6):
+            voice_join(writer, member_id, start + timedelta(seconds=member_id), fail=member_id == 3)
+
+    writer = write(engine, queue_events)
+
+    assert stored(engine) == ([1, 2, 4, 5], [1, 2, 4, 5])
+    assert writer.failed_writes.value(kind="batch") == 1
+    assert writer.failed_writes.value(kind="skipped") == 1
+
+
+def test_locked_database_is_retried_without_splitting_the_batch(engine):
+    start = datetime(2024, 1, 1)
+    attempts = []
+
+    def locked_once(session):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    def queue_events(writer):
+        voice_join(writer, 1, start)
+        writer.add_callback(locked_once)
+        voice_join(writer, 2, start + timedelta(seconds=1))
+
+    writer = write(engine, queue_events)
+
+    assert stored(engine) == ([1, 2], [1, 2])
+    assert len(attempts) == 2
+    assert writer.failed_writes.value(kind="batch") == 0
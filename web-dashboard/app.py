@@ -1,10 +1,20 @@
 import os
 import json
-from datetime import datetime
-from flask import Flask, render_template
+import queue
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from flask import Flask, Response, abort, jsonify, redirect, render_template, request, url_for
+from markupsafe import Markup, escape
+from werkzeug.exceptions import HTTPException
 from sqlmodel import create_engine, Session, select
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
 from dotenv import load_dotenv
 
+load_dotenv()
+
 from sqlmodel import create_engine, Session, select
 
 import sys
@@ -13,9 +23,67 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))  # adds project root
 
 from database.schema import *
 from database.db import engine
+from database.retention import archive_engine, list_archives
+from database.metrics import CONTENT_TYPE, Counter
+from database.search import HIGHLIGHT_END, HIGHLIGHT_START, SCOPES, search, search_supported
+from database.stats import LOG_TABLES, TRACKED_TABLES
+from cache import LRUCache, ResponseCache, create_cache
+from export import FORMATS, LOG_TYPES, export_stream
+from filters import GUILD_COOKIE, apply_filters, get_filter_args, get_guild_arg
+from live import LiveFeed
+from metrics import count_rows, init_app as init_metrics, registry as metrics_registry
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_page, get_date_arg, get_page_args
+from serve import DASHBOARD_THREADS, serve
 
 
 app = Flask(__name__)
+init_metrics(app)
+
+# Full-text search needs SQLite or PostgreSQL; on other databases the search page is hidden
+SEARCH_AVAILABLE = search_supported(engine)
+
+# Where the homepage statistics come from: "counters" (EventCount table) or "live" (COUNT queries)
+STATS_SOURCE = os.getenv("DASHBOARD_STATS_SOURCE") or "counters"
+
+# GuildActivity actions counted as joins and as leaves in the churn chart
+JOIN_ACTIONS = ['Join']
+LEAVE_ACTIONS = ['leave/kick']
+
+TABLE_LABELS = {
+    'deletedmessage': 'Deleted Messages',
+    'editedmessage': 'Edited Messages',
+    'voiceactivity': 'Voice Activity',
+    'guildactivity': 'Guild Activity',
+    'memberactivity': 'Role Changes',
+    'message': 'Stored Messages'
+}
+
+# Rendered pages and API responses, versioned by the tables they read (and the
+# guild, member, channel and role names every page shows) and kept per selected guild
+response_cache = ResponseCache(
+    engine,
+    create_cache(),
+    ['guild', 'member', 'channel', 'role', 'memberrole'],
+    vary=lambda: str(get_guild_arg())
+)
+
+# Response cache hits and misses, read on every /metrics scrape
+def cache_metrics():
+    hits = Counter('discord_dashboard_cache_hits_total', 'Responses served from the response cache')
+    hits.inc(response_cache.hits)
+    misses = Counter('discord_dashboard_cache_misses_total', 'Responses rendered because the cache had no current copy')
+    misses.inc(response_cache.misses)
+    return [hits, misses]
+
+metrics_registry.add_collector(cache_metrics)
+
+# Tables read by each log, for the response cache
+LOG_TABLES_READ = {
+    'deleted-messages': ['deletedmessage'],
+    'edited-messages': ['editedmessage'],
+    'voice-activity': ['voiceactivity'],
+    'member-activity': ['guildactivity', 'memberactivity'],
+}
 
 # Add database connection
 # engine = create_engine("sqlite:///discord-bot/database/orm.db")
@@ -24,173 +92,647 @@ app = Flask(__name__)
 # Add a context processor to make the current year available to all templates
 @app.context_processor
 def inject_now():
-    return {'now': datetime.utcnow()}
+    return {'now': datetime.utcnow(), 'archives_available': archives_available(), 'search_available': SEARCH_AVAILABLE}
 
-# Helper function to get deleted messages from database
-def get_deleted_messages():
+# Guilds for the guild selector, and the one currently selected
+@app.context_processor
+def inject_guilds():
+    return {'guilds': get_guild_list(), 'selected_guild_id': get_guild_arg()}
+
+# Every render shows these, so they are looked up as rarely as possible: the guild
+# list again only once the guild table's version changes, the archives once a minute
+guild_list_cache = LRUCache(max_entries=4, ttl=3600)
+archive_list_cache = LRUCache(max_entries=1, ttl=60)
+
+def get_guild_list():
+    version = str(response_cache.table_version('guild'))
+    guilds = guild_list_cache.get(version)
+    if guilds is None:
+        with Session(engine) as session:
+            guilds = session.exec(select(Guild).order_by(Guild.name)).all()
+        guild_list_cache.set(version, guilds)
+    return guilds
+
+def archives_available():
+    available = archive_list_cache.get('archives')
+    if available is None:
+        available = bool(list_archives())
+        archive_list_cache.set('archives', available)
+    return available
+
+# Sessions for the live database and, if asked, every archive database (newest month first)
+@contextmanager
+def open_sessions(include_archives=False):
+    with ExitStack() as stack:
+        sessions = [stack.enter_context(Session(engine))]
+        if include_archives:
+            sessions += [stack.enter_context(Session(archive_engine(month))) for month in list_archives()]
+        yield sessions
+
+# Template helper: URL of the current page with some query arguments replaced
+@app.template_global()
+def page_url(**changes):
+    args = request.args.to_dict()
+    args.pop('before', None)
+    args.pop('after', None)
+    args.update(changes)
+    return url_for(request.endpoint, **{**(request.view_args or {}), **args})
+
+# Queries and record builders for each log, shared by the pages, the API and the live feed
+def deleted_messages_query():
+    return select(DeletedMessage, Message, Member, Channel).join(Message, DeletedMessage.message_id == Message.id).join(Member, Message.member_id == Member.id).join(Channel, Message.channel_id == Channel.id)
+
+def deleted_message_record(row):
+    deleted_msg, message, member, channel = row
+    return {
+        'id': deleted_msg.id,
+        'guild_id': deleted_msg.guild_id,
+        'message_id': deleted_msg.message_id,
+        'content': message.content,
+        'author_name': f"{member.name} ({member.global_name})",
+        'author_id': member.id,
+        'avatar_url': member.avatar_url,
+        'channel_id': channel.id,
+        'channel_name': channel.name,
+        'timestamp': deleted_msg.deleted_at.isoformat(),
+        'original_sent_at': message.created_at.isoformat() if message.created_at else None
+    }
+
+def edited_messages_query():
+    return select(EditedMessage, Message, Member, Channel).join(Message, EditedMessage.message_id == Message.id).join(Member, Message.member_id == Member.id).join(Channel, Message.channel_id == Channel.id)
+
+def edited_message_record(row):
+    edited_msg, message, member, channel = row
+    return {
+        'id': edited_msg.id,
+        'guild_id': edited_msg.guild_id,
+        'message_id': edited_msg.message_id,
+        'content_before': edited_msg.content_before,
+        'content_after': edited_msg.content_after,
+        'author_name': f"{member.name} ({member.global_name})",
+        'author_id': member.id,
+        'avatar_url': member.avatar_url,
+        'channel_id': channel.id,
+        'channel_name': channel.name,
+        'timestamp': edited_msg.edited_at.isoformat(),
+        'original_sent_at': message.created_at.isoformat() if message.created_at else None
+    }
+
+def voice_activity_query():
+    # Resolve both channel names in the same query
+    from_channel = aliased(Channel)
+    to_channel = aliased(Channel)
+    return (
+        select(VoiceActivity, Member, from_channel.name, to_channel.name)
+        .join(Member, VoiceActivity.member_id == Member.id)
+        .join(from_channel, VoiceActivity.from_channel_id == from_channel.id, isouter=True)
+        .join(to_channel, VoiceActivity.to_channel_id == to_channel.id, isouter=True)
+    )
+
+def voice_activity_record(row):
+    voice_act, member, from_channel_name, to_channel_name = row
+    # Parse details JSON if it exists
+    details = {}
+    if voice_act.details:
+        try:
+            details = json.loads(voice_act.details)
+        except json.JSONDecodeError:
+            details = {}
+    
+    return {
+        'id': voice_act.id,
+        'guild_id': voice_act.guild_id,
+        'action': voice_act.action,
+        'member_name': f"{member.name} ({member.global_name})",
+        'member_id': member.id,
+        'avatar_url': member.avatar_url,
+        'from_channel_id': voice_act.from_channel_id,
+        'from_channel_name': from_channel_name,
+        'to_channel_id': voice_act.to_channel_id,
+        'to_channel_name': to_channel_name,
+        'timestamp': voice_act.timestamp.isoformat(),
+        'details': details
+    }
+
+def guild_activity_query():
+    # Guild activities (join/leave/ban/unban)
+    return select(GuildActivity, Member).join(Member, GuildActivity.member_id == Member.id)
+
+def guild_activity_record(row):
+    guild_act, member = row
+    return {
+        'id': guild_act.id,
+        'guild_id': guild_act.guild_id,
+        'action': guild_act.action,
+        'member_name': f"{member.name} ({member.global_name})",
+        'member_id': member.id,
+        'avatar_url': member.avatar_url,
+        'timestamp': guild_act.timestamp.isoformat(),
+        'type': 'guild'
+    }
+
+def role_changes_query():
+    # Member activities (role changes)
+    return select(MemberActivity, Member, Role).join(Member, MemberActivity.member_id == Member.id).join(Role, MemberActivity.role_id == Role.id, isouter=True)
+
+def role_change_record(row):
+    member_act, member, role = row
+    return {
+        'id': member_act.id,
+        'guild_id': member_act.guild_id,
+        'action': member_act.action,
+        'member_name': f"{member.name} ({member.global_name})",
+        'member_id': member.id,
+        'avatar_url': member.avatar_url,
+        'role_name': role.name if role else None,
+        'role_id': member_act.role_id,
+        'timestamp': member_act.timestamp.isoformat(),
+        'type': 'member'
+    }
+
+# Table -> (log type, ID column, query, record builder) for the live feed
+LIVE_SOURCES = {
+    'deletedmessage': ('deleted-messages', DeletedMessage.id, deleted_messages_query, deleted_message_record),
+    'editedmessage': ('edited-messages', EditedMessage.id, edited_messages_query, edited_message_record),
+    'voiceactivity': ('voice-activity', VoiceActivity.id, voice_activity_query, voice_activity_record),
+    'guildactivity': ('member-activity', GuildActivity.id, guild_activity_query, guild_activity_record),
+    'memberactivity': ('member-activity', MemberActivity.id, role_changes_query, role_change_record),
+}
+
+def get_new_entries(table_name, after_id, limit):
     """
-    Get deleted messages from the database.
+    Get entries of a log table with an ID above `after_id`, oldest first.
     
     Returns:
-        list: List of deleted message records
+        list: (id, record) pairs
     """
+    _, id_col, query, record = LIVE_SOURCES[table_name]
     with Session(engine) as session:
-        statement = select(DeletedMessage, Message, Member, Channel).join(Message, DeletedMessage.message_id == Message.id).join(Member, Message.member_id == Member.id).join(Channel, Message.channel_id == Channel.id)
-        results = session.exec(statement).all()
+        rows = session.exec(query().where(id_col > after_id).order_by(id_col).limit(limit)).all()
+        return [(row[0].id, record(row)) for row in rows]
+
+def get_high_water_marks():
+    """
+    Get the highest ID stored in each log table (0 for empty tables).
+    """
+    with Session(engine) as session:
+        return {
+            table_name: session.exec(select(func.max(id_col))).one() or 0
+            for table_name, (_, id_col, _, _) in LIVE_SOURCES.items()
+        }
+
+live_feed = LiveFeed(get_new_entries, get_high_water_marks, poll_interval=float(os.getenv("LIVE_POLL_INTERVAL") or 5.0))
+
+# Every open stream holds a server thread, so only half of a process' threads may
+# stream; the rest stay free for pages and /healthz. Streams also end after
+# DASHBOARD_STREAM_MAX_SECONDS (browsers reconnect), so the slots keep turning over.
+MAX_STREAMS = int(os.getenv("DASHBOARD_MAX_STREAMS") or DASHBOARD_THREADS // 2)
+STREAM_MAX_SECONDS = float(os.getenv("DASHBOARD_STREAM_MAX_SECONDS") or 300)
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS) if MAX_STREAMS > 0 else None
+
+# Helper function to get deleted messages from database
+def get_deleted_messages(before=None, after=None, page_size=DEFAULT_PAGE_SIZE, include_archives=False, filters=None):
+    """
+    Get one page of deleted messages from the database, newest first.
+    
+    Args:
+        before (tuple): Decoded cursor; return messages deleted before it
+        after (tuple): Decoded cursor; return messages deleted after it
+        page_size (int): Maximum number of messages to return
+        include_archives (bool): Also read the monthly archive databases
+        filters (dict): Filters from get_filter_args()
+    
+    Returns:
+        tuple: List of deleted message records and the pagination cursors
+    """
+    with open_sessions(include_archives) as sessions:
+        statement = apply_filters(deleted_messages_query(), filters, DeletedMessage.deleted_at, guild=DeletedMessage.guild_id, member=Message.member_id, channel=Message.channel_id)
+        results, pagination = fetch_page(sessions, [(statement, DeletedMessage.deleted_at, DeletedMessage.id)], before, after, page_size)
+        return [deleted_message_record(row) for _, row in results], pagination
+
+
+# Helper function to get edited messages from database
+def get_edited_messages(before=None, after=None, page_size=DEFAULT_PAGE_SIZE, include_archives=False, filters=None):
+    """
+    Get one page of edited messages from the database, newest first.
+    
+    Args:
+        before (tuple): Decoded cursor; return edits made before it
+        after (tuple): Decoded cursor; return edits made after it
+        page_size (int): Maximum number of edits to return
+        include_archives (bool): Also read the monthly archive databases
+        filters (dict): Filters from get_filter_args()
+    
+    Returns:
+        tuple: List of edited message records and the pagination cursors
+    """
+    with open_sessions(include_archives) as sessions:
+        statement = apply_filters(edited_messages_query(), filters, EditedMessage.edited_at, guild=EditedMessage.guild_id, member=Message.member_id, channel=Message.channel_id)
+        results, pagination = fetch_page(sessions, [(statement, EditedMessage.edited_at, EditedMessage.id)], before, after, page_size)
+        return [edited_message_record(row) for _, row in results], pagination
+
+
+# Helper function to get voice activity from database
+def get_voice_activity(before=None, after=None, page_size=DEFAULT_PAGE_SIZE, include_archives=False, filters=None):
+    """
+    Get one page of voice activity from the database, newest first.
+    
+    Args:
+        before (tuple): Decoded cursor; return events older than it
+        after (tuple): Decoded cursor; return events newer than it
+        page_size (int): Maximum number of events to return
+        include_archives (bool): Also read the monthly archive databases
+        filters (dict): Filters from get_filter_args()
+    
+    Returns:
+        tuple: List of voice activity records and the pagination cursors
+    """
+    with open_sessions(include_archives) as sessions:
+        voice_statement = apply_filters(
+            voice_activity_query(), filters, VoiceActivity.timestamp,
+            guild=VoiceActivity.guild_id,
+            member=VoiceActivity.member_id,
+            channel=[VoiceActivity.from_channel_id, VoiceActivity.to_channel_id],
+            action=VoiceActivity.action
+        )
+        voice_results, pagination = fetch_page(sessions, [(voice_statement, VoiceActivity.timestamp, VoiceActivity.id)], before, after, page_size)
+        return [voice_activity_record(row) for _, row in voice_results], pagination
+
+
+# Helper function to get member activity from database
+def get_member_activity(before=None, after=None, page_size=DEFAULT_PAGE_SIZE, include_archives=False, filters=None):
+    """
+    Get one page of member activity from the database, newest first.
+    Guild activity and role changes are merged into a single timeline.
+    
+    Args:
+        before (tuple): Decoded cursor; return events older than it
+        after (tuple): Decoded cursor; return events newer than it
+        page_size (int): Maximum number of events to return
+        include_archives (bool): Also read the monthly archive databases
+        filters (dict): Filters from get_filter_args()
+    
+    Returns:
+        tuple: List of member activity records and the pagination cursors
+    """
+    with open_sessions(include_archives) as sessions:
+        guild_statement = apply_filters(guild_activity_query(), filters, GuildActivity.timestamp, guild=GuildActivity.guild_id, member=GuildActivity.member_id, action=GuildActivity.action)
+        member_statement = apply_filters(role_changes_query(), filters, MemberActivity.timestamp, guild=MemberActivity.guild_id, member=MemberActivity.member_id, action=MemberActivity.action)
         
-        messages = []
-        for deleted_msg, message, member, channel in results:
-            msg_data = {
-                'id': deleted_msg.id,
-                'message_id': deleted_msg.message_id,
-                'content': message.content,
-                'author_name': f"{member.name} ({member.global_name})",
-                'author_id': member.id,
-                'avatar_url': member.avatar_url,
-                'channel_id': channel.id,
-                'channel_name': channel.name,
-                'timestamp': deleted_msg.deleted_at.isoformat(),
-                'original_sent_at': message.created_at.isoformat() if message.created_at else None
-            }
-            messages.append(msg_data)
+        results, pagination = fetch_page(sessions, [
+            (guild_statement, GuildActivity.timestamp, GuildActivity.id),
+            (member_statement, MemberActivity.timestamp, MemberActivity.id),
+        ], before, after, page_size)
         
-        return messages
+        activities = [guild_activity_record(row) if source == 0 else role_change_record(row) for source, row in results]
+        return activities, pagination
 
 
-# Helper function to get edited messages from database
-def get_edited_messages():
+
+# Helper function to get every role with its member count
+def get_roles(guild_id=None):
     """
-    Get edited messages from the database.
+    Get every role with the number of members who currently have it, most members first.
+    
+    Args:
+        guild_id (int): Only roles of this guild
     
     Returns:
-        list: List of edited message records
+        list: List of role dicts
     """
     with Session(engine) as session:
-        statement = select(EditedMessage, Message, Member, Channel).join(Message, EditedMessage.message_id == Message.id).join(Member, Message.member_id == Member.id).join(Channel, Message.channel_id == Channel.id)
-        results = session.exec(statement).all()
-        
-        messages = []
-        for edited_msg, message, member, channel in results:
-            msg_data = {
-                'id': edited_msg.id,
-                'message_id': edited_msg.message_id,
-                'content_before': edited_msg.content_before,
-                'content_after': edited_msg.content_after,
-                'author_name': f"{member.name} ({member.global_name})",
-                'author_id': member.id,
-                'avatar_url': member.avatar_url,
-                'channel_id': channel.id,
-                'channel_name': channel.name,
-                'timestamp': edited_msg.edited_at.isoformat(),
-                'original_sent_at': message.created_at.isoformat() if message.created_at else None
+        counts = select(MemberRole.role_id, func.count().label('member_count'))
+        if guild_id is not None:
+            # Counted from the (guild_id, role_id, member_id) index alone
+            counts = counts.where(MemberRole.guild_id == guild_id)
+        counts = counts.group_by(MemberRole.role_id).subquery()
+        statement = (
+            select(Role, func.coalesce(counts.c.member_count, 0))
+            .outerjoin(counts, counts.c.role_id == Role.id)
+            .order_by(func.coalesce(counts.c.member_count, 0).desc(), Role.name)
+        )
+        if guild_id is not None:
+            statement = statement.where(Role.guild_id == guild_id)
+        rows = session.exec(statement).all()
+        count_rows(len(rows))
+        return [
+            {
+                'id': str(role.id),
+                'name': role.name,
+                'color': role.color,
+                'member_count': member_count,
             }
-            messages.append(msg_data)
-        
-        return messages
+            for role, member_count in rows
+        ]
 
 
-# Helper function to get voice activity from database
-def get_voice_activity():
+# Helper function to get the members who have a role
+def get_role_members(role_id, start=None, page_size=DEFAULT_PAGE_SIZE):
     """
-    Get voice activity from the database.
+    Get one page of the members who currently have a role, ordered by member ID.
+    
+    Args:
+        role_id (int): ID of the role
+        start (int): Return members with an ID above this one
+        page_size (int): Maximum number of members to return
     
     Returns:
-        list: List of voice activity records
+        tuple: The role (or None if it doesn't exist), list of member dicts and the
+            member ID to start the next page from (None on the last page)
     """
     with Session(engine) as session:
-        # Get voice activities with member info
-        voice_statement = select(VoiceActivity, Member).join(Member, VoiceActivity.member_id == Member.id)
-        voice_results = session.exec(voice_statement).all()
+        role = session.get(Role, role_id)
+        if role is None:
+            return None, [], None
         
-        activities = []
-        for voice_act, member in voice_results:
-            # Get channel names if channel IDs exist
-            from_channel_name = None
-            to_channel_name = None
-            
-            if voice_act.from_channel_id:
-                from_channel = session.exec(select(Channel).where(Channel.id == voice_act.from_channel_id)).first()
-                from_channel_name = from_channel.name if from_channel else None
-                
-            if voice_act.to_channel_id:
-                to_channel = session.exec(select(Channel).where(Channel.id == voice_act.to_channel_id)).first()
-                to_channel_name = to_channel.name if to_channel else None
-            
-            # Parse details JSON if it exists
-            details = {}
-            if voice_act.details:
-                try:
-                    details = json.loads(voice_act.details)
-                except json.JSONDecodeError:
-                    details = {}
-            
-            act_data = {
-                'id': voice_act.id,
-                'action': voice_act.action,
-                'member_name': f"{member.name} ({member.global_name})",
-                'member_id': member.id,
+        # Walks the (guild_id, role_id, member_id) index from `start`
+        statement = select(Member).join(MemberRole, MemberRole.member_id == Member.id).where(MemberRole.guild_id == role.guild_id, MemberRole.role_id == role_id)
+        if start is not None:
+            statement = statement.where(MemberRole.member_id > start)
+        members = session.exec(statement.order_by(MemberRole.member_id).limit(page_size + 1)).all()
+        count_rows(len(members))
+        
+        next_start = members[page_size - 1].id if len(members) > page_size else None
+        role_record = {'id': str(role.id), 'name': role.name, 'color': role.color}
+        return role_record, [
+            {
+                'id': str(member.id),
+                'name': member.global_name or member.name,
+                'username': member.name,
                 'avatar_url': member.avatar_url,
-                'from_channel_id': voice_act.from_channel_id,
-                'from_channel_name': from_channel_name,
-                'to_channel_id': voice_act.to_channel_id,
-                'to_channel_name': to_channel_name,
-                'timestamp': voice_act.timestamp.isoformat(),
-                'details': details
             }
-            activities.append(act_data)
-        
-        return activities
+            for member in members[:page_size]
+        ], next_start
 
+# Helper function (and template filter) to format a number of seconds
+@app.template_filter('duration')
+def format_duration(seconds):
+    """
+    Format a duration as hours and minutes, e.g. "3h 05m".
+    """
+    minutes = int(seconds or 0) // 60
+    return f"{minutes // 60}h {minutes % 60:02d}m" if minutes >= 60 else f"{minutes}m"
 
-# Helper function to get member activity from database
-def get_member_activity():
+# Helper function to get the voice time leaderboards
+def get_voice_time(days=7, guild_id=None, limit=25):
     """
-    Get member activity from the database.
+    Get the members and channels with the most time in voice, and the total
+    time in voice per day, over the last `days` days. Read from the daily
+    rollups only, so sessions still going on aren't counted yet.
+    
+    Args:
+        days (int): Number of days, today included
+        guild_id (int): Only this guild's voice time
+        limit (int): Length of each leaderboard
     
     Returns:
-        list: List of member activity records
+        dict: 'members', 'channels' and 'per_day' lists (per_day newest first)
     """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
     with Session(engine) as session:
-        # Get guild activities (join/leave/ban/unban)
-        guild_statement = select(GuildActivity, Member).join(Member, GuildActivity.member_id == Member.id)
-        guild_results = session.exec(guild_statement).all()
-        
-        # Get member activities (role changes)
-        member_statement = select(MemberActivity, Member, Role).join(Member, MemberActivity.member_id == Member.id).join(Role, MemberActivity.role_id == Role.id, isouter=True)
-        member_results = session.exec(member_statement).all()
+        def leaderboard(model, column):
+            statement = (
+                select(column, func.sum(model.seconds).label('seconds'), func.sum(model.sessions))
+                .where(model.day >= since)
+                .group_by(column)
+                .order_by(func.sum(model.seconds).desc())
+                .limit(limit)
+            )
+            if guild_id is not None:
+                statement = statement.where(model.guild_id == guild_id)
+            return session.exec(statement).all()
         
-        activities = []
+        members = leaderboard(VoiceMemberDay, VoiceMemberDay.member_id)
+        channels = leaderboard(VoiceChannelDay, VoiceChannelDay.channel_id)
+        member_names = {
+            member.id: member
+            for member in session.exec(select(Member).where(Member.id.in_([row[0] for row in members]))).all()
+        }
+        channel_names = dict(session.exec(select(Channel.id, Channel.name).where(Channel.id.in_([row[0] for row in channels]))).all())
         
-        # Process guild activities
-        for guild_act, member in guild_results:
-            act_data = {
-                'id': guild_act.id,
-                'action': guild_act.action,
-                'member_name': f"{member.name} ({member.global_name})",
-                'member_id': member.id,
-                'avatar_url': member.avatar_url,
-                'timestamp': guild_act.timestamp.isoformat(),
-                'type': 'guild'
+        per_day = select(VoiceChannelDay.day, func.sum(VoiceChannelDay.seconds), func.sum(VoiceChannelDay.sessions)).where(VoiceChannelDay.day >= since)
+        if guild_id is not None:
+            per_day = per_day.where(VoiceChannelDay.guild_id == guild_id)
+        per_day = session.exec(per_day.group_by(VoiceChannelDay.day).order_by(VoiceChannelDay.day.desc())).all()
+    
+    return {
+        'days': days,
+        'members': [
+            {
+                'member_id': str(member_id),
+                'member_name': (member_names[member_id].global_name or member_names[member_id].name) if member_id in member_names else 'Unknown Member',
+                'avatar_url': member_names[member_id].avatar_url if member_id in member_names else None,
+                'seconds': seconds,
+                'sessions': sessions,
             }
-            activities.append(act_data)
-        
-        # Process member activities
-        for member_act, member, role in member_results:
-            act_data = {
-                'id': member_act.id,
-                'action': member_act.action,
-                'member_name': f"{member.name} ({member.global_name})",
-                'member_id': member.id,
-                'avatar_url': member.avatar_url,
-                'role_name': role.name if role else None,
-                'role_id': member_act.role_id,
-                'timestamp': member_act.timestamp.isoformat(),
-                'type': 'member'
+            for member_id, seconds, sessions in members
+        ],
+        'channels': [
+            {
+                'channel_id': str(channel_id),
+                'channel_name': channel_names.get(channel_id, 'Unknown Channel'),
+                'seconds': seconds,
+                'sessions': sessions,
             }
-            activities.append(act_data)
+            for channel_id, seconds, sessions in channels
+        ],
+        'per_day': [{'day': str(day), 'seconds': seconds, 'sessions': sessions} for day, seconds, sessions in per_day],
+    }
+
+# Helper function to get one member's voice time
+def get_member_voice_time(member_id, days=30, guild_id=None, limit=50):
+    """
+    Get a member's time in voice per day over the last `days` days (from the
+    daily rollups) and their latest voice sessions.
+    
+    Args:
+        member_id (int): ID of the member
+        days (int): Number of days, today included
+        guild_id (int): Only time spent in this guild
+        limit (int): Number of sessions to return
+    
+    Returns:
+        tuple: The member (or None if it isn't stored), per-day list (newest
+            first) and list of session dicts (newest first)
+    """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
+    with Session(engine) as session:
+        member = session.get(Member, member_id)
+        if member is None:
+            return None, [], []
+        
+        per_day = select(VoiceMemberDay.day, func.sum(VoiceMemberDay.seconds), func.sum(VoiceMemberDay.sessions)).where(VoiceMemberDay.member_id == member_id, VoiceMemberDay.day >= since)
+        sessions = select(VoiceSession, Channel.name).outerjoin(Channel, Channel.id == VoiceSession.channel_id).where(VoiceSession.member_id == member_id)
+        if guild_id is not None:
+            per_day = per_day.where(VoiceMemberDay.guild_id == guild_id)
+            sessions = sessions.where(VoiceSession.guild_id == guild_id)
+        per_day = session.exec(per_day.group_by(VoiceMemberDay.day).order_by(VoiceMemberDay.day.desc())).all()
+        sessions = session.exec(sessions.order_by(VoiceSession.started_at.desc()).limit(limit)).all()
+    
+    member_record = {'id': str(member.id), 'name': member.global_name or member.name, 'avatar_url': member.avatar_url}
+    return member_record, [
+        {'day': str(day), 'seconds': seconds, 'sessions': count} for day, seconds, count in per_day
+    ], [
+        {
+            'id': voice_session.id,
+            'guild_id': voice_session.guild_id,
+            'channel_id': str(voice_session.channel_id),
+            'channel_name': channel_name or 'Unknown Channel',
+            'started_at': voice_session.started_at.isoformat(),
+            'ended_at': voice_session.ended_at.isoformat() if voice_session.ended_at else None,
+            'duration_seconds': voice_session.duration_seconds,
+            'estimated': voice_session.estimated,
+        }
+        for voice_session, channel_name in sessions
+    ]
+
+# Helper function to get the activity charts
+def get_activity_charts(days=7, guild_id=None, limit=10):
+    """
+    Get message volume, join/leave churn and voice occupancy over the last
+    `days` days, per hour for up to a week and per day beyond, plus the
+    busiest channels and members. Read from the rollup tables only.
+    
+    Args:
+        days (int): Number of days, today included
+        guild_id (int): Only this guild's activity
+        limit (int): Length of the busiest channel and member lists
+    
+    Returns:
+        dict: 'labels' (one per bucket, oldest first), one list of values per
+            series in 'series', and the 'top_channels' and 'top_members' lists
+    """
+    now = datetime.utcnow()
+    hourly = days <= 7
+    if hourly:
+        first = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=days * 24 - 1)
+        buckets = [first + timedelta(hours=i) for i in range(days * 24)]
+        bucket_of = lambda hour: hour
+        label = lambda bucket: bucket.strftime('%Y-%m-%d %H:00')
+        bucket_seconds = 3600
+    else:
+        first = datetime.combine(now.date() - timedelta(days=days - 1), datetime.min.time())
+        buckets = [(first + timedelta(days=i)).date() for i in range(days)]
+        bucket_of = lambda hour: hour.date()
+        label = str
+        bucket_seconds = 86400
+    
+    series = {name: dict.fromkeys(buckets, 0) for name in ('messages', 'joins', 'leaves', 'voice_seconds')}
+    with Session(engine) as session:
+        def guild_filter(model):
+            return [model.guild_id == guild_id] if guild_id is not None else []
+        
+        counts = session.exec(
+            select(HourlyEventCount.hour, HourlyEventCount.table_name, HourlyEventCount.action, func.sum(HourlyEventCount.count))
+            .where(HourlyEventCount.hour >= first, HourlyEventCount.table_name.in_(['message', 'guildactivity']), *guild_filter(HourlyEventCount))
+            .group_by(HourlyEventCount.hour, HourlyEventCount.table_name, HourlyEventCount.action)
+        ).all()
+        for hour, table_name, action, count in counts:
+            if table_name == 'message':
+                name = 'messages'
+            elif action in JOIN_ACTIONS:
+                name = 'joins'
+            elif action in LEAVE_ACTIONS:
+                name = 'leaves'
+            else:
+                continue
+            bucket = bucket_of(hour)
+            if bucket in series[name]:
+                series[name][bucket] += count
+        
+        for hour, seconds in session.exec(
+            select(VoiceHour.hour, func.sum(VoiceHour.seconds)).where(VoiceHour.hour >= first, *guild_filter(VoiceHour)).group_by(VoiceHour.hour)
+        ).all():
+            bucket = bucket_of(hour)
+            if bucket in series['voice_seconds']:
+                series['voice_seconds'][bucket] += seconds
         
-        return activities
+        def busiest(model, column):
+            return session.exec(
+                select(column, func.sum(model.count))
+                .where(model.day >= first.date(), model.table_name == 'message', *guild_filter(model))
+                .group_by(column)
+                .order_by(func.sum(model.count).desc())
+                .limit(limit)
+            ).all()
+        
+        top_channels = busiest(ChannelDayCount, ChannelDayCount.channel_id)
+        top_members = busiest(MemberDayCount, MemberDayCount.member_id)
+        channel_names = dict(session.exec(select(Channel.id, Channel.name).where(Channel.id.in_([row[0] for row in top_channels]))).all())
+        member_names = {
+            member.id: member.global_name or member.name
+            for member in session.exec(select(Member).where(Member.id.in_([row[0] for row in top_members]))).all()
+        }
+    
+    return {
+        'days': days,
+        'bucket': 'hour' if hourly else 'day',
+        'labels': [label(bucket) for bucket in buckets],
+        'series': {
+            'messages': list(series['messages'].values()),
+            'joins': list(series['joins'].values()),
+            'leaves': list(series['leaves'].values()),
+            # Average number of members in voice during each bucket
+            'voice_occupancy': [round(seconds / bucket_seconds, 2) for seconds in series['voice_seconds'].values()],
+        },
+        'top_channels': [
+            {'channel_id': str(channel_id), 'channel_name': channel_names.get(channel_id, 'Unknown Channel'), 'messages': count}
+            for channel_id, count in top_channels
+        ],
+        'top_members': [
+            {'member_id': str(member_id), 'member_name': member_names.get(member_id, 'Unknown Member'), 'messages': count}
+            for member_id, count in top_members
+        ],
+    }
 
+# Helper function to search logged messages
+def get_search_results(query, scope='messages', member_id=None, channel_id=None, since=None, until=None, page=1, page_size=DEFAULT_PAGE_SIZE, guild_id=None):
+    """
+    Get one page of full-text search results, best matches first.
+    
+    Args:
+        query (str): Words to search for
+        scope (str): "messages" or "edits"
+        member_id (int): Only messages from this member
+        channel_id (int): Only messages in this channel
+        since (datetime): Only results at or after this time
+        until (datetime): Only results before this time
+        page (int): 1-based page number
+        page_size (int): Maximum number of results per page
+        guild_id (int): Only messages in this guild
+    
+    Returns:
+        tuple: List of search result records and whether there is a next page
+    """
+    with Session(engine) as session:
+        rows = search(session, query, scope, member_id, channel_id, since, until, limit=page_size + 1, offset=(page - 1) * page_size, guild_id=guild_id)
+        count_rows(len(rows))
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        
+        # Resolve members and channels of the whole page in one query each
+        members = {m.id: m for m in session.exec(select(Member).where(Member.id.in_({r.member_id for r in rows}))).all()}
+        channels = {c.id: c for c in session.exec(select(Channel).where(Channel.id.in_({r.channel_id for r in rows}))).all()}
+        
+        results = []
+        for row in rows:
+            member = members.get(row.member_id)
+            channel = channels.get(row.channel_id)
+            timestamp = row.timestamp if isinstance(row.timestamp, datetime) else datetime.fromisoformat(row.timestamp)
+            results.append({
+                'message_id': row.message_id,
+                'snippet': Markup(str(escape(row.snippet or '')).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')),
+                'author_name': f"{member.name} ({member.global_name})" if member else None,
+                'author_id': row.member_id,
+                'avatar_url': member.avatar_url if member else 'None',
+                'channel_id': row.channel_id,
+                'channel_name': channel.name if channel else None,
+                'timestamp': timestamp.isoformat()
+            })
+        
+        return results, has_more
 
 
 # Helper function to format timestamps
@@ -211,106 +753,541 @@ def format_timestamp(timestamp_str):
         return timestamp_str
 
 # Helper function to calculate summary statistics
-# Helper function to calculate summary statistics
-def get_summary_stats():
+def get_summary_stats(days=14, guild_id=None):
     """
-    Calculate summary statistics from database tables.
+    Calculate summary statistics, with per-table and per-day breakdowns.
+    
+    Reads the EventCount table maintained by the bot's writer when it's
+    available (DASHBOARD_STATS_SOURCE=counters, the default), otherwise
+    counts the event tables with SQL COUNT/MAX.
+    
+    Args:
+        days (int): Number of days covered by the per-day breakdown
+        guild_id (int): Only count this guild's events
     
     Returns:
         dict: Dictionary containing summary statistics
     """
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
     with Session(engine) as session:
-        # Count records in each table
-        deleted_count = len(session.exec(select(DeletedMessage)).all())
-        edited_count = len(session.exec(select(EditedMessage)).all())
-        voice_count = len(session.exec(select(VoiceActivity)).all())
-        member_count = len(session.exec(select(GuildActivity)).all()) + len(session.exec(select(MemberActivity)).all())
-        
-        # Find the most recent event across all tables
-        latest_deleted = session.exec(select(DeletedMessage.deleted_at).order_by(DeletedMessage.deleted_at.desc())).first()
-        latest_edited = session.exec(select(EditedMessage.edited_at).order_by(EditedMessage.edited_at.desc())).first()
-        latest_voice = session.exec(select(VoiceActivity.timestamp).order_by(VoiceActivity.timestamp.desc())).first()
-        latest_guild = session.exec(select(GuildActivity.timestamp).order_by(GuildActivity.timestamp.desc())).first()
-        latest_member = session.exec(select(MemberActivity.timestamp).order_by(MemberActivity.timestamp.desc())).first()
-        
-        # Determine the most recent timestamp
-        all_timestamps = [
-            latest_deleted,
-            latest_edited,
-            latest_voice,
-            latest_guild,
-            latest_member
-        ]
-        
-        # Filter out None values and find the maximum
-        valid_timestamps = [ts for ts in all_timestamps if ts is not None]
-        most_recent = format_timestamp(valid_timestamps[0].isoformat()) if valid_timestamps else "No events recorded"
-        
-        return {
-            'total_entries': deleted_count + edited_count + voice_count + member_count,
-            'last_logged_event': most_recent
-        }
+        use_counters = STATS_SOURCE == "counters" and session.exec(select(EventCount).limit(1)).first() is not None
+        if use_counters:
+            # Summed over guilds (the counters are kept per guild)
+            guild_filter = [EventCount.guild_id == guild_id] if guild_id is not None else []
+            totals = {
+                table_name: (count, latest)
+                for table_name, count, latest in session.exec(
+                    select(EventCount.table_name, func.sum(EventCount.count), func.max(EventCount.last_event_at))
+                    .where(*guild_filter)
+                    .group_by(EventCount.table_name)
+                ).all()
+            }
+            daily = session.exec(
+                select(EventCount.day, EventCount.table_name, EventCount.count).where(EventCount.day >= since, *guild_filter)
+            ).all()
+        else:
+            totals = {}
+            daily = []
+            for table_name, column in TRACKED_TABLES.items():
+                guild_filter = [column.class_.guild_id == guild_id] if guild_id is not None else []
+                totals[table_name] = session.exec(select(func.count(), func.max(column)).select_from(column.class_).where(*guild_filter)).one()
+                day = func.date(column)
+                for day_value, count in session.exec(
+                    select(day, func.count()).where(column >= datetime.combine(since, datetime.min.time()), *guild_filter).group_by(day)
+                ).all():
+                    daily.append((day_value, table_name, count))
+    
+    # Per-table totals, in the same order as the dashboard's navigation
+    per_table = []
+    for table_name, label in TABLE_LABELS.items():
+        count, latest = totals.get(table_name, (0, None))
+        per_table.append({
+            'table': table_name,
+            'label': label,
+            'count': count or 0,
+            'last_event': format_timestamp(latest.isoformat()) if latest else None
+        })
+    
+    # Per-day counts, newest day first
+    per_day = {}
+    for day_value, table_name, count in daily:
+        day_key = str(day_value)
+        per_day.setdefault(day_key, dict.fromkeys(TABLE_LABELS, 0))[table_name] += count
+    per_day = [
+        {'day': day_key, 'counts': counts, 'total': sum(counts[t] for t in LOG_TABLES)}
+        for day_key, counts in sorted(per_day.items(), reverse=True)
+    ]
+    
+    # The most recent log event is the maximum over all log tables
+    latest_events = [totals[t][1] for t in LOG_TABLES if t in totals and totals[t][1] is not None]
+    most_recent = format_timestamp(max(latest_events).isoformat()) if latest_events else "No events recorded"
+    
+    return {
+        'total_entries': sum(totals.get(t, (0, None))[0] or 0 for t in LOG_TABLES),
+        'last_logged_event': most_recent,
+        'per_table': per_table,
+        'per_day': per_day,
+        'source': 'counters' if use_counters else 'live'
+    }
 
 # Route for the homepage
 @app.route('/')
+@response_cache.cached(list(TRACKED_TABLES))
 def index():
     """
     Render the homepage with summary statistics.
     """
-    stats = get_summary_stats()
+    stats = get_summary_stats(guild_id=get_guild_arg())
     return render_template('index.html', stats=stats)
 
 # Route for deleted messages log
 @app.route('/deleted-messages')
+@response_cache.cached(LOG_TABLES_READ['deleted-messages'])
 def deleted_messages():
     """
     Render the deleted messages log page.
     """
-    messages = get_deleted_messages()
+    messages, pagination = get_deleted_messages(*get_page_args(), include_archives=request.args.get('archives') == '1', filters=get_filter_args())
     # Format timestamps for display
     for msg in messages:
         msg['formatted_timestamp'] = format_timestamp(msg['timestamp'])
         msg['formatted_original_sent_at'] = format_timestamp(msg['original_sent_at'])
-    return render_template('deleted_messages.html', messages=messages)
+    return render_template('deleted_messages.html', messages=messages, pagination=pagination)
 
 # Route for edited messages log
 @app.route('/edited-messages')
+@response_cache.cached(LOG_TABLES_READ['edited-messages'])
 def edited_messages():
     """
     Render the edited messages log page.
     """
-    messages = get_edited_messages()
+    messages, pagination = get_edited_messages(*get_page_args(), include_archives=request.args.get('archives') == '1', filters=get_filter_args())
     # Format timestamps for display
     for msg in messages:
         msg['formatted_timestamp'] = format_timestamp(msg['timestamp'])
         msg['formatted_original_sent_at'] = format_timestamp(msg['original_sent_at'])
-    return render_template('edited_messages.html', messages=messages)
+    return render_template('edited_messages.html', messages=messages, pagination=pagination)
 
 # Route for voice channel activity log
 @app.route('/voice-activity')
+@response_cache.cached(LOG_TABLES_READ['voice-activity'])
 def voice_activity():
     """
     Render the voice channel activity log page.
     """
-    activities = get_voice_activity()
+    activities, pagination = get_voice_activity(*get_page_args(), include_archives=request.args.get('archives') == '1', filters=get_filter_args())
     # Format timestamps for display
     for activity in activities:
         activity['formatted_timestamp'] = format_timestamp(activity['timestamp'])
-    return render_template('voice_activity.html', activities=activities)
+    return render_template('voice_activity.html', activities=activities, pagination=pagination)
 
 # Route for member activity log
 @app.route('/member-activity')
+@response_cache.cached(LOG_TABLES_READ['member-activity'])
 def member_activity():
     """
     Render the member activity log page.
     """
-    activities = get_member_activity()
+    activities, pagination = get_member_activity(*get_page_args(), include_archives=request.args.get('archives') == '1', filters=get_filter_args())
     # Format timestamps for display
     for activity in activities:
         activity['formatted_timestamp'] = format_timestamp(activity['timestamp'])
-    return render_template('member_activity.html', activities=activities)
+    return render_template('member_activity.html', activities=activities, pagination=pagination)
+
+# Route for the role list
+@app.route('/roles')
+def roles():
+    """
+    Render the list of roles with their member counts.
+    """
+    return render_template('roles.html', roles=get_roles(get_guild_arg()))
+
+# Route for the members of a role
+@app.route('/roles/<int:role_id>')
+def role_members(role_id):
+    """
+    Render the members who currently have a role.
+    """
+    _, _, page_size = get_page_args()
+    role, members, next_start = get_role_members(role_id, request.args.get('start', type=int), page_size)
+    if role is None:
+        abort(404)
+    return render_template('role_members.html', role=role, members=members, next_start=next_start)
+
+# Route for the activity charts
+@app.route('/stats')
+@response_cache.cached(list(TRACKED_TABLES) + ['voicesession'])
+def activity_stats():
+    """
+    Render the message volume, churn and voice occupancy charts.
+    """
+    days = max(1, min(request.args.get('days', 7, type=int), 366))
+    return render_template('stats.html', charts=get_activity_charts(days, get_guild_arg()))
+
+# Route for the voice time leaderboards
+@app.route('/voice-time')
+@response_cache.cached(['voicesession'])
+def voice_time():
+    """
+    Render the members and channels with the most time in voice.
+    """
+    days = max(1, min(request.args.get('days', 7, type=int), 366))
+    return render_template('voice_time.html', voice_time=get_voice_time(days, get_guild_arg()))
+
+# Route for one member's voice time
+@app.route('/voice-time/members/<int:member_id>')
+@response_cache.cached(['voicesession'])
+def member_voice_time(member_id):
+    """
+    Render a member's time in voice per day and their latest sessions.
+    """
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    member, per_day, sessions = get_member_voice_time(member_id, days, get_guild_arg())
+    if member is None:
+        abort(404)
+    for voice_session in sessions:
+        voice_session['formatted_started_at'] = format_timestamp(voice_session['started_at'])
+        voice_session['formatted_ended_at'] = format_timestamp(voice_session['ended_at']) if voice_session['ended_at'] else None
+    return render_template('member_voice_time.html', member=member, per_day=per_day, sessions=sessions, days=days)
+
+# Route for the guild selector
+@app.route('/guild', methods=['POST'])
+def select_guild():
+    """
+    Remember the selected guild in a cookie and go back to the page it was selected on.
+    """
+    guild_id = request.form.get('guild_id', type=int)
+    next_url = request.form.get('next') or url_for('index')
+    if not next_url.startswith('/') or next_url.startswith('//'):
+        next_url = url_for('index')
+    response = redirect(next_url)
+    if guild_id is None:
+        response.delete_cookie(GUILD_COOKIE)
+    else:
+        response.set_cookie(GUILD_COOKIE, str(guild_id), max_age=365 * 86400, samesite='Lax')
+    return response
+
+# Route for full-text search
+@app.route('/search')
+@response_cache.cached(['message', 'editedmessage'])
+def search_messages():
+    """
+    Render the search page and, if a query was given, its results.
+    """
+    if not SEARCH_AVAILABLE:
+        abort(400, description=f"Search isn't available on this database ({engine.dialect.name}); it needs SQLite or PostgreSQL")
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'messages')
+    if scope not in SCOPES:
+        abort(400, description="Invalid search scope")
+    page = max(1, request.args.get('page', 1, type=int))
+    page_size = max(1, min(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    
+    results, has_more = [], False
+    if query:
+        results, has_more = get_search_results(
+            query,
+            scope,
+            member_id=request.args.get('member_id', type=int),
+            channel_id=request.args.get('channel_id', type=int),
+            since=get_date_arg('since'),
+            until=get_date_arg('until', end_of_day=True),
+            page=page,
+            page_size=page_size,
+            guild_id=get_guild_arg()
+        )
+        for result in results:
+            result['formatted_timestamp'] = format_timestamp(result['timestamp'])
+    
+    pagination = {
+        'prev': page - 1 if page > 1 else None,
+        'next': page + 1 if has_more else None
+    }
+    return render_template('search.html', query=query, scope=scope, results=results, pagination=pagination, page=page)
+
+# Route for streaming exports
+@app.route('/export/<log_type>')
+def export_log(log_type):
+    """
+    Stream every entry of a log as CSV or JSON Lines, optionally gzipped.
+    Query arguments: format (csv/jsonl), since, until, gzip=1, archives=1, guild_id.
+    """
+    if log_type not in LOG_TYPES:
+        abort(404)
+    file_format = request.args.get('format', 'csv')
+    if file_format not in FORMATS:
+        abort(400, description="Invalid export format")
+    compress = request.args.get('gzip') == '1'
+    
+    engines = [engine]
+    if request.args.get('archives') == '1':
+        engines = [archive_engine(month) for month in reversed(list_archives())] + engines
+    
+    stream = export_stream(
+        engines,
+        log_type,
+        file_format,
+        since=get_date_arg('since'),
+        until=get_date_arg('until', end_of_day=True),
+        compress=compress,
+        guild_id=get_guild_arg()
+    )
+    
+    mimetype, extension = FORMATS[file_format]
+    filename = f"{log_type}.{extension}" + ('.gz' if compress else '')
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if compress:
+        mimetype = 'application/gzip'
+    return Response(stream, mimetype=mimetype, headers=headers)
+
+
+# ==== JSON API ====
+
+# Page helper and record fields of each log the API serves
+API_LOGS = {
+    'deleted-messages': (get_deleted_messages, ['id', 'guild_id', 'message_id', 'content', 'author_name', 'author_id', 'avatar_url', 'channel_id', 'channel_name', 'timestamp', 'original_sent_at']),
+    'edited-messages': (get_edited_messages, ['id', 'guild_id', 'message_id', 'content_before', 'content_after', 'author_name', 'author_id', 'avatar_url', 'channel_id', 'channel_name', 'timestamp', 'original_sent_at']),
+    'voice-activity': (get_voice_activity, ['id', 'guild_id', 'action', 'member_name', 'member_id', 'avatar_url', 'from_channel_id', 'from_channel_name', 'to_channel_id', 'to_channel_name', 'timestamp', 'details']),
+    'member-activity': (get_member_activity, ['id', 'guild_id', 'type', 'action', 'member_name', 'member_id', 'avatar_url', 'role_name', 'role_id', 'timestamp']),
+}
+
+# API errors are JSON too, so clients never have to parse an HTML error page
+@app.errorhandler(HTTPException)
+def handle_http_exception(e):
+    if request.path.startswith('/api/'):
+        return jsonify(error=e.name, description=e.description), e.code
+    return e
+
+def select_fields(records, available):
+    """
+    Keep only the fields listed in the `fields` query argument (all if it's missing).
+    
+    Args:
+        records (list): Records returned by a page helper
+        available (list): Fields the records can have
+    
+    Returns:
+        list: The records with only the requested fields
+    """
+    fields = [field for field in request.args.get('fields', '').split(',') if field]
+    if not fields:
+        return records
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}")
+    return [{field: record.get(field) for field in fields} for record in records]
+
+# Route for one page of a log, as JSON
+@app.route('/api/v1/<log_type>')
+@response_cache.cached(lambda log_type: LOG_TABLES_READ.get(log_type))
+def api_log(log_type):
+    """
+    Return one page of a log as JSON, newest first.
+    Query arguments: before/after cursors, page_size, fields, archives=1 and
+    the filters guild_id, member_id, channel_id, action, since and until.
+    """
+    if log_type not in API_LOGS:
+        abort(404)
+    get_page, fields = API_LOGS[log_type]
+    records, pagination = get_page(
+        *get_page_args(),
+        include_archives=request.args.get('archives') == '1',
+        filters=get_filter_args()
+    )
+    return jsonify(data=select_fields(records, fields), pagination=pagination)
+
+# Route for health checks (used by run.py's supervisor)
+@app.route('/healthz')
+def healthz():
+    """
+    Return 200 if the database can be queried, 503 otherwise.
+    """
+    try:
+        with Session(engine) as session:
+            session.exec(select(1)).one()
+    except Exception as e:
+        return jsonify(status='unavailable', error=str(e)), 503
+    return jsonify(status='ok')
+
+# Route for Prometheus metrics
+@app.route('/metrics')
+def metrics():
+    """
+    Return request latency, rows returned and response cache metrics in Prometheus' text format.
+    """
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
+# Route for the summary statistics, as JSON
+@app.route('/api/v1/stats')
+@response_cache.cached(list(TRACKED_TABLES))
+def api_stats():
+    """
+    Return the summary statistics shown on the homepage.
+    """
+    days = max(1, min(request.args.get('days', 14, type=int), 366))
+    return jsonify(get_summary_stats(days, get_guild_arg()))
+
+# Route for the activity charts, as JSON
+@app.route('/api/v1/stats/activity')
+@response_cache.cached(list(TRACKED_TABLES) + ['voicesession'])
+def api_activity_stats():
+    """
+    Return the series behind the activity charts (?days=, default 7; hourly up to 7 days, daily beyond).
+    """
+    days = max(1, min(request.args.get('days', 7, type=int), 366))
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_PAGE_SIZE))
+    return jsonify(get_activity_charts(days, get_guild_arg(), limit))
+
+# Route for the voice time leaderboards, as JSON
+@app.route('/api/v1/voice-time')
+@response_cache.cached(['voicesession'])
+def api_voice_time():
+    """
+    Return the voice time leaderboards and per-day totals (?days=, default 7).
+    """
+    days = max(1, min(request.args.get('days', 7, type=int), 366))
+    limit = max(1, min(request.args.get('limit', 25, type=int), MAX_PAGE_SIZE))
+    return jsonify(get_voice_time(days, get_guild_arg(), limit))
+
+# Route for one member's voice time, as JSON
+@app.route('/api/v1/voice-time/members/<int:member_id>')
+@response_cache.cached(['voicesession'])
+def api_member_voice_time(member_id):
+    """
+    Return a member's voice time per day (?days=, default 30) and latest sessions.
+    """
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    member, per_day, sessions = get_member_voice_time(member_id, days, get_guild_arg())
+    if member is None:
+        abort(404)
+    return jsonify(member=member, per_day=per_day, sessions=sessions)
+
+def get_live_tables():
+    """
+    Tables of the log types in the `types` query argument (all if it's missing).
+    """
+    types = set(filter(None, request.args.get('types', '').split(','))) or set(API_LOGS)
+    if not types <= set(API_LOGS):
+        abort(400, description="Invalid log type")
+    return {table for table, source in LIVE_SOURCES.items() if source[0] in types}
+
+def encode_event_id(marks):
+    return ','.join(f"{table}={row_id}" for table, row_id in sorted(marks.items()))
+
+def decode_event_id(event_id):
+    """
+    Parse an SSE event ID made by encode_event_id(); returns None if it's malformed.
+    """
+    try:
+        marks = dict(item.split('=') for item in event_id.split(','))
+        return {table: int(row_id) for table, row_id in marks.items() if table in LIVE_SOURCES}
+    except ValueError:
+        return None
+
+# Route for the live stream of new log entries
+@app.route('/api/v1/stream')
+def api_stream():
+    """
+    Stream new log entries as Server-Sent Events.
+    Each event is named after its log type and carries one record as JSON.
+    Query arguments: types (comma-separated log types, default all), guild_id.
+    A client reconnecting with Last-Event-ID gets the entries it missed.
+    When every stream slot is taken, returns 503: poll /api/v1/stream/poll instead.
+    """
+    tables = get_live_tables()
+    if stream_slots is None or not stream_slots.acquire(blocking=False):
+        response = jsonify(error='Service Unavailable', description='Too many live streams are open, poll /api/v1/stream/poll instead')
+        response.status_code = 503
+        response.headers['Retry-After'] = '60'
+        return response
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    guild_id = get_guild_arg()
+    
+    def events():
+        subscriber, marks = live_feed.subscribe()
+        try:
+            sent = dict(marks)
+            # Catch up on what a reconnecting client missed before the live entries
+            resumed = decode_event_id(last_event_id) if last_event_id else None
+            if resumed:
+                sent.update({table: min(row_id, marks[table]) for table, row_id in resumed.items() if table in tables})
+                for table in tables:
+                    if sent[table] >= marks[table]:
+                        continue
+                    missed = get_new_entries(table, sent[table], live_feed.max_backlog + 1)
+                    missed = [(row_id, record) for row_id, record in missed if row_id <= marks[table]]
+                    if len(missed) > live_feed.max_backlog:
+                        yield "event: reset\ndata: {}\n\n"
+                        return
+                    for row_id, record in missed:
+                        sent[table] = row_id
+                        if guild_id is not None and record['guild_id'] != guild_id:
+                            continue
+                        yield f"event: {LIVE_SOURCES[table][0]}\nid: {encode_event_id(sent)}\ndata: {json.dumps(record)}\n\n"
+                    sent[table] = marks[table]
+            
+            yield f"retry: 3000\nid: {encode_event_id(sent)}\n\n"
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return  # The browser reconnects from the last event ID
+                try:
+                    entry = subscriber.get(timeout=min(15, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if entry is None:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                table, row_id, record = entry
+                if table not in tables or row_id <= sent[table]:
+                    continue
+                sent[table] = row_id
+                if guild_id is not None and record['guild_id'] != guild_id:
+                    continue
+                yield f"event: {LIVE_SOURCES[table][0]}\nid: {encode_event_id(sent)}\ndata: {json.dumps(record)}\n\n"
+        finally:
+            live_feed.unsubscribe(subscriber)
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    response = Response(events(), mimetype='text/event-stream', headers=headers)
+    # The server closes the response even if the client left before it was read
+    response.call_on_close(stream_slots.release)
+    return response
+
+# Route for counting new log entries, for pages that couldn't open a stream
+@app.route('/api/v1/stream/poll')
+def api_stream_poll():
+    """
+    Count the log entries added since `last_event_id` (taken from an earlier poll).
+    Query arguments: types (comma-separated log types, default all), last_event_id, guild_id.
+    Returns the count (at most the live feed's backlog; `more` if there are more)
+    and the current last_event_id.
+    """
+    tables = get_live_tables()
+    guild_id = get_guild_arg()
+    marks = {table: row_id for table, row_id in get_high_water_marks().items() if table in tables}
+    since = decode_event_id(request.args.get('last_event_id') or '') or {}
+    
+    count = 0
+    with Session(engine) as session:
+        for table in tables:
+            if table not in since or since[table] >= marks[table]:
+                continue
+            id_col = LIVE_SOURCES[table][1]
+            # Counted on the primary key, stopping at max_backlog + 1 rows
+            ids = select(id_col).where(id_col > since[table], id_col <= marks[table])
+            if guild_id is not None:
+                ids = ids.where(id_col.class_.guild_id == guild_id)
+            count += session.exec(select(func.count()).select_from(ids.limit(live_feed.max_backlog + 1).subquery())).one()
+    return jsonify(
+        count=min(count, live_feed.max_backlog),
+        more=count > live_feed.max_backlog,
+        last_event_id=encode_event_id(marks)
+    )
 
 
 if __name__ == '__main__':
-    load_dotenv()
-    app.run(debug=True, port=os.getenv("DASHBOARD_PORT"))
+    serve(app)
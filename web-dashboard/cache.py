@@ -0,0 +1,226 @@
+"""
+Response cache for the dashboard's read-only routes.
+
+A cached response is keyed on the route, its query string and the current
+version of every table it reads. A table's version is the change counter
+every transaction that writes to it bumps (see database/versions.py), read
+for all the tables of a page in one small primary key lookup. New rows,
+rows moved out by retention and in-place updates (an edited message, a
+renamed member, a changed role) all change it, so stale entries are never
+served. They just stop being looked up and age out of the LRU or TTL.
+
+The same version gives every response an ETag, and the time of the last
+change gives its Last-Modified. A browser revalidating an unchanged page gets a
+304 without the page being queried or rendered.
+
+Entries are kept in memory by default. Set DASHBOARD_CACHE_URL to a
+redis:// URL to share them between dashboard processes (needs the `redis`
+package).
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import g, has_request_context, make_response, request
+
+from database.versions import read_versions
+
+CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL") or 60)
+CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE") or 256)
+CACHE_URL = os.getenv("DASHBOARD_CACHE_URL") or None
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache holding at most `max_entries` entries for
+    at most `ttl` seconds each.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """
+    Cache stored in a Redis-compatible server, shared by every dashboard process.
+    """
+
+    def __init__(self, url, ttl=CACHE_TTL, prefix="dashboard:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            print(f"Cache read failed: {e}")
+            return None
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            print(f"Cache write failed: {e}")
+
+
+def create_cache():
+    """
+    Create the cache backend configured in .env, or None if caching is off.
+    """
+    if CACHE_TTL <= 0:
+        return None
+    if CACHE_URL:
+        try:
+            return RedisCache(CACHE_URL)
+        except ImportError:
+            print("DASHBOARD_CACHE_URL is set but the redis package isn't installed, caching in memory")
+    return LRUCache()
+
+
+class ResponseCache:
+    """
+    Caches rendered responses and answers conditional requests, versioned by
+    the tables each route reads.
+
+    Args:
+        engine: Engine of the live database
+        backend: LRUCache, RedisCache or None (ETags only, nothing stored)
+        shared_tables (list): Tables every page reads besides its own (e.g.
+            the member and channel names shown next to each entry)
+        vary: Callable returning a string that also tells responses apart
+            (e.g. the guild selected by a cookie)
+    """
+
+    def __init__(self, engine, backend, shared_tables=(), vary=None):
+        self.engine = engine
+        self.backend = backend
+        self.shared_tables = list(shared_tables)
+        self.vary = vary
+        # Responses rendered by older code or templates must not match this code's ETags
+        self.salt = _code_version()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def versions(self, tables):
+        """
+        Current version of `tables` (and the shared tables) and the time of
+        their last change, in one query.
+
+        Returns:
+            tuple: (version string, last change or None)
+        """
+        table_names = sorted(set(tables) | set(self.shared_tables))
+        with self.engine.connect() as connection:
+            versions = {name: (0, None) for name in table_names}
+            versions.update(read_versions(connection, table_names))
+        if has_request_context():
+            g.table_versions = versions
+
+        timestamps = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+        last_modified = max(timestamps) if timestamps else None
+        if isinstance(last_modified, str):
+            last_modified = datetime.fromisoformat(last_modified)
+        return ",".join(f"{name}:{versions[name][0]}" for name in table_names), last_modified
+
+    def table_version(self, table_name):
+        """
+        Current version of one table, reusing the versions the current
+        request has already read if they include it.
+        """
+        versions = g.get("table_versions", {}) if has_request_context() else {}
+        if table_name not in versions:
+            with self.engine.connect() as connection:
+                versions = read_versions(connection, [table_name])
+        return versions.get(table_name, (0, None))[0]
+
+    def cached(self, tables):
+        """
+        Decorator for a view reading `tables` (a list, or a function taking the
+        view's arguments and returning one).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                view_tables = tables(*args, **kwargs) if callable(tables) else tables
+                if view_tables is None:
+                    return view(*args, **kwargs)
+
+                version, last_modified = self.versions(view_tables)
+                query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+                vary = self.vary() if self.vary is not None else ""
+                key = hashlib.sha1(f"{self.salt}|{request.path}?{query}|{vary}|{version}".encode()).hexdigest()
+
+                if key in request.if_none_match:
+                    self.not_modified += 1
+                    response = make_response("", 304)
+                    response.set_etag(key)
+                    return response
+
+                cached = self.backend.get(key) if self.backend is not None else None
+                if cached is not None:
+                    self.hits += 1
+                    body, status, mimetype = cached
+                    response = make_response(body, status)
+                    response.mimetype = mimetype
+                else:
+                    self.misses += 1
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code == 200 and self.backend is not None and not response.is_streamed:
+                        self.backend.set(key, (response.get_data(), response.status_code, response.mimetype))
+
+                if response.status_code == 200:
+                    response.set_etag(key)
+                    if self.vary is not None:
+                        response.vary.add("Cookie")
+                    if last_modified is not None:
+                        response.last_modified = last_modified.replace(microsecond=0)
+                    # Browsers may keep the page but must check the ETag before reusing it
+                    response.cache_control.no_cache = True
+                    response.make_conditional(request)
+                return response
+            return wrapper
+        return decorator
+
+
+def _code_version():
+    # Same in every worker running the same checkout, different after a deploy
+    root = os.path.dirname(os.path.abspath(__file__))
+    mtimes = [
+        os.stat(os.path.join(directory, name)).st_mtime_ns
+        for directory, _, names in os.walk(root)
+        for name in names
+        if name.endswith((".py", ".html"))
+    ]
+    return str(max(mtimes, default=0))
@@ -0,0 +1,204 @@
+"""
+Streaming CSV/JSONL export of the log tables.
+
+Rows are read with a server-side cursor (`yield_per`) and written out in
+chunks as the response is sent, so an export holds only one chunk of rows
+in memory however large the table is. Exports are ordered oldest first by
+(timestamp, id); with archives included, the monthly archive databases are
+read oldest month first and the live database last.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from sqlmodel import Session
+
+from database.schema import *
+
+# Rows fetched from the database (and written to the response) at a time
+EXPORT_CHUNK_SIZE = 2000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+}
+
+
+def _deleted_messages():
+    statement = (
+        select(
+            DeletedMessage.id, DeletedMessage.guild_id, DeletedMessage.message_id, DeletedMessage.deleted_at,
+            Message.created_at.label("original_sent_at"),
+            Message.member_id, Member.name.label("member_name"), Member.global_name,
+            Message.channel_id, Channel.name.label("channel_name"),
+            Message.content,
+        )
+        .join(Message, DeletedMessage.message_id == Message.id)
+        .join(Member, Message.member_id == Member.id, isouter=True)
+        .join(Channel, Message.channel_id == Channel.id, isouter=True)
+    )
+    return statement, DeletedMessage.deleted_at, DeletedMessage.id
+
+
+def _edited_messages():
+    statement = (
+        select(
+            EditedMessage.id, EditedMessage.guild_id, EditedMessage.message_id, EditedMessage.edited_at,
+            Message.created_at.label("original_sent_at"),
+            Message.member_id, Member.name.label("member_name"), Member.global_name,
+            Message.channel_id, Channel.name.label("channel_name"),
+            EditedMessage.content_before, EditedMessage.content_after,
+        )
+        .join(Message, EditedMessage.message_id == Message.id)
+        .join(Member, Message.member_id == Member.id, isouter=True)
+        .join(Channel, Message.channel_id == Channel.id, isouter=True)
+    )
+    return statement, EditedMessage.edited_at, EditedMessage.id
+
+
+def _voice_activity():
+    from_channel = aliased(Channel)
+    to_channel = aliased(Channel)
+    statement = (
+        select(
+            VoiceActivity.id, VoiceActivity.guild_id, VoiceActivity.timestamp, VoiceActivity.action,
+            VoiceActivity.member_id, Member.name.label("member_name"), Member.global_name,
+            VoiceActivity.from_channel_id, from_channel.name.label("from_channel_name"),
+            VoiceActivity.to_channel_id, to_channel.name.label("to_channel_name"),
+            VoiceActivity.details,
+        )
+        .join(Member, VoiceActivity.member_id == Member.id, isouter=True)
+        .join(from_channel, VoiceActivity.from_channel_id == from_channel.id, isouter=True)
+        .join(to_channel, VoiceActivity.to_channel_id == to_channel.id, isouter=True)
+    )
+    return statement, VoiceActivity.timestamp, VoiceActivity.id
+
+
+def _guild_activity():
+    statement = (
+        select(
+            GuildActivity.id, GuildActivity.guild_id, GuildActivity.timestamp, GuildActivity.action,
+            GuildActivity.member_id, Member.name.label("member_name"), Member.global_name,
+        )
+        .join(Member, GuildActivity.member_id == Member.id, isouter=True)
+    )
+    return statement, GuildActivity.timestamp, GuildActivity.id
+
+
+def _role_changes():
+    statement = (
+        select(
+            MemberActivity.id, MemberActivity.guild_id, MemberActivity.timestamp, MemberActivity.action,
+            MemberActivity.member_id, Member.name.label("member_name"), Member.global_name,
+            MemberActivity.role_id, Role.name.label("role_name"),
+        )
+        .join(Member, MemberActivity.member_id == Member.id, isouter=True)
+        .join(Role, MemberActivity.role_id == Role.id, isouter=True)
+    )
+    return statement, MemberActivity.timestamp, MemberActivity.id
+
+
+# Export name -> function building (statement, timestamp column, id column)
+LOG_TYPES = {
+    "deleted-messages": _deleted_messages,
+    "edited-messages": _edited_messages,
+    "voice-activity": _voice_activity,
+    "guild-activity": _guild_activity,
+    "role-changes": _role_changes,
+}
+
+
+def build_query(log_type, since=None, until=None, guild_id=None):
+    """
+    Build the export query for `log_type`, oldest rows first.
+
+    Args:
+        log_type (str): One of LOG_TYPES
+        since (datetime): Only rows at or after this time
+        until (datetime): Only rows before this time
+        guild_id (int): Only rows of this guild
+
+    Returns:
+        Select: The query, with one labelled column per exported field
+    """
+    statement, timestamp_col, id_col = LOG_TYPES[log_type]()
+    if guild_id is not None:
+        statement = statement.where(statement.selected_columns.guild_id == guild_id)
+    if since is not None:
+        statement = statement.where(timestamp_col >= since)
+    if until is not None:
+        statement = statement.where(timestamp_col < until)
+    return statement.order_by(timestamp_col, id_col)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def iter_rows(engines, statement, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield lists of up to `chunk_size` row dicts, reading each engine in turn.
+    """
+    for engine in engines:
+        with Session(engine) as session:
+            result = session.execute(statement.execution_options(yield_per=chunk_size))
+            for partition in result.mappings().partitions():
+                yield [{key: _plain(value) for key, value in row.items()} for row in partition]
+
+
+def iter_csv(chunks, fieldnames):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def gzip_stream(pieces):
+    """
+    Gzip a stream of text pieces incrementally.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip header and trailer
+    for piece in pieces:
+        data = compressor.compress(piece.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(engines, log_type, file_format="csv", since=None, until=None, compress=False, guild_id=None):
+    """
+    Stream an export of `log_type` from `engines`, in order.
+
+    Args:
+        engines (list): Engines to read, oldest data first
+        log_type (str): One of LOG_TYPES
+        file_format (str): "csv" or "jsonl"
+        since (datetime): Only rows at or after this time
+        until (datetime): Only rows before this time
+        compress (bool): Gzip the output
+        guild_id (int): Only rows of this guild
+
+    Returns:
+        generator: Pieces of the file (str, or bytes when compressed)
+    """
+    statement = build_query(log_type, since, until, guild_id)
+    chunks = iter_rows(engines, statement)
+    if file_format == "csv":
+        pieces = iter_csv(chunks, list(statement.selected_columns.keys()))
+    else:
+        pieces = iter_jsonl(chunks)
+    return gzip_stream(pieces) if compress else pieces
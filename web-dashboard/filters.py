@@ -0,0 +1,86 @@
+"""
+Server-side filters shared by the dashboard's log pages and the JSON API.
+
+Filters are read from the query string (member_id, channel_id, action, since,
+until) and applied to the page queries as WHERE clauses, so they use the
+same (member_id, timestamp) and timestamp indexes as unfiltered paging.
+
+The guild comes from the `guild_id` query argument or, on the pages, from the
+guild selector's cookie. With a guild selected, pages are read through the
+(guild_id, timestamp) indexes; without one, every guild is shown.
+"""
+from flask import request
+from sqlalchemy import false, or_
+
+from pagination import get_date_arg
+
+FILTER_NAMES = ("guild_id", "member_id", "channel_id", "action", "since", "until")
+GUILD_COOKIE = "guild_id"
+
+
+def get_guild_arg():
+    """
+    The guild selected for the current request, or None for every guild.
+    """
+    guild_id = request.args.get("guild_id", type=int)
+    if guild_id is None:
+        guild_id = request.cookies.get(GUILD_COOKIE, type=int)
+    return guild_id
+
+
+def get_filter_args():
+    """
+    Read the filters given in the query string of the current request.
+
+    Returns:
+        dict: Filter name -> value, only for filters that were given
+    """
+    filters = {
+        "guild_id": get_guild_arg(),
+        "member_id": request.args.get("member_id", type=int),
+        "channel_id": request.args.get("channel_id", type=int),
+        "action": request.args.get("action") or None,
+        "since": get_date_arg("since"),
+        "until": get_date_arg("until", end_of_day=True),
+    }
+    return {name: value for name, value in filters.items() if value is not None}
+
+
+def apply_filters(statement, filters, timestamp, guild=None, member=None, channel=None, action=None):
+    """
+    Add the WHERE clauses for `filters` to `statement`.
+
+    Args:
+        statement (Select): Query to filter
+        filters (dict): Filters from get_filter_args()
+        timestamp (Column): Column `since`/`until` apply to
+        guild (Column): Column `guild_id` applies to
+        member (Column): Column `member_id` applies to
+        channel (Column or list): Column(s) `channel_id` applies to; any may match
+        action (Column): Column `action` applies to
+
+    Returns:
+        Select: The filtered query. A filter on a field the query doesn't have
+        matches nothing, since none of its rows can satisfy it.
+    """
+    if not filters:
+        return statement
+
+    if "since" in filters:
+        statement = statement.where(timestamp >= filters["since"])
+    if "until" in filters:
+        statement = statement.where(timestamp < filters["until"])
+
+    channels = channel if isinstance(channel, (list, tuple)) else [channel] if channel is not None else []
+    for name, columns in (
+        ("guild_id", [guild] if guild is not None else []),
+        ("member_id", [member] if member is not None else []),
+        ("channel_id", channels),
+        ("action", [action] if action is not None else []),
+    ):
+        if name not in filters:
+            continue
+        if not columns:
+            return statement.where(false())
+        statement = statement.where(or_(*(column == filters[name] for column in columns)))
+    return statement
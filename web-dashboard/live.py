@@ -0,0 +1,101 @@
+"""
+Live feed of new log entries for the dashboard's Server-Sent Events stream.
+
+One background thread per dashboard process tails the log tables by ID:
+it remembers the highest ID it has seen in each table (its high-water
+mark) and reads only rows above it. It wakes up as soon as the bot reports
+a commit (see database/notify.py) and otherwise polls every
+`poll_interval` seconds, so the cost does not grow with the number of
+connected clients. New entries are pushed to every subscriber's queue.
+"""
+import queue
+import threading
+
+from database.notify import ChangeListener
+
+
+class LiveFeed:
+    """
+    Broadcasts new rows of the tracked tables to subscribers.
+
+    Args:
+        fetch_new: Callable (table_name, after_id, limit) -> list of (id, record)
+        get_marks: Callable () -> dict of table name -> highest ID stored
+        poll_interval (float): Seconds between polls when no notification arrives
+        max_backlog (int): Entries a subscriber may fall behind before it's dropped
+    """
+
+    def __init__(self, fetch_new, get_marks, poll_interval=5.0, max_backlog=1000, batch_size=500):
+        self.fetch_new = fetch_new
+        self.get_marks = get_marks
+        self.poll_interval = poll_interval
+        self.max_backlog = max_backlog
+        self.batch_size = batch_size
+
+        self.marks = {}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+
+    def subscribe(self):
+        """
+        Register a new subscriber.
+
+        Returns:
+            tuple: The subscriber's queue and the high-water marks it starts from
+        """
+        subscriber = queue.Queue()
+        with self._lock:
+            if not self._subscribers:
+                # Nothing was read while nobody listened: start from what is stored now,
+                # not from the rows written since the last subscriber left
+                self.marks = self.get_marks()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+            self._subscribers.add(subscriber)
+            self._active.set()
+            return subscriber, dict(self.marks)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._active.clear()
+
+    def _run(self):
+        listener = ChangeListener()
+        while True:
+            # Don't poll while nobody is listening
+            self._active.wait()
+            changed = listener.wait(self.poll_interval)
+            tables = [table for table in self.marks if table in changed] if changed else list(self.marks)
+            for table in tables:
+                try:
+                    self._poll(table)
+                except Exception as e:
+                    print(f"Live feed failed to read {table}: {e}")
+
+    def _poll(self, table):
+        while True:
+            entries = self.fetch_new(table, self.marks[table], self.batch_size)
+            if not entries:
+                return
+            with self._lock:
+                # The marks may have moved on (see subscribe()) while this was read
+                entries = [(row_id, record) for row_id, record in entries if row_id > self.marks[table]]
+                if entries:
+                    self.marks[table] = entries[-1][0]
+                for subscriber in list(self._subscribers):
+                    if subscriber.qsize() >= self.max_backlog:
+                        # Too slow to keep up: None tells it to start over
+                        subscriber.put(None)
+                        self._subscribers.discard(subscriber)
+                        continue
+                    for row_id, record in entries:
+                        subscriber.put((table, row_id, record))
+                if not self._subscribers:
+                    self._active.clear()
+            if len(entries) < self.batch_size:
+                return
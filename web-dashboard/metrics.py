@@ -0,0 +1,75 @@
+"""
+Request metrics and sampled profiling for the dashboard.
+
+init_app() times every request per route (the URL rule, e.g.
+/roles/<int:role_id>, so IDs never become labels), method and status, and
+records how many rows a request read for its list, search or API results
+(see count_rows(); responses served from the cache read none and aren't
+counted). The app serves them on /metrics.
+
+Metrics live in each process: under gunicorn every worker counts the
+requests it served, and a scrape reaches whichever worker accepts it.
+
+    PROFILE_SAMPLE_RATE  fraction of requests run under cProfile (default 0)
+    PROFILE_DIR          where profiles are written, as dashboard-<route>.<pid>.prof (default "profiles")
+"""
+import atexit
+import os
+import time
+
+from flask import g, has_request_context, request
+
+from database.metrics import Histogram, Registry, SampledProfiler
+
+registry = Registry()
+request_seconds = registry.register(
+    Histogram("discord_dashboard_request_seconds", "Time to handle a request, per route, method and status", ["route", "method", "status"])
+)
+rows_returned = registry.register(
+    Histogram("discord_dashboard_rows_returned", "Rows read for a request's results, per route", ["route"], buckets=(0, 1, 10, 25, 50, 100, 250, 500, 1000, 5000))
+)
+profiler = SampledProfiler(float(os.getenv("PROFILE_SAMPLE_RATE") or 0), os.getenv("PROFILE_DIR") or "profiles")
+
+
+def count_rows(count):
+    """
+    Add `count` rows to those read by the current request (no-op outside a request).
+    """
+    if has_request_context():
+        g.rows_returned = g.get("rows_returned", 0) + count
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def init_app(app):
+    """
+    Time and count the requests of `app`, and profile a sample of them.
+    """
+    if profiler.enabled:
+        print(f"Profiling {profiler.sample_rate:.1%} of requests into {profiler.directory}/")
+        atexit.register(profiler.dump)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if profiler.should_sample():
+            profiler.samples += 1
+            g.profile = profiler.start(f"dashboard-{_route()}")
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("request_started")
+        if started is not None:
+            route = _route()
+            request_seconds.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+            if "rows_returned" in g:
+                rows_returned.observe(g.rows_returned, route=route)
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception=None):
+        if g.get("profile") is not None:
+            profiler.stop(g.pop("profile"))
+            profiler.maybe_dump()
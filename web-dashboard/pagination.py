@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination for the dashboard's log pages.
+
+Every page is ordered newest first by (timestamp, source, id), where `source`
+tells apart rows coming from different tables on the same page (e.g. guild
+and member activity). A cursor encodes that key for the first or last row of
+a page, so fetching any page costs one index range scan of `page_size` rows
+no matter how deep into the log it is.
+"""
+import os
+from datetime import datetime, timedelta
+
+from flask import abort, request
+from sqlalchemy import tuple_
+
+from metrics import count_rows
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE") or 50)
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(timestamp, source, row_id):
+    return f"{timestamp.isoformat()}_{source}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Parse a cursor made by encode_cursor(). Raises ValueError if it's malformed.
+    """
+    timestamp, source, row_id = cursor.rsplit("_", 2)
+    return datetime.fromisoformat(timestamp), int(source), int(row_id)
+
+
+def get_page_args():
+    """
+    Read `before`, `after` and `page_size` from the query string of the current request.
+    """
+    before = request.args.get("before")
+    after = request.args.get("after")
+    page_size = request.args.get("page_size", DEFAULT_PAGE_SIZE, type=int)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    try:
+        before = decode_cursor(before) if before else None
+        after = decode_cursor(after) if after else None
+    except ValueError:
+        abort(400, description="Invalid pagination cursor")
+    return before, after, page_size
+
+
+def get_date_arg(name, end_of_day=False):
+    """
+    Read a YYYY-MM-DD (or full ISO timestamp) query argument as a datetime.
+    With `end_of_day`, a bare date means the end of that day, so ranges are inclusive.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"Invalid date for {name}")
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def _keyset_condition(timestamp_col, id_col, source, cursor, older):
+    timestamp, cursor_source, cursor_id = cursor
+    if source == cursor_source:
+        if older:
+            return tuple_(timestamp_col, id_col) < tuple_(timestamp, cursor_id)
+        return tuple_(timestamp_col, id_col) > tuple_(timestamp, cursor_id)
+    # Rows from another source only tie with the cursor on the timestamp
+    if older:
+        return timestamp_col <= timestamp if source < cursor_source else timestamp_col < timestamp
+    return timestamp_col >= timestamp if source > cursor_source else timestamp_col > timestamp
+
+
+def fetch_page(sessions, sources, before=None, after=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page, newest first, from one or more sources in one or more
+    databases (the live database and, optionally, its archives).
+
+    Args:
+        sessions (list): Open database sessions to read from
+        sources (list): (statement, timestamp column, id column) tuples; the first
+            selected entity of each statement must own both columns
+        before (tuple): Decoded cursor; return rows older than it
+        after (tuple): Decoded cursor; return rows newer than it
+        page_size (int): Maximum number of rows to return
+
+    Returns:
+        tuple: (list of (source index, row) pairs, dict with 'next' and 'prev' cursors)
+    """
+    older = after is None
+    cursor = before if older else after
+
+    keyed_rows = {}
+    for source, (statement, timestamp_col, id_col) in enumerate(sources):
+        if cursor is not None:
+            statement = statement.where(_keyset_condition(timestamp_col, id_col, source, cursor, older))
+
+        if older:
+            statement = statement.order_by(timestamp_col.desc(), id_col.desc())
+        else:
+            statement = statement.order_by(timestamp_col.asc(), id_col.asc())
+
+        for session in sessions:
+            for row in session.exec(statement.limit(page_size + 1)).all():
+                entity = row[0]
+                key = (getattr(entity, timestamp_col.key), source, getattr(entity, id_col.key))
+                # A row caught mid-archive can exist in two databases; keep the first copy
+                keyed_rows.setdefault(key, row)
+    keyed_rows = list(keyed_rows.items())
+    count_rows(len(keyed_rows))
+
+    keyed_rows.sort(key=lambda item: item[0], reverse=older)
+    has_more = len(keyed_rows) > page_size
+    keyed_rows = keyed_rows[:page_size]
+    if not older:
+        keyed_rows.reverse()
+
+    pagination = {"next": None, "prev": None}
+    if keyed_rows:
+        first_key, last_key = keyed_rows[0][0], keyed_rows[-1][0]
+        # Older rows exist if we were paging forward and got a full page, or came from an older page
+        if (older and has_more) or not older:
+            pagination["next"] = encode_cursor(*last_key)
+        # Newer rows exist if we came from a newer page, or paged backward and got a full page
+        if (older and cursor is not None) or (not older and has_more):
+            pagination["prev"] = encode_cursor(*first_key)
+
+    return [(key[1], row) for key, row in keyed_rows], pagination
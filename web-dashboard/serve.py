@@ -0,0 +1,111 @@
+"""
+Serving the dashboard.
+
+DASHBOARD_SERVER picks the server:
+
+    waitress  One process with DASHBOARD_THREADS threads (the default, also works on Windows)
+    gunicorn  DASHBOARD_WORKERS forked worker processes with DASHBOARD_THREADS threads each
+    dev       Werkzeug's development server, for working on the dashboard
+
+The interactive debugger runs arbitrary code for whoever reaches the page, so
+the development server only enables it with DASHBOARD_DEBUG=true. A server
+that isn't installed or isn't known stops the dashboard with an error rather
+than falling back to another one.
+
+Workers are forked before they touch the database. Every engine drops its
+inherited pool in the child (see database/db.py), so each worker opens its
+own connections. Caches and the live feed are per worker.
+
+Every open live stream (/api/v1/stream) holds one thread for as long as it
+lasts, so a process only accepts DASHBOARD_MAX_STREAMS of them (default: half
+of DASHBOARD_THREADS) and pages beyond that poll instead (see app.py).
+
+Any other WSGI server can load the app directly, e.g.:
+
+    gunicorn --chdir web-dashboard --workers 4 --threads 4 app:app
+"""
+import importlib.util
+import os
+import sys
+
+SERVERS = ("waitress", "gunicorn", "dev")
+
+DASHBOARD_SERVER = os.getenv("DASHBOARD_SERVER") or "waitress"
+DASHBOARD_DEBUG = (os.getenv("DASHBOARD_DEBUG") or "false").lower() == "true"
+DASHBOARD_HOST = os.getenv("DASHBOARD_HOST") or "127.0.0.1"
+DASHBOARD_WORKERS = int(os.getenv("DASHBOARD_WORKERS") or 2)
+DASHBOARD_THREADS = int(os.getenv("DASHBOARD_THREADS") or 4)
+
+
+def serve_gunicorn(app, host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            # Live streams hold a connection open; keepalives are sent every 15s
+            self.cfg.set("timeout", 60)
+            self.cfg.set("accesslog", "-")
+
+        def load(self):
+            return app
+
+    DashboardApplication().run()
+
+
+def serve_waitress(app, host, port, threads):
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+def server_problem(server):
+    """
+    Why `server` can't serve the dashboard here, or None if it can.
+
+    Args:
+        server (str): "waitress", "gunicorn" or "dev"
+
+    Returns:
+        str: The reason, or None
+    """
+    if server not in SERVERS:
+        return f"Unknown DASHBOARD_SERVER {server!r}, expected one of {', '.join(SERVERS)}"
+    if server == "gunicorn" and sys.platform == "win32":
+        return "gunicorn doesn't run on Windows, use DASHBOARD_SERVER=waitress"
+    if server != "dev" and importlib.util.find_spec(server) is None:
+        return f"{server} is not installed (pip install {server})"
+    return None
+
+
+def serve(app, server=DASHBOARD_SERVER, host=DASHBOARD_HOST, port=None, workers=DASHBOARD_WORKERS, threads=DASHBOARD_THREADS):
+    """
+    Run `app` under the chosen server until it's stopped.
+
+    Args:
+        app (Flask): The dashboard app
+        server (str): "waitress", "gunicorn" or "dev"
+        host (str): Address to listen on
+        port (int): Port to listen on (DASHBOARD_PORT, or 5000)
+        workers (int): Worker processes (gunicorn only)
+        threads (int): Threads per worker process
+    """
+    port = int(port or os.getenv("DASHBOARD_PORT") or 5000)
+
+    problem = server_problem(server)
+    if problem is not None:
+        print(f"Can't start the dashboard: {problem}")
+        sys.exit(1)
+
+    if server == "gunicorn":
+        print(f"Serving the dashboard with gunicorn: {workers} workers x {threads} threads")
+        serve_gunicorn(app, host, port, workers, threads)
+    elif server == "waitress":
+        print(f"Serving the dashboard with waitress: {threads} threads")
+        serve_waitress(app, host, port, threads)
+    else:
+        print(f"Serving the dashboard with the development server{' and the debugger' if DASHBOARD_DEBUG else ''}")
+        app.run(host=host, port=port, debug=DASHBOARD_DEBUG)